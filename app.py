@@ -1,23 +1,42 @@
-from flask import Flask, request, render_template, send_file, send_from_directory, Response, abort, jsonify
+from flask import (Flask, request, render_template, send_file, send_from_directory, Response, abort, jsonify, url_for,
+                   stream_with_context)
 import os
 from werkzeug.utils import secure_filename
-import subprocess
-import mimetypes
+from werkzeug.security import safe_join
 import cv2
-from ultralytics import YOLO
-import re
+from PIL import Image
 import logging
 import time
+import atexit
+import threading
+import queue
+import json
+import functools
+import hashlib
+from concurrent.futures import CancelledError
 from datetime import datetime
 
 # Database imports
-from database import create_database_config, init_database, get_database_stats
+from database import (create_database_config, init_database, get_database_stats, get_read_session,
+                      get_jobs_page, save_detections, save_track_chunk, JobOutput, JobUpload, TrackBox,
+                      LineCrossing)
 from models import db, ProcessingJob, Detection, SystemStats, ObjectClass
+from job_queue import JobQueue
+from result_cache import ResultCache, save_upload_hashed, hash_file
+from response_cache import ResponseCache
+from data_export import EXPORT_MIMETYPES, export_filename, stream_export
+from rendering import parse_encoding, output_extension, format_for_path, save_thumbnail, thumbnail_path
+from video_output import VIDEO_OUTPUT_MODES, find_ffmpeg, video_output_name
 
 app = Flask(__name__)
 
+# Spawned video workers re-import this script as __mp_main__ when it is run as
+# `python app.py`; they only need video_workers, so skip the heavy setup there
+IN_VIDEO_WORKER = __name__ == '__mp_main__'
+
 # Configure database
-db_instance, migrate = create_database_config(app)
+if not IN_VIDEO_WORKER:
+    create_database_config(app)
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 PREDICTED_IMAGES_FOLDER = 'output_images'
@@ -27,25 +46,111 @@ os.makedirs(PREDICTED_IMAGES_FOLDER, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'jpg', 'jpeg', 'png'}
 
+# Content-addressed cache of image results, keyed by upload SHA-256
+RESULT_CACHE_FOLDER = 'result_cache'
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+result_cache = ResultCache(RESULT_CACHE_FOLDER, max_bytes=RESULT_CACHE_MAX_BYTES)
+
+# Default encoding of annotated images; uploads may override any of these per request
+app.config['OUTPUT_ENCODING'] = parse_encoding({
+    'format': os.environ.get('OUTPUT_FORMAT'),
+    'quality': os.environ.get('OUTPUT_QUALITY'),
+    'progressive': os.environ.get('OUTPUT_PROGRESSIVE'),
+    'max_side': os.environ.get('OUTPUT_MAX_SIDE'),
+    'thumbnail_side': os.environ.get('OUTPUT_THUMBNAIL_SIDE')
+})
+
+# Background threads processing queued upload jobs
+JOB_QUEUE_WORKERS = int(os.environ.get('JOB_QUEUE_WORKERS', '2'))
+
+# Video tracking worker pool: processes x tracking threads per process
+VIDEO_WORKERS = int(os.environ.get('VIDEO_WORKERS', '1'))
+VIDEO_WORKER_CONCURRENCY = int(os.environ.get('VIDEO_WORKER_CONCURRENCY', '1'))
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tracked video output: 'mp4' (OpenCV, playable once finished), 'fmp4' or 'hls' (ffmpeg, playable while tracking)
+app.config['VIDEO_OUTPUT_MODE'] = os.environ.get('VIDEO_OUTPUT_MODE', 'mp4').lower()
+if app.config['VIDEO_OUTPUT_MODE'] not in VIDEO_OUTPUT_MODES:
+    raise ValueError(f"Unknown VIDEO_OUTPUT_MODE '{app.config['VIDEO_OUTPUT_MODE']}', "
+                     f"expected one of {list(VIDEO_OUTPUT_MODES)}")
+if app.config['VIDEO_OUTPUT_MODE'] != 'mp4' and find_ffmpeg() is None:
+    logger.warning(f"⚠️ VIDEO_OUTPUT_MODE={app.config['VIDEO_OUTPUT_MODE']} needs ffmpeg, falling back to mp4")
+    app.config['VIDEO_OUTPUT_MODE'] = 'mp4'
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Initialize hosted model service
-try:
-    from hosted_model import HostedObjectDetector
-    model = HostedObjectDetector()
-    logger.info("✅ Hosted model service initialized successfully")
-except Exception as e:
-    logger.error(f"❌ Failed to initialize hosted model: {e}")
-    model = None
+# Image detector backend: 'hosted' (remote API), 'yolo' or 'onnx' (local, preloaded)
+app.config['DETECTOR_BACKEND'] = os.environ.get('DETECTOR_BACKEND', 'hosted')
+app.config['DETECTOR_MODEL'] = os.environ.get('DETECTOR_MODEL')
+
+# Initialize the detector once; local backends load their model and warm up here
+model = None
+if not IN_VIDEO_WORKER:
+    try:
+        from detectors import create_detector
+        model = create_detector(app.config['DETECTOR_BACKEND'], model_path=app.config['DETECTOR_MODEL'])
+        logger.info(f"✅ {app.config['DETECTOR_BACKEND']} detector initialized successfully")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize {app.config['DETECTOR_BACKEND']} detector: {e}")
+
+# Persistent video tracking workers, started on the first video upload
+from video_workers import VideoWorkerPool, VideoJobError
+_video_pool = None
+_video_pool_lock = threading.Lock()
+
+def get_video_pool():
+    """Return the shared tracking worker pool, starting it on first use"""
+    global _video_pool
+    with _video_pool_lock:
+        if _video_pool is None:
+            _video_pool = VideoWorkerPool(VIDEO_WORKERS, VIDEO_WORKER_CONCURRENCY).start()
+            atexit.register(_video_pool.shutdown, wait=False)
+            logger.info(f"🎞️ Started {VIDEO_WORKERS} video worker(s) x {VIDEO_WORKER_CONCURRENCY} thread(s)")
+    return _video_pool
+
+def load_cached_prediction(cache_key, output_path, encoding):
+    """Return cached detection results for an upload digest, restoring its output image"""
+    cached = result_cache.get(cache_key)
+    if cached is None:
+        return None
+    detection_results, cached_output = cached
+    try:
+        result_cache.restore_output(cached_output, output_path)
+        output = detection_results.get('output')
+        if output and encoding['thumbnail_side']:
+            # Thumbnails are named after the job's output file, so they are not cached
+            with Image.open(output_path) as img:
+                output['thumbnail_bytes'] = save_thumbnail(img, output_path, encoding['thumbnail_side'])
+            output['thumbnail_filename'] = os.path.basename(thumbnail_path(output_path))
+    except OSError as e:
+        # Entry was evicted between lookup and copy; fall back to a fresh detection
+        logger.warning(f"⚠️ Cached output unavailable for {cache_key[:12]}: {e}")
+        return None
+    logger.info(f"♻️ Result cache hit for {cache_key[:12]}, skipping detection")
+    detection_results['cached'] = True
+    return detection_results
+
+# Result 'model' names of the hosted detector's mock fallback; never cached, so an outage
+# does not keep serving made-up boxes for those image bytes
+UNCACHEABLE_MODELS = ('fallback-detector', 'error')
+
+def detector_identity():
+    """Backend and model (or endpoint) producing detections, so switching either misses the cache"""
+    name = getattr(model, 'model_name', None) or getattr(model, 'api_url', None)
+    return f"{app.config['DETECTOR_BACKEND']}:{name}"
 
-def run_prediction(image_path, output_name, job_id=None):
+def encoding_cache_key(digest, encoding):
+    """Cache key for an upload run through the current detector and rendered with a given output encoding"""
+    variant = json.dumps({'detector': detector_identity(), 'encoding': encoding}, sort_keys=True)
+    return f"{digest}-{hashlib.sha256(variant.encode()).hexdigest()[:12]}"
+
+def run_prediction(image_path, output_name, job_id=None, digest=None, encoding=None):
     if model is None:
-        logger.error("❌ Hosted model service not loaded")
+        logger.error("❌ Detector backend not loaded")
         return None, None
         
     if not os.path.exists(image_path):
@@ -53,57 +158,243 @@ def run_prediction(image_path, output_name, job_id=None):
         return None, None
 
     try:
-        logger.info(f"🔍 Running hosted prediction on: {image_path}")
         start_time = time.time()
+        output_path = os.path.join(PREDICTED_IMAGES_FOLDER, output_name)
+        encoding = encoding or app.config['OUTPUT_ENCODING']
+        cache_key = encoding_cache_key(digest, encoding) if digest else None
         
-        # Use the hosted model service
-        detection_results = model.detect_objects(image_path)
+        # Identical bytes were processed before: reuse their results and rendered image
+        detection_results = load_cached_prediction(cache_key, output_path, encoding) if cache_key else None
         
         if detection_results is None:
-            logger.error("❌ Hosted prediction returned no results")
-            return None, None
-        
-        # Draw detection boxes on the image
-        output_path = os.path.join(PREDICTED_IMAGES_FOLDER, output_name)
-        success = model.draw_detections(image_path, detection_results['detections'], output_path)
-        
-        if not success:
-            logger.error(f"❌ Failed to draw detections on image: {output_path}")
-            return None, None
+            logger.info(f"🔍 Running {app.config['DETECTOR_BACKEND']} prediction on: {image_path}")
+            
+            # Open the upload once (header only); detection and drawing share its decoded pixels
+            with Image.open(image_path) as image:
+                # Use the configured detector backend
+                detection_results = model.detect_objects(image_path, image=image)
+                
+                if detection_results is None:
+                    logger.error("❌ Prediction returned no results")
+                    return None, None
+                
+                # Draw detection boxes on the image
+                success = model.draw_detections(image_path, detection_results['detections'], output_path,
+                                                image=image, encoding=encoding)
+            
+            if not success:
+                logger.error(f"❌ Failed to draw detections on image: {output_path}")
+                return None, None
+            # Encode stats (format, bytes, encode time); a plain True means the original was copied
+            detection_results['output'] = success if isinstance(success, dict) else None
+            
+            if cache_key and detection_results.get('model') not in UNCACHEABLE_MODELS:
+                result_cache.put(cache_key, detection_results, output_path)
         
         # Save detection data to the database
         if job_id:
             with app.app_context():
-                for det in detection_results['detections']:
-                    detection = Detection(
-                        job_id=job_id,
-                        class_name=det['class_name'],
-                        confidence=det['confidence'],
-                        bbox_x1=det['bbox']['x1'],
-                        bbox_y1=det['bbox']['y1'],
-                        bbox_x2=det['bbox']['x2'],
-                        bbox_y2=det['bbox']['y2']
-                    )
-                    db.session.add(detection)
-                    
-                    # Update object class stats
-                    ObjectClass.update_class_stats(det['class_name'], det['confidence'])
-                
+                # One bulk insert plus one stats update per class, however many objects were found
+                save_detections(job_id, detection_results['detections'])
                 db.session.commit()
         
         processing_time = time.time() - start_time
         detection_results['processing_time'] = processing_time
         
-        logger.info(f"✅ Hosted prediction saved to: {output_path} ({detection_results['total_detections']} objects detected)")
+        logger.info(f"✅ Prediction saved to: {output_path} ({detection_results['total_detections']} objects detected)")
         
         return output_path, detection_results
             
     except Exception as e:
-        logger.error(f"❌ Error during hosted prediction: {e}")
+        logger.error(f"❌ Error during prediction: {e}")
         if job_id:
             db.session.rollback()
         return None, None
 
+def process_image_job(job, digest=None, encoding=None):
+    """Job queue handler: run detection on an uploaded image"""
+    logger.info(f"🖼️ Processing image: {job.filename}")
+    job_queue.update_progress(job.id, frames_done=0, total_frames=1)
+    if digest is None:
+        digest = hash_file(job.input_path)
+    if encoding is None:
+        # Re-queued after a restart: the output extension still records the requested format
+        encoding = dict(app.config['OUTPUT_ENCODING'], format=format_for_path(job.output_filename))
+    
+    # Run prediction with database integration
+    result_path, detection_info = run_prediction(job.input_path, job.output_filename, job.id, digest, encoding)
+    
+    if result_path is None:
+        # Update job as failed
+        job.status = 'failed'
+        job.error_message = 'Model prediction failed'
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        
+        logger.error(f"❌ Image prediction failed (Job #{job.id})")
+        return
+    
+    # Update job as completed
+    job.status = 'completed'
+    job.completed_at = datetime.utcnow()
+    job.processing_time = detection_info['processing_time']
+    job.objects_detected = detection_info['total_detections']
+    job.set_detection_results(detection_info['detections'])
+    output = detection_info.get('output')
+    if output:
+        db.session.add(JobOutput.from_stats(job.id, output))
+    # Hosted detector only; a cache hit sent nothing
+    upload = None if detection_info.get('cached') else detection_info.get('upload')
+    if upload:
+        db.session.add(JobUpload.from_stats(job.id, upload))
+    db.session.commit()
+    
+    # Update system statistics
+    stats = SystemStats.get_or_create_stats()
+    stats.update_stats(job)
+    
+    job_queue.update_progress(job.id, frames_done=1)
+    logger.info(f"✅ Image processed successfully: {job.output_filename} (Job #{job.id})")
+    return {
+        'objects_detected': job.objects_detected,
+        'processing_time': job.processing_time,
+        'output_filename': job.output_filename,
+        'output_bytes': output['output_bytes'] if output else None,
+        'encode_time': output['encode_time'] if output else None,
+        'upload_bytes': upload['sent_bytes'] if upload else None,
+        'cached': detection_info.get('cached', False)
+    }
+
+def process_video_job(job):
+    """Job queue handler: run tracking on an uploaded video in the worker pool"""
+    logger.info(f"🎥 Processing video: {job.filename}")
+    job_id = job.id
+    start_time = time.time()
+    output_mode = app.config['VIDEO_OUTPUT_MODE']
+    is_playlist = job.output_filename.endswith('.m3u8')
+    if (output_mode == 'hls') != is_playlist:
+        # Queued before VIDEO_OUTPUT_MODE changed; write the format its output name promises
+        output_mode = 'hls' if is_playlist else 'mp4'
+    
+    # Per-frame boxes and line crossings arrive in chunks on the pool's listener thread;
+    # each chunk is written here as one bulk insert and one commit
+    chunks = queue.Queue()
+    pool = get_video_pool()
+    future = pool.submit(
+        job.input_path, job.output_path,
+        progress=lambda progress: job_queue.update_progress(job_id, **progress),
+        tracks=chunks.put,
+        output_mode=output_mode
+    )
+    # Chunks are queued before the future resolves, so done + empty means all were saved
+    while not (future.done() and chunks.empty()):
+        try:
+            chunk = chunks.get(timeout=0.5)
+        except queue.Empty:
+            if not future.done() and not pool.is_running():
+                # Nothing is left to resolve the future; stop waiting instead of spinning forever
+                future.set_exception(VideoJobError("Video worker pool stopped before the job finished"))
+            continue
+        save_track_chunk(job_id, chunk)
+        db.session.commit()
+    
+    try:
+        result = future.result()
+    except (VideoJobError, CancelledError) as e:
+        # A CancelledError carries no message: the pool was shut down with the job queued
+        error = str(e) or 'Video job cancelled by pool shutdown'
+        job.status = 'failed'
+        job.error_message = error
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        logger.error(f"❌ Video processing failed (Job #{job_id}): {error}")
+        return
+    
+    job.status = 'completed'
+    job.completed_at = datetime.utcnow()
+    job.processing_time = time.time() - start_time
+    job.objects_detected = result['tracks']
+    db.session.commit()
+    
+    # Update system statistics
+    stats = SystemStats.get_or_create_stats()
+    stats.update_stats(job)
+    
+    logger.info(f"✅ Video processed successfully: {job.output_filename} ({result['frames']} frames, Job #{job_id})")
+    return {
+        'frames': result['frames'],
+        'objects_detected': job.objects_detected,
+        'up_count': result['up_count'],
+        'down_count': result['down_count'],
+        'processing_time': job.processing_time,
+        'output_filename': job.output_filename
+    }
+
+# Rendered /api/stats, /api/classes and /dashboard bodies; they only change when a job finishes
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '5'))
+response_cache = ResponseCache(ttl=RESPONSE_CACHE_TTL)
+
+job_queue = None
+if not IN_VIDEO_WORKER:
+    job_queue = JobQueue(app, max_workers=JOB_QUEUE_WORKERS,
+                         on_finish=lambda job_id, result: response_cache.invalidate())
+    atexit.register(job_queue.shutdown, wait=False)
+
+def recover_interrupted_jobs():
+    """Re-queue pending jobs and fail jobs a previous server run left half-processed"""
+    for job in ProcessingJob.query.filter(ProcessingJob.status.in_(['pending', 'processing'])).all():
+        if job.status == 'processing':
+            job.status = 'failed'
+            job.error_message = 'Interrupted by server restart'
+            job.completed_at = datetime.utcnow()
+        else:
+            handler = process_image_job if job.file_type == 'image' else process_video_job
+            job_queue.submit(job.id, handler)
+    db.session.commit()
+
+def cached_view(view):
+    """Serve a read-only view from response_cache with an ETag, answering 304 when it matches.
+
+    Only 200 responses are cached. Clients must revalidate on every use
+    (Cache-Control: no-cache), so a finished job shows up at once.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.full_path
+        entry = response_cache.get(key)
+        if entry is None:
+            generation = response_cache.generation
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = response_cache.put(key, response.get_data(), response.mimetype, generation)
+        body, mimetype, etag = entry
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    return wrapper
+
+def wants_json():
+    """True when the client prefers a JSON response over an HTML page"""
+    return request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html
+
+def job_accepted_response(job):
+    """202 Accepted for a queued job: JSON for API clients, a progress page for browsers"""
+    status_url = url_for('api_job_details', job_id=job.id)
+    if wants_json():
+        response = jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': status_url,
+            'result_url': url_for('job_result', job_id=job.id)
+        })
+        response.status_code = 202
+        response.headers['Location'] = status_url
+        return response
+    return render_template('processing.html', job_id=job.id, file_type=job.file_type,
+                           output_filename=job.output_filename), 202
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -196,11 +487,25 @@ def upload_file():
         logger.error(f"❌ File type not allowed: {file.filename}")
         return "File type not allowed", 400
         
+    # Per-request output encoding, e.g. output_format=webp&quality=70&thumbnail_side=320
+    try:
+        encoding = parse_encoding({
+            'format': request.form.get('output_format'),
+            'quality': request.form.get('quality'),
+            'progressive': request.form.get('progressive'),
+            'max_side': request.form.get('max_side'),
+            'thumbnail_side': request.form.get('thumbnail_side')
+        }, app.config['OUTPUT_ENCODING'])
+    except ValueError as e:
+        logger.error(f"❌ Invalid output encoding: {e}")
+        return f"Invalid output encoding: {e}", 400
+        
     try:
         filename = secure_filename(file.filename)
         input_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(input_path)
-        logger.info(f"💾 File saved to: {input_path}")
+        # Hash while streaming to disk so duplicate uploads can be served from the result cache
+        digest, _ = save_upload_hashed(file, input_path)
+        logger.info(f"💾 File saved to: {input_path} (sha256 {digest[:12]})")
         
         # Verify file was saved correctly
         if not os.path.exists(input_path) or os.path.getsize(input_path) == 0:
@@ -212,7 +517,7 @@ def upload_file():
         file_type = 'image' if ext in {'jpg', 'jpeg', 'png'} else 'video'
         file_size = os.path.getsize(input_path)
         
-        # Create processing job record
+        # Create processing job record; the work itself runs on the background job queue
         job = ProcessingJob(
             filename=filename,
             original_filename=file.filename,
@@ -220,115 +525,193 @@ def upload_file():
             file_extension=ext,
             file_size=file_size,
             input_path=input_path,
-            status='processing',
-            started_at=datetime.utcnow()
+            status='pending'
         )
+        if file_type == 'image':
+            job.output_filename = 'output_' + filename.rsplit('.', 1)[0] + '.' + output_extension(encoding)
+            job.output_path = os.path.join(PREDICTED_IMAGES_FOLDER, job.output_filename)
+            handler = functools.partial(process_image_job, digest=digest, encoding=encoding)
+        else:
+            job.output_filename = video_output_name('output_' + filename.rsplit('.', 1)[0],
+                                                    app.config['VIDEO_OUTPUT_MODE'])
+            job.output_path = os.path.join(OUTPUT_FOLDER, job.output_filename)
+            handler = process_video_job
         db.session.add(job)
         db.session.commit()
         
-        logger.info(f"🏷️ Created job #{job.id} for {filename}")
-        
-        if ext in {'jpg', 'jpeg', 'png'}:
-            # Image detection
-            logger.info(f"🖼️ Processing image: {filename}")
-            output_filename = 'output_' + filename.rsplit('.', 1)[0] + '.jpg'
-            output_path = os.path.join(PREDICTED_IMAGES_FOLDER, output_filename)
-            
-            # Update job with output details
-            job.output_path = output_path
-            job.output_filename = output_filename
-            db.session.commit()
-            
-            # Run prediction with database integration
-            result_path, detection_info = run_prediction(input_path, output_filename, job.id)
-            
-            if result_path is None:
-                # Update job as failed
-                job.status = 'failed'
-                job.error_message = 'Model prediction failed'
-                job.completed_at = datetime.utcnow()
-                db.session.commit()
-                
-                logger.error("❌ Image prediction failed")
-                return "Error processing image - model failed", 500
-            
-            # Update job as completed
-            job.status = 'completed'
-            job.completed_at = datetime.utcnow()
-            job.processing_time = detection_info['processing_time']
-            job.objects_detected = detection_info['total_detections']
-            job.set_detection_results(detection_info['detections'])
-            db.session.commit()
-            
-            # Update system statistics
-            stats = SystemStats.get_or_create_stats()
-            stats.update_stats(job)
-            
-            logger.info(f"✅ Image processed successfully: {output_filename} (Job #{job.id})")
-            return render_template('result_image.html', 
-                                 output_filename=output_filename, 
-                                 input_filename=filename,
-                                 job_id=job.id,
-                                 detection_info=detection_info)
-        else:
-            # Video tracking
-            logger.info(f"🎥 Processing video: {filename}")
-            output_filename = 'output_' + filename.rsplit('.', 1)[0] + '.mp4'
-            output_path = os.path.join(OUTPUT_FOLDER, output_filename)
-            try:
-                result = subprocess.run(['python3', 'run_tracking.py', '--input', input_path, '--output', output_path], 
-                                      check=True, capture_output=True, text=True)
-                logger.info(f"✅ Video processed successfully: {output_filename}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"❌ Video processing failed: {e.stderr}")
-                return f"Error processing video: {e.stderr}", 500
-            return render_template('result.html', output_filename=output_filename)
+        job_queue.submit(job.id, handler)
+        logger.info(f"🏷️ Queued job #{job.id} for {filename}")
+        return job_accepted_response(job)
             
     except Exception as e:
         logger.error(f"❌ Unexpected error in upload: {e}")
         return f"Internal server error: {e}", 500
 
-def get_range(request):
-    range_header = request.headers.get('Range', None)
-    if range_header:
-        range_match = re.match(r'bytes=(\d+)-(\d*)', range_header)
-        if range_match:
-            start = int(range_match.group(1))
-            end = range_match.group(2)
-            if end and end.isdigit():
-                end = int(end)
-            else:
-                end = None
-            return start, end
-    return None, None
+@app.route('/result/<int:job_id>')
+def job_result(job_id):
+    """Result page for a queued job, or the progress page while it is still running"""
+    job = ProcessingJob.query.get_or_404(job_id)
+    if job.status in ('pending', 'processing'):
+        return render_template('processing.html', job_id=job.id, file_type=job.file_type,
+                               output_filename=job.output_filename), 202
+    if job.status == 'failed':
+        return f"Error processing {job.file_type}: {job.error_message}", 500
+    if job.file_type == 'image':
+        return render_template('result_image.html',
+                             output_filename=job.output_filename,
+                             input_filename=job.filename,
+                             job_id=job.id)
+    return render_template('result.html', output_filename=job.output_filename)
 
-@app.route('/static/outputs/<path:filename>')
-def static_output_file(filename):
-    file_path = os.path.join(OUTPUT_FOLDER, filename)
-    if not os.path.exists(file_path):
-        abort(404)
+# Bytes read per chunk when streaming multipart range responses
+RANGE_CHUNK_SIZE = 256 * 1024
+# With more ranges than this the Range header is ignored and the whole file is sent (200)
+MAX_RANGES = 16
 
-    file_size = os.path.getsize(file_path)
-    start, end = get_range(request)
+def iter_file_range(file_path, start, end, chunk_size=RANGE_CHUNK_SIZE):
+    """Yield bytes [start, end) of a file in chunks"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
 
-    if start is None:
-        # No range header, send full content
-        return send_from_directory(OUTPUT_FOLDER, filename)
+def parse_byte_ranges(header):
+    """(start, stop) pairs of a Range header, in any order and possibly overlapping.
+    
+    Suffix ranges are (-length, None) and open ranges (start, None), as in
+    werkzeug's Range.ranges. Returns None for a malformed header.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    byte_ranges = []
+    for part in spec.split(','):
+        first, dash, last = (value.strip() for value in part.partition('-'))
+        if not dash or not (first or last) or not all(value.isdigit() for value in (first, last) if value):
+            return None
+        if not first:
+            byte_ranges.append((-int(last), None))
+        elif last and int(last) < int(first):
+            return None
+        else:
+            byte_ranges.append((int(first), int(last) + 1 if last else None))
+    return byte_ranges
 
-    if end is None or end >= file_size:
-        end = file_size - 1
+def merge_ranges(ranges):
+    """Sort absolute (start, end) pairs and merge the overlapping or adjacent ones"""
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
 
-    length = end - start + 1
+def resolve_ranges(byte_ranges, file_size):
+    """Absolute (start, end) pairs for a parsed Range header, dropping unsatisfiable ones"""
+    resolved = []
+    for start, stop in byte_ranges:
+        if start < 0:
+            # Suffix range: the last -start bytes
+            start, stop = max(file_size + start, 0), file_size
+        else:
+            stop = file_size if stop is None else min(stop, file_size)
+        if start < stop:
+            resolved.append((start, stop))
+    return resolved
 
-    with open(file_path, 'rb') as f:
-        f.seek(start)
-        data = f.read(length)
+def single_range_response(file_path, start, stop, file_size, mimetype):
+    """206 response streaming bytes [start, stop) of a file from disk"""
+    response = Response(iter_file_range(file_path, start, stop), 206, mimetype=mimetype,
+                        direct_passthrough=True)
+    response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{file_size}'
+    response.headers['Content-Length'] = str(stop - start)
+    return response
+
+def multipart_range_response(file_path, ranges, file_size, mimetype):
+    """206 multipart/byteranges response streaming each range from disk"""
+    boundary = os.urandom(12).hex()
+    part_headers = [
+        (f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+         f"Content-Range: bytes {start}-{stop - 1}/{file_size}\r\n\r\n").encode()
+        for start, stop in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    length = sum(len(h) for h in part_headers) + sum(stop - start for start, stop in ranges)
+    length += 2 * (len(ranges) - 1) + len(closing)
+    
+    def stream():
+        for i, ((start, stop), header) in enumerate(zip(ranges, part_headers)):
+            yield (b"\r\n" if i else b"") + header
+            yield from iter_file_range(file_path, start, stop)
+        yield closing
+    
+    response = Response(stream(), 206, content_type=f'multipart/byteranges; boundary={boundary}',
+                        direct_passthrough=True)
+    response.headers['Content-Length'] = str(length)
+    return response
 
-    rv = Response(data, 206, mimetype=mimetypes.guess_type(file_path)[0], direct_passthrough=True)
-    rv.headers.add('Content-Range', f'bytes {start}-{end}/{file_size}')
-    rv.headers.add('Accept-Ranges', 'bytes')
-    rv.headers.add('Content-Length', str(length))
-    return rv
+@app.route('/static/outputs/<path:filename>')
+def static_output_file(filename):
+    """Serve processed videos with conditional GET (ETag/Last-Modified, 304) and Range support.
+    
+    Single and suffix ranges are handled by send_file, which streams the file
+    (through sendfile when the server supports wsgi.file_wrapper). Multiple
+    ranges are merged where they overlap or touch and get a streamed
+    multipart/byteranges response; more than MAX_RANGES, or a malformed
+    header, get the whole file.
+    """
+    file_path = safe_join(OUTPUT_FOLDER, filename)
+    if file_path is None or not os.path.isfile(file_path):
+        abort(404)
+    
+    header = request.headers.get('Range')
+    byte_range = request.range
+    if header is None or (byte_range is not None and len(byte_range.ranges) == 1):
+        return send_file(os.path.abspath(file_path), conditional=True, etag=True)
+    
+    # send_file rejects multiple (and overlapping) ranges, so only let it answer the conditional GET part
+    response = send_file(os.path.abspath(file_path), conditional=False, etag=True)
+    response.accept_ranges = 'bytes'
+    response.make_conditional(request)
+    if response.status_code != 200:
+        return response
+    
+    # A stale If-Range means the client gets the whole file
+    if request.if_range.etag or request.if_range.date:
+        etag, _ = response.get_etag()
+        if_range_matches = (request.if_range.etag == etag if request.if_range.etag
+                            else response.last_modified is not None
+                            and request.if_range.date >= response.last_modified)
+        if not if_range_matches:
+            return response
+    
+    byte_ranges = parse_byte_ranges(header)
+    if byte_ranges is None or len(byte_ranges) > MAX_RANGES:
+        return response
+    
+    file_size = os.path.getsize(file_path)
+    ranges = merge_ranges(resolve_ranges(byte_ranges, file_size))
+    if not ranges:
+        response.close()
+        unsatisfiable = Response(status=416)
+        unsatisfiable.headers['Content-Range'] = f'bytes */{file_size}'
+        return unsatisfiable
+    
+    if len(ranges) == 1:
+        partial = single_range_response(file_path, *ranges[0], file_size, response.mimetype)
+    else:
+        partial = multipart_range_response(file_path, ranges, file_size, response.mimetype)
+    for name in ('ETag', 'Last-Modified', 'Cache-Control', 'Accept-Ranges'):
+        if name in response.headers:
+            partial.headers[name] = response.headers[name]
+    response.close()
+    return partial
 
 @app.route('/predicted_images/<path:filename>')
 def predicted_image_file(filename):
@@ -340,6 +723,7 @@ def uploaded_file(filename):
 
 # Database API Routes
 @app.route('/api/stats')
+@cached_view
 def api_stats():
     """Get comprehensive database statistics as JSON"""
     try:
@@ -352,13 +736,30 @@ def api_stats():
         logger.error(f"❌ Error getting API stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Largest page /api/jobs returns per request
+MAX_JOBS_PAGE = 100
+
 @app.route('/api/jobs')
 @app.route('/api/jobs/<int:limit>')
 def api_jobs(limit=20):
-    """Get recent processing jobs as JSON"""
+    """Get recent processing jobs as JSON, newest first
+    
+    Optional query args: limit (capped at MAX_JOBS_PAGE), status, and cursor
+    to continue after a previous page. When more jobs follow, the response
+    carries a Link: <...>; rel="next" header with the next page's URL.
+    """
+    limit = max(1, min(request.args.get('limit', limit, type=int), MAX_JOBS_PAGE))
+    status = request.args.get('status')
     try:
-        jobs = ProcessingJob.query.order_by(ProcessingJob.created_at.desc()).limit(limit).all()
-        return jsonify([job.to_dict() for job in jobs])
+        jobs, next_cursor = get_jobs_page(limit, cursor=request.args.get('cursor'), status=status)
+        response = jsonify([job.to_dict() for job in jobs])
+        if next_cursor:
+            next_url = url_for('api_jobs', limit=limit, status=status, cursor=next_cursor)
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+        return response
+    except ValueError as e:
+        # Malformed cursor
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error getting jobs: {e}")
         return jsonify({'error': str(e)}), 500
@@ -366,36 +767,128 @@ def api_jobs(limit=20):
 @app.route('/api/job/<int:job_id>')
 def api_job_details(job_id):
     """Get detailed information about a specific job"""
+    session = get_read_session()
+    job = session.get(ProcessingJob, job_id)
+    if job is None:
+        abort(404)
     try:
-        job = ProcessingJob.query.get_or_404(job_id)
         job_data = job.to_dict()
         
+        # Live progress (frames done / total frames) from the job queue
+        job_data['progress'] = job_queue.get_progress(job_id)
+        
+        # Output encoding, size and encode time
+        output = session.query(JobOutput).filter_by(job_id=job_id).first()
+        job_data['output'] = output.to_dict() if output else None
+        if output and output.thumbnail_filename:
+            job_data['output']['thumbnail_url'] = url_for('predicted_image_file', filename=output.thumbnail_filename)
+        
+        # What the hosted detector was sent (None for local backends and cache hits)
+        upload = session.query(JobUpload).filter_by(job_id=job_id).first()
+        job_data['upload'] = upload.to_dict() if upload else None
+        
         # Add detection details
-        detections = Detection.query.filter_by(job_id=job_id).all()
+        detections = session.query(Detection).filter_by(job_id=job_id).all()
         job_data['detections_detail'] = [detection.to_dict() for detection in detections]
         
+        # Line crossings recorded while tracking a video
+        if job.file_type == 'video':
+            crossings = session.query(LineCrossing).filter_by(job_id=job_id).order_by(LineCrossing.frame_index).all()
+            job_data['line_crossings'] = [crossing.to_dict() for crossing in crossings]
+        
         return jsonify(job_data)
     except Exception as e:
         logger.error(f"❌ Error getting job {job_id}: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Largest frame window /api/job/<id>/tracks returns per request
+MAX_TRACK_FRAMES = 1000
+
+@app.route('/api/job/<int:job_id>/tracks')
+def api_job_tracks(job_id):
+    """Per-frame tracked boxes of a video job for frames [start, end)"""
+    session = get_read_session()
+    if session.get(ProcessingJob, job_id) is None:
+        abort(404)
+    try:
+        start = request.args.get('start', 0, type=int)
+        end = min(request.args.get('end', start + MAX_TRACK_FRAMES, type=int), start + MAX_TRACK_FRAMES)
+        boxes = session.query(TrackBox).filter(
+            TrackBox.job_id == job_id,
+            TrackBox.frame_index >= start,
+            TrackBox.frame_index < end
+        ).order_by(TrackBox.frame_index, TrackBox.track_id).all()
+        return jsonify({'start': start, 'end': end, 'boxes': [box.to_dict() for box in boxes]})
+    except Exception as e:
+        logger.error(f"❌ Error getting tracks for job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/job/<int:job_id>/events')
+def api_job_events(job_id):
+    """Server-Sent Events stream of a job's progress, fed from memory only"""
+    subscription = job_queue.subscribe(job_id)
+    if subscription is None:
+        return jsonify({'error': f'Job {job_id} is not running on this server'}), 404
+    
+    def stream():
+        try:
+            while True:
+                try:
+                    event, data = subscription.get(timeout=15)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == 'result':
+                    break
+        finally:
+            job_queue.unsubscribe(job_id, subscription)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/classes')
+@cached_view
 def api_object_classes():
     """Get object class detection statistics"""
     try:
-        classes = ObjectClass.query.order_by(ObjectClass.detection_count.desc()).all()
+        classes = get_read_session().query(ObjectClass).order_by(ObjectClass.detection_count.desc()).all()
         return jsonify([obj_class.to_dict() for obj_class in classes])
     except Exception as e:
         logger.error(f"❌ Error getting object classes: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export')
+def api_export():
+    """Stream a database export as a chunked download
+    
+    Query args: format (ndjson, ndjson.gz, parquet or arrow; default ndjson)
+    and table (required for parquet and arrow, which need pyarrow). Rows are
+    read and encoded batch by batch while the response is being sent.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    table = request.args.get('table')
+    try:
+        chunks = stream_export(get_read_session(), export_format, table)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except ImportError as e:
+        return jsonify({'error': str(e)}), 501
+    
+    filename = export_filename(export_format, table)
+    logger.info(f"📤 Streaming {export_format} export: {filename}")
+    return Response(stream_with_context(chunks), mimetype=EXPORT_MIMETYPES[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/dashboard')
+@cached_view
 def dashboard():
     """Show a comprehensive dashboard with statistics"""
     try:
         stats = get_database_stats()
         if not stats:
-            return "<h1>❌ Error loading dashboard data</h1><br><a href='/'>Back to Home</a>"
+            return "<h1>❌ Error loading dashboard data</h1><br><a href='/'>Back to Home</a>", 500
         
         # Generate HTML dashboard
         dashboard_html = f"""
@@ -426,6 +919,7 @@ def dashboard():
                     <a href="/">🏠 Home</a>
                     <a href="/api/stats">📊 API Stats</a>
                     <a href="/api/jobs">📋 Jobs API</a>
+                    <a href="/api/export?format=ndjson.gz">📦 Export</a>
                     <a href="/demo">🎬 Demo</a>
                 </div>
                 
@@ -504,12 +998,13 @@ def dashboard():
         
     except Exception as e:
         logger.error(f"❌ Error creating dashboard: {e}")
-        return f"<h1>❌ Dashboard Error: {e}</h1><br><a href='/'>Back to Home</a>"
+        return f"<h1>❌ Dashboard Error: {e}</h1><br><a href='/'>Back to Home</a>", 500
 
 if __name__ == '__main__':
     # Initialize database
     with app.app_context():
         init_database(app)
         logger.info("🗺️ Database initialized for Object Detection app")
+        recover_interrupted_jobs()
     
     app.run(debug=True)
@@ -0,0 +1,776 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the Object Detection System
+Run with: python benchmarks.py <benchmark> [options]
+"""
+import argparse
+import time
+
+import numpy as np
+
+
+def synthetic_scene(num_objects, num_frames, width=1920, height=1080, seed=0):
+    """Generate per-frame detections for objects moving linearly with a little jitter"""
+    rng = np.random.default_rng(seed)
+    sizes = rng.uniform(30, 120, size=(num_objects, 2))
+    starts = rng.uniform([0, 0], [width, height], size=(num_objects, 2))
+    velocities = rng.uniform(-4, 4, size=(num_objects, 2))
+    classes = rng.integers(0, 10, size=num_objects)
+
+    frames = []
+    for t in range(num_frames):
+        centers = starts + velocities * t + rng.normal(0, 0.5, size=(num_objects, 2))
+        boxes = np.hstack([centers - sizes / 2, centers + sizes / 2])
+        frames.append([[*box, 0.9, float(cls)] for box, cls in zip(boxes.tolist(), classes)])
+    return frames
+
+
+def loop_tracker_manager():
+    """KalmanTrackerManager with the original matching: a Python loop over every detection/track pair"""
+    from run_tracking import KalmanBoxTracker, KalmanTrackerManager
+
+    class LoopTrackerManager(KalmanTrackerManager):
+        def update(self, detections):
+            self.frame_count += 1
+            updated_tracks = []
+            for tracker in self.trackers:
+                tracker.predict()
+            unmatched_dets = []
+            for det in detections:
+                best_iou = -1
+                best_tracker = None
+                for tracker in self.trackers:
+                    iou = self._iou(det[:4], tracker.get_state())
+                    if iou >= self.iou_thresh and iou > best_iou:
+                        best_iou = iou
+                        best_tracker = tracker
+                if best_tracker:
+                    best_tracker.update(det[:4])
+                    updated_tracks.append((*best_tracker.get_state(), best_tracker.id, det[5]))
+                else:
+                    unmatched_dets.append(det)
+            for det in unmatched_dets:
+                tracker = KalmanBoxTracker(det[:4])
+                updated_tracks.append((*tracker.get_state(), tracker.id, det[5]))
+                self.trackers.append(tracker)
+            self.trackers = [t for t in self.trackers if t.time_since_update <= self.max_age]
+            return updated_tracks
+
+    return LoopTrackerManager(batched=False)
+
+
+def bench_tracking(args):
+    """Frame time of KalmanTrackerManager.update as the number of objects grows"""
+    from run_tracking import KalmanTrackerManager, MATCHERS
+
+    # The original per-pair loop first, then every matcher on per-object filters and the track bank
+    variants = [('loop', False)] + [(matching, batched) for matching in sorted(MATCHERS) for batched in (False, True)]
+    labels = [f"{matching}/{'bank' if batched else 'objects'}" for matching, batched in variants]
+    print(f"🏁 Tracking benchmark ({args.frames} frames per run)")
+    print(f"{'objects':>8} | " + " | ".join(f"{label:>17}" for label in labels))
+    for num_objects in args.objects:
+        frames = synthetic_scene(num_objects, args.frames)
+        timings = []
+        for matching, batched in variants:
+            if matching == 'loop':
+                tracker = loop_tracker_manager()
+            else:
+                tracker = KalmanTrackerManager(matching=matching, batched=batched)
+            start = time.perf_counter()
+            for detections in frames:
+                tracker.update(detections)
+            elapsed = time.perf_counter() - start
+            timings.append(f"{elapsed / len(frames) * 1000:14.2f} ms")
+        print(f"{num_objects:>8} | " + " | ".join(timings))
+
+
+def bench_inference(args):
+    """Frames/sec of batched YOLO inference on CPU for several batch sizes"""
+    import cv2
+    from ultralytics import YOLO
+    from run_tracking import iter_batches
+
+    model = YOLO(args.model)
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        frames = []
+        for batch in iter_batches(cap, args.frames):
+            frames = batch
+            break
+        cap.release()
+    else:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, size=(720, 1280, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+    # Warm-up so model fusing and allocator growth don't count against batch size 1
+    model(frames[:1], verbose=False, device='cpu')
+    print(f"🏁 Inference benchmark ({len(frames)} frames, model={args.model}, CPU)")
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(frames), batch_size):
+            model(frames[i:i + batch_size], verbose=False, device='cpu')
+        elapsed = time.perf_counter() - start
+        print(f"   batch {batch_size:>3}: {len(frames) / elapsed:6.2f} frames/sec")
+
+
+def bench_hosted(args):
+    """Images/sec through HostedObjectDetector against the local stub for several in-flight limits"""
+    import os
+    import tempfile
+    import cv2
+    from hosted_model import HostedObjectDetector
+    from hosted_stub import start_stub_server
+
+    server, url = start_stub_server(latency=args.latency)
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.images):
+            path = os.path.join(tmp, f"image_{i}.jpg")
+            cv2.imwrite(path, rng.integers(0, 255, size=(480, 640, 3), dtype=np.uint8))
+            paths.append(path)
+
+        print(f"🏁 Hosted client benchmark ({args.images} images, {args.latency * 1000:.0f} ms stub latency)")
+        detector = HostedObjectDetector(api_url=url)
+        start = time.perf_counter()
+        for path in paths:
+            detector.detect_objects(path)
+        elapsed = time.perf_counter() - start
+        print(f"   one at a time: {args.images / elapsed:7.1f} images/sec")
+
+        for in_flight in args.in_flight:
+            detector = HostedObjectDetector(api_url=url, max_concurrency=in_flight)
+            start = time.perf_counter()
+            first = None
+            for _ in detector.detect_objects_many(paths):
+                first = first or time.perf_counter() - start
+            elapsed = time.perf_counter() - start
+            print(f"   {in_flight:>3} in flight: {args.images / elapsed:7.1f} images/sec "
+                  f"(first result after {first * 1000:.0f} ms)")
+            detector.close()
+    server.shutdown()
+
+
+def synthetic_photo(width, height, seed=0):
+    """Smooth gradients plus blurred noise: compresses roughly like a photo, unlike pure noise"""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    base = np.stack([x * 255 + y * 0, y * 255 + x * 0, (x + y) * 127], axis=2)
+    noise = cv2.GaussianBlur(rng.normal(0, 40, size=(height, width, 3)).astype(np.float32), (0, 0), 3)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def bench_upload(args):
+    """Bytes sent and round-trip latency with and without client-side downscaling"""
+    import os
+    import tempfile
+    import cv2
+    from hosted_model import HostedObjectDetector
+    from hosted_stub import start_stub_server
+
+    server, url = start_stub_server(latency=args.latency, bandwidth=args.bandwidth)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for ext in ('png', 'jpg'):
+            path = os.path.join(tmp, f"photo.{ext}")
+            cv2.imwrite(path, synthetic_photo(args.width, args.height))
+            paths.append(path)
+
+        print(f"🏁 Upload benchmark ({args.width}x{args.height}, "
+              f"{args.bandwidth / 1e6:.0f} MB/s simulated uplink, {args.latency * 1000:.0f} ms latency)")
+        variants = [
+            ('original', dict(max_side=None, upload_format=None)),
+            ('800px JPEG', dict(upload_format='JPEG')),
+            ('800px WebP', dict(upload_format='WEBP')),
+        ]
+        for path in paths:
+            for label, options in variants:
+                detector = HostedObjectDetector(api_url=url, **options)
+                start = time.perf_counter()
+                results = detector.detect_objects(path)
+                elapsed = time.perf_counter() - start
+                upload = results['upload']
+                print(f"   {os.path.basename(path):>9} {label:>11}: {upload['sent_bytes'] / 1e6:7.2f} MB sent, "
+                      f"{elapsed * 1000:7.0f} ms (encode {upload['encode_time'] * 1000:.0f} ms)")
+    server.shutdown()
+
+
+def _rss_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def _measure_request(image_path, shared, repeats):
+    """Child process: CPU time per detect+draw request and peak RSS growth in MB"""
+    import os
+    import tempfile
+    from PIL import Image
+    from hosted_model import HostedObjectDetector
+    from hosted_stub import start_stub_server
+
+    server, url = start_stub_server()
+    detector = HostedObjectDetector(api_url=url)
+    output_path = os.path.join(tempfile.gettempdir(), f"bench_decode_{os.getpid()}.jpg")
+    # Reset the RSS high-water mark (Linux) so only the requests count
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    baseline = _rss_kb('VmRSS')
+    start = time.process_time()
+    for _ in range(repeats):
+        if shared:
+            with Image.open(image_path) as image:
+                results = detector.detect_objects(image_path, image=image)
+                detector.draw_detections(image_path, results['detections'], output_path, image=image)
+        else:
+            results = detector.detect_objects(image_path)
+            detector.draw_detections(image_path, results['detections'], output_path)
+    cpu = (time.process_time() - start) / repeats
+    peak = (_rss_kb('VmHWM') - baseline) / 1024
+    server.shutdown()
+    os.remove(output_path)
+    return cpu, peak
+
+
+def bench_decode(args):
+    """CPU time and peak memory per image request, decoding per step vs. once"""
+    import multiprocessing
+    import os
+    import tempfile
+    import cv2
+    from concurrent.futures import ProcessPoolExecutor
+
+    print(f"🏁 Decode benchmark ({args.width}x{args.height}, {args.repeats} requests per run)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext in ('jpg', 'png'):
+            path = os.path.join(tmp, f"photo.{ext}")
+            cv2.imwrite(path, synthetic_photo(args.width, args.height))
+            for label, shared in (('per step', False), ('shared', True)):
+                # A fresh process per run so peak RSS is not inherited from the previous one
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    cpu, peak = pool.submit(_measure_request, path, shared, args.repeats).result()
+                print(f"   {ext:>4} {label:>9}: {cpu * 1000:7.0f} ms CPU/request, peak +{peak:6.0f} MB")
+
+
+def bench_render(args):
+    """Milliseconds per 1080p frame to draw tracked boxes and labels: rendering.py vs. cv2 vs. PIL"""
+    import cv2
+    from PIL import Image, ImageDraw, ImageFont
+    from rendering import FONT_PATH, draw_box, draw_label
+
+    frame = synthetic_photo(1920, 1080)
+
+    def draw_rendering(image, boxes):
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            draw_box(image, x1, y1, x2, y2, (0, 255, 255), 2)
+            draw_label(image, x1, y1 - 18, f"ID:{i} car", (0, 255, 255), size=13)
+
+    def draw_cv2(image, boxes):
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            cv2.rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 255), 2)
+            cv2.putText(image, f"ID:{i} car", (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+
+    def draw_pil(image, boxes):
+        # The old draw_detections path: wrap, reload the font, draw, copy back
+        img = Image.fromarray(image)
+        draw = ImageDraw.Draw(img)
+        font = ImageFont.truetype(FONT_PATH, 16)
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            draw.rectangle([x1, y1, x2, y2], outline=(0, 255, 255), width=3)
+            draw.text((x1, y1 - 20), f"ID:{i} car", fill=(0, 255, 255), font=font)
+        image[:] = np.asarray(img)
+
+    variants = [('rendering', draw_rendering), ('cv2', draw_cv2), ('PIL', draw_pil)]
+    print(f"🏁 Render benchmark (1920x1080, {args.frames} frames per run)")
+    print(f"{'boxes':>6} | " + " | ".join(f"{label:>12}" for label, _ in variants))
+    for num_objects in args.objects:
+        scene = synthetic_scene(num_objects, args.frames)
+        timings = []
+        for _, draw in variants:
+            start = time.perf_counter()
+            for detections in scene:
+                draw(frame.copy(), [det[:4] for det in detections])
+            elapsed = time.perf_counter() - start
+            timings.append(f"{elapsed / len(scene) * 1000:9.2f} ms")
+        print(f"{num_objects:>6} | " + " | ".join(timings))
+
+
+def bench_encode(args):
+    """Encode time and output size of an annotated image for several output encodings"""
+    import os
+    import tempfile
+    from rendering import DEFAULT_ENCODING, save_image
+
+    frame = synthetic_photo(args.width, args.height)
+    variants = [
+        ('JPEG q95 (old default)', dict(quality=95)),
+        ('JPEG q85', dict(quality=85)),
+        ('JPEG q85 progressive', dict(quality=85, progressive=True)),
+        ('JPEG q85 max 1920', dict(quality=85, max_side=1920)),
+        ('WebP q80', dict(format='webp', quality=80)),
+        ('WebP q80 max 1920', dict(format='webp', quality=80, max_side=1920)),
+        ('PNG', dict(format='png')),
+        ('JPEG q85 + thumbnail', dict(quality=85, thumbnail_side=320)),
+    ]
+    print(f"🏁 Encode benchmark ({args.width}x{args.height}, best of {args.repeats})")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, options in variants:
+            encoding = dict(DEFAULT_ENCODING, **options)
+            output_path = os.path.join(tmp, 'output.' + encoding['format'])
+            stats = min((save_image(frame, output_path, encoding) for _ in range(args.repeats)),
+                        key=lambda stats: stats['encode_time'])
+            print(f"   {label:>24}: {stats['encode_time'] * 1000:7.0f} ms, {stats['output_bytes'] / 1e6:6.2f} MB")
+
+
+def bench_persist(args):
+    """Time to store one image's detections: per-row ORM adds vs. bulk insert + per-class stats"""
+    import os
+    import random
+    import tempfile
+    from flask import Flask
+    from database import save_detections
+    from models import db, ProcessingJob, Detection, ObjectClass
+
+    def per_row(job_id, detections):
+        # The previous run_prediction path: one ORM object and one stats read-modify-write per detection
+        for det in detections:
+            db.session.add(Detection(job_id=job_id, class_name=det['class_name'], confidence=det['confidence'],
+                                     bbox_x1=det['bbox']['x1'], bbox_y1=det['bbox']['y1'],
+                                     bbox_x2=det['bbox']['x2'], bbox_y2=det['bbox']['y2']))
+            ObjectClass.update_class_stats(det['class_name'], det['confidence'])
+
+    rng = random.Random(0)
+    class_names = ['person', 'car', 'bicycle', 'bus', 'truck', 'dog', 'traffic light', 'bench']
+    print(f"🏁 Detection persistence benchmark (SQLite file, {args.jobs} images per run)")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            for count in args.objects:
+                images = [[{
+                    'class_name': rng.choice(class_names),
+                    'confidence': rng.uniform(0.25, 1.0),
+                    'bbox': {'x1': 10.0, 'y1': 20.0, 'x2': 110.0, 'y2': 220.0}
+                } for _ in range(count)] for _ in range(args.jobs)]
+                timings = {}
+                for label, store in (('per-row ORM', per_row), ('bulk', save_detections)):
+                    jobs = [ProcessingJob(filename='bench.jpg', file_type='image', status='processing')
+                            for _ in images]
+                    db.session.add_all(jobs)
+                    db.session.commit()
+                    start = time.perf_counter()
+                    for job, detections in zip(jobs, images):
+                        store(job.id, detections)
+                        db.session.commit()
+                    timings[label] = (time.perf_counter() - start) / len(images)
+                print(f"   {count:4d} detections: per-row {timings['per-row ORM'] * 1000:7.1f} ms/image, "
+                      f"bulk {timings['bulk'] * 1000:6.1f} ms/image "
+                      f"({timings['per-row ORM'] / timings['bulk']:.1f}x)")
+
+
+def bench_stats(args):
+    """get_database_stats latency as job history grows, vs. the previous full-scan queries"""
+    import os
+    import random
+    import tempfile
+    from datetime import datetime
+    from flask import Flask
+    from database import get_database_stats, rebuild_stat_counters
+    from models import db, ProcessingJob
+
+    def full_scan():
+        # The previous implementation: one count() per status plus every completed job loaded to average
+        status_counts = {status: ProcessingJob.query.filter_by(status=status).count()
+                         for status in ['pending', 'processing', 'completed', 'failed']}
+        completed_jobs = ProcessingJob.query.filter(
+            ProcessingJob.status == 'completed',
+            ProcessingJob.processing_time.isnot(None)
+        ).all()
+        total_time = sum(job.processing_time for job in completed_jobs)
+        db.session.expunge_all()
+        return status_counts, total_time, ProcessingJob.query.count()
+
+    def timed(fn):
+        best = float('inf')
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    rng = random.Random(0)
+    print(f"🏁 Dashboard stats benchmark (SQLite file, best of {args.repeats})")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            total = 0
+            for size in sorted(args.history):
+                # Core inserts bypass the counter hooks; rebuild_stat_counters() catches up below
+                now = datetime.utcnow()
+                while total < size:
+                    batch = min(50000, size - total)
+                    db.session.execute(db.insert(ProcessingJob), [{
+                        'filename': 'bench.jpg',
+                        'file_type': 'image',
+                        'status': 'completed' if rng.random() < 0.9 else 'failed',
+                        'processing_time': rng.lognormvariate(0, 1),
+                        'created_at': now
+                    } for _ in range(batch)])
+                    total += batch
+                rebuild_stat_counters()
+                db.session.commit()
+                incremental = timed(get_database_stats)
+                line = f"   {size:>9,} jobs: counters {incremental * 1000:7.2f} ms"
+                if size <= args.max_scan:
+                    line += f", full scan {timed(full_scan) * 1000:9.1f} ms"
+                print(line)
+
+
+def bench_api(args):
+    """Load test of the read-only stats endpoints: requests/sec without cache, cached, and revalidated (304)"""
+    import threading
+    import requests
+    from werkzeug.serving import make_server
+    import app as appmod
+
+    with appmod.app.app_context():
+        appmod.db.create_all()
+    server = make_server('127.0.0.1', 0, appmod.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    def load(path, revalidate):
+        counts = []
+        deadline = time.perf_counter() + args.duration
+
+        def client():
+            session = requests.Session()
+            headers = {}
+            if revalidate:
+                headers['If-None-Match'] = session.get(base_url + path).headers.get('ETag', '')
+            done = 0
+            while time.perf_counter() < deadline:
+                response = session.get(base_url + path, headers=headers)
+                assert response.status_code in (200, 304), response.status_code
+                done += 1
+            counts.append(done)
+
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(counts) / args.duration
+
+    print(f"🏁 Stats API load test ({args.clients} clients, {args.duration:g}s per run)")
+    ttl = appmod.response_cache.ttl or 5.0
+    try:
+        for path in ('/api/stats', '/api/classes', '/dashboard'):
+            appmod.response_cache.ttl = 0
+            uncached = load(path, revalidate=False)
+            appmod.response_cache.ttl = ttl
+            cached = load(path, revalidate=False)
+            not_modified = load(path, revalidate=True)
+            print(f"   {path:>13}: no cache {uncached:7.0f} req/s, cached {cached:7.0f} req/s, "
+                  f"304 {not_modified:7.0f} req/s")
+    finally:
+        server.shutdown()
+
+
+def bench_concurrency(args):
+    """Parallel uploads and dashboard reads against one SQLite file, per database profile"""
+    import os
+    import random
+    import tempfile
+    import threading
+    from datetime import datetime
+    from flask import Flask
+    from sqlalchemy.exc import OperationalError
+    from database import DATABASE_PROFILES, create_database_config, get_database_stats, save_detections
+    from models import db, ProcessingJob, SystemStats
+
+    class_names = ['person', 'car', 'bicycle', 'bus', 'truck', 'dog', 'traffic light', 'bench']
+
+    def upload(rng):
+        # What one image upload writes: the pending job, its detections, then the completed job
+        job = ProcessingJob(filename='bench.jpg', file_type='image', status='pending')
+        db.session.add(job)
+        db.session.commit()
+        save_detections(job.id, [{
+            'class_name': rng.choice(class_names),
+            'confidence': rng.uniform(0.25, 1.0),
+            'bbox': {'x1': 10.0, 'y1': 20.0, 'x2': 110.0, 'y2': 220.0}
+        } for _ in range(args.objects[0])])
+        db.session.commit()
+        job.status = 'completed'
+        job.completed_at = datetime.utcnow()
+        job.processing_time = rng.uniform(0.1, 2.0)
+        db.session.commit()
+
+    def run(app, work, seed, results):
+        rng = random.Random(seed)
+        latencies, errors = [], 0
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            with app.app_context():
+                try:
+                    work(rng)
+                    latencies.append(time.perf_counter() - start)
+                except OperationalError:
+                    # "database is locked"
+                    db.session.rollback()
+                    errors += 1
+        results.append((latencies, errors))
+
+    def summary(results):
+        latencies = sorted(latency for worker, _ in results for latency in worker)
+        errors = sum(errors for _, errors in results)
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else float('nan')
+        return f"{len(latencies) / args.duration:6.0f}/s (p95 {p95:6.1f} ms, {errors} locked)"
+
+    print(f"🏁 SQLite concurrency benchmark ({args.clients} uploaders, {args.clients} dashboard readers, "
+          f"{args.objects[0]} detections per upload, {args.duration:g}s per profile)")
+    # The production profile installs session hooks for the rest of the process, so it runs last
+    for profile in DATABASE_PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = Flask(__name__)
+            create_database_config(app, database_path=os.path.join(tmp, 'bench.db'), profile=profile)
+            with app.app_context():
+                db.create_all()
+                SystemStats.get_or_create_stats()
+            uploads, reads = [], []
+            threads = [threading.Thread(target=run, args=(app, upload, seed, uploads))
+                       for seed in range(args.clients)]
+            threads += [threading.Thread(target=run, args=(app, lambda rng: get_database_stats(), seed, reads))
+                        for seed in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+            print(f"   {profile:>10}: uploads {summary(uploads)}, dashboard reads {summary(reads)}")
+
+
+def bench_jobs(args):
+    """/api/jobs page latency by depth: OFFSET vs. keyset pagination, and without JOB_INDEXES"""
+    import os
+    import random
+    import tempfile
+    from datetime import datetime, timedelta
+    from flask import Flask
+    from database import JOB_INDEXES, encode_job_cursor, get_jobs_page
+    from models import db, ProcessingJob
+
+    page = 20
+
+    def offset_page(offset, status=None):
+        # The classic LIMIT/OFFSET page: SQLite walks and discards `offset` rows first
+        query = ProcessingJob.query
+        if status is not None:
+            query = query.filter(ProcessingJob.status == status)
+        jobs = query.order_by(ProcessingJob.created_at.desc(), ProcessingJob.id.desc()).offset(offset).limit(page).all()
+        db.session.expunge_all()
+        return jobs
+
+    def timed(fn):
+        best = float('inf')
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    rng = random.Random(0)
+    print(f"🏁 Job listing benchmark ({page} jobs per page, SQLite file, best of {args.repeats})")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            total = 0
+            start_time = datetime(2024, 1, 1)
+            for size in sorted(args.history):
+                while total < size:
+                    batch = min(50000, size - total)
+                    db.session.execute(db.insert(ProcessingJob), [{
+                        'filename': 'bench.jpg',
+                        'file_type': 'image',
+                        'status': 'completed' if rng.random() < 0.9 else 'failed',
+                        'created_at': start_time + timedelta(seconds=total + i)
+                    } for i in range(batch)])
+                    total += batch
+                db.session.commit()
+                # The job just before the last page, as a client paging through would hold its cursor
+                last = ProcessingJob.query.order_by(ProcessingJob.created_at, ProcessingJob.id).offset(page).first()
+                cursor = encode_job_cursor(last)
+                db.session.expunge_all()
+
+                def keyset_page():
+                    get_jobs_page(page, cursor=cursor, session=db.session)
+                    db.session.expunge_all()
+
+                deep = size - page
+                line = (f"   {size:>9,} jobs, last page: OFFSET {timed(lambda: offset_page(deep)):8.2f} ms, "
+                        f"keyset {timed(keyset_page):6.2f} ms; first failed page: "
+                        f"indexed {timed(lambda: offset_page(0, 'failed')):6.2f} ms")
+                for index in JOB_INDEXES:
+                    index.drop(db.engine)
+                line += f", no index {timed(lambda: offset_page(0, 'failed')):8.2f} ms"
+                for index in JOB_INDEXES:
+                    index.create(db.engine)
+                print(line)
+
+
+def _measure_export(database_path, variant, output_path):
+    """Child process: seconds and peak RSS growth in MB to export the database one way"""
+    import json
+    from flask import Flask
+    from data_export import stream_export
+    from models import db, ProcessingJob, Detection, SystemStats, ObjectClass
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{database_path}"
+    db.init_app(app)
+    if ' ' in variant:
+        # pyarrow itself takes ~50 MB once imported; only count what the export allocates
+        import pyarrow.parquet  # noqa: F401
+    with app.app_context():
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        baseline = _rss_kb('VmRSS')
+        start = time.perf_counter()
+        if variant == 'in-memory json':
+            # The previous export_database_data: every row and its dict in memory, then one json.dump
+            system_stats = SystemStats.query.first()
+            export_data = {
+                'processing_jobs': [job.to_dict() for job in ProcessingJob.query.all()],
+                'detections': [detection.to_dict() for detection in Detection.query.all()],
+                'system_stats': system_stats.to_dict() if system_stats else None,
+                'object_classes': [obj_class.to_dict() for obj_class in ObjectClass.query.all()]
+            }
+            with open(output_path, 'w') as f:
+                json.dump(export_data, f, indent=2)
+        else:
+            export_format, _, table = variant.partition(' ')
+            with open(output_path, 'wb') as f:
+                for chunk in stream_export(db.session, export_format, table or None):
+                    f.write(chunk)
+        elapsed = time.perf_counter() - start
+        peak = (_rss_kb('VmHWM') - baseline) / 1024
+    return elapsed, peak
+
+
+def bench_export(args):
+    """Database export time, size and peak memory: in-memory JSON vs. the streaming formats"""
+    import multiprocessing
+    import os
+    import random
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+    from flask import Flask
+    from data_export import columnar_available
+    from models import db, ProcessingJob, Detection, SystemStats
+
+    rng = random.Random(0)
+    class_names = ['person', 'car', 'bicycle', 'bus', 'truck', 'dog', 'traffic light', 'bench']
+    print(f"🏁 Export benchmark ({args.detections:,} detections, SQLite file)")
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, 'bench.db')
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{database_path}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            SystemStats.get_or_create_stats()
+            jobs = args.detections // 100 or 1
+            db.session.execute(db.insert(ProcessingJob), [
+                {'filename': f'{i}.jpg', 'file_type': 'image', 'status': 'completed'} for i in range(jobs)])
+            for offset in range(0, args.detections, 50000):
+                db.session.execute(db.insert(Detection), [{
+                    'job_id': (offset + i) % jobs + 1,
+                    'class_name': rng.choice(class_names),
+                    'confidence': rng.uniform(0.25, 1.0),
+                    'bbox_x1': 10.0, 'bbox_y1': 20.0, 'bbox_x2': 110.0, 'bbox_y2': 220.0
+                } for i in range(min(50000, args.detections - offset))])
+            db.session.commit()
+
+        variants = ['in-memory json', 'ndjson', 'ndjson.gz']
+        if columnar_available():
+            variants += ['parquet detections', 'arrow detections']
+        else:
+            print("   (pyarrow not installed: skipping parquet and arrow)")
+        for variant in variants:
+            output_path = os.path.join(tmp, 'export.out')
+            # A fresh process per run so peak RSS is not inherited from the previous one
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                elapsed, peak = pool.submit(_measure_export, database_path, variant, output_path).result()
+            size = os.path.getsize(output_path) / 1e6
+            print(f"   {variant:>18}: {elapsed:6.2f} s, {size:7.1f} MB written, peak +{peak:7.1f} MB")
+            os.remove(output_path)
+
+
+BENCHMARKS = {
+    'tracking': bench_tracking,
+    'inference': bench_inference,
+    'hosted': bench_hosted,
+    'upload': bench_upload,
+    'decode': bench_decode,
+    'render': bench_render,
+    'encode': bench_encode,
+    'persist': bench_persist,
+    'stats': bench_stats,
+    'api': bench_api,
+    'concurrency': bench_concurrency,
+    'jobs': bench_jobs,
+    'export': bench_export,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run performance benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS), help='Benchmark to run')
+    parser.add_argument('--frames', type=int, default=100, help='Frames per tracking run')
+    parser.add_argument('--objects', type=int, nargs='+', default=[10, 20, 40, 80, 160],
+                        help='Object counts to sweep for the tracking, render and persist benchmarks')
+    parser.add_argument('--model', default='yolov8s.pt', help='YOLO weights for the inference benchmark')
+    parser.add_argument('--video', help='Video to decode frames from (synthetic 720p frames otherwise)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16],
+                        help='Batch sizes to sweep for the inference benchmark')
+    parser.add_argument('--images', type=int, default=200, help='Images sent by the hosted client benchmark')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub server latency in seconds')
+    parser.add_argument('--in-flight', type=int, nargs='+', default=[1, 4, 8, 16],
+                        help='Concurrent request limits to sweep for the hosted client benchmark')
+    parser.add_argument('--bandwidth', type=float, default=5e6, help='Simulated upload speed in bytes/sec')
+    parser.add_argument('--width', type=int, default=4000, help='Image width for the upload, decode and encode benchmarks')
+    parser.add_argument('--height', type=int, default=3000, help='Image height for the upload, decode and encode benchmarks')
+    parser.add_argument('--jobs', type=int, default=20, help='Images stored per run for the persist benchmark')
+    parser.add_argument('--history', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='Job history sizes to sweep for the stats and jobs benchmarks')
+    parser.add_argument('--max-scan', type=int, default=100000,
+                        help='Largest history the stats benchmark also times the old full-scan queries on')
+    parser.add_argument('--detections', type=int, default=1000000, help='Detections in the database for the export benchmark')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='Concurrent clients for the api load test, uploaders and readers for concurrency')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Seconds per endpoint and mode for the api load test, per profile for concurrency')
+    parser.add_argument('--repeats', type=int, default=5, help='Requests per run for the decode benchmark, attempts for encode, stats and jobs')
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
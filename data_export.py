@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Streaming export of the detection database
+Tables are read in batches with yield_per and handed on as encoded chunks as
+soon as each batch is ready, so memory use stays flat however many jobs and
+detections there are. Records are written as NDJSON (optionally gzipped) or,
+when pyarrow is installed, one table at a time as Parquet or an Arrow IPC stream.
+"""
+import io
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import inspect, select
+
+from database import JobOutput, JobUpload, TrackBox, LineCrossing
+from models import ProcessingJob, Detection, SystemStats, ObjectClass
+
+# Exported tables in output order, keyed by their name in the export
+EXPORT_TABLES = {
+    'processing_jobs': ProcessingJob,
+    'detections': Detection,
+    'system_stats': SystemStats,
+    'object_classes': ObjectClass,
+    'job_outputs': JobOutput,
+    'job_uploads': JobUpload,
+    'track_boxes': TrackBox,
+    'line_crossings': LineCrossing,
+}
+# NDJSON records of these hold the raw columns: their to_dict() shapes API responses and leaves out
+# the ids, and track_boxes can run to millions of rows that are cheaper to read without the ORM
+COLUMN_RECORD_TABLES = ('job_outputs', 'job_uploads', 'track_boxes', 'line_crossings')
+# 'ndjson' variants hold every table; the columnar formats need pyarrow and export one table
+ROW_FORMATS = ('ndjson', 'ndjson.gz')
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+EXPORT_FORMATS = ROW_FORMATS + COLUMNAR_FORMATS
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'ndjson.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+# Rows fetched per round trip for NDJSON; columnar batches are also the Parquet row groups
+NDJSON_BATCH_SIZE = 1000
+COLUMNAR_BATCH_SIZE = 10000
+
+
+def columnar_available():
+    """Whether pyarrow is installed, i.e. 'parquet' and 'arrow' exports work"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def export_filename(export_format, table=None, timestamp=None):
+    """Default file name of an export, e.g. object_detection_export_20240101_120000.ndjson.gz"""
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    suffix = f"_{table}" if table else ''
+    return f"object_detection_export_{timestamp}{suffix}.{export_format}"
+
+
+def stream_export(session, export_format='ndjson', table=None, batch_size=None):
+    """Yield the export as bytes chunks.
+
+    For NDJSON, `table` limits the export to one table (all tables otherwise);
+    the columnar formats require it. Raises ValueError for an unknown format or
+    table and ImportError for a columnar format without pyarrow, before any
+    rows are read.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}', expected one of {EXPORT_FORMATS}")
+    if table is not None and table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}', expected one of {tuple(EXPORT_TABLES)}")
+    if export_format in COLUMNAR_FORMATS:
+        if table is None:
+            raise ValueError(f"A {export_format} export holds one table: pass one of {tuple(EXPORT_TABLES)}")
+        if not columnar_available():
+            raise ImportError(f"{export_format} export needs pyarrow: pip install pyarrow")
+        return _columnar_chunks(session, export_format, table, batch_size or COLUMNAR_BATCH_SIZE)
+    chunks = _ndjson_chunks(session, [table] if table else list(EXPORT_TABLES), batch_size or NDJSON_BATCH_SIZE)
+    return _gzip_chunks(chunks) if export_format == 'ndjson.gz' else chunks
+
+
+def _ndjson_chunks(session, tables, batch_size):
+    """One header line, then {"table": ..., "record": ...} per row; one chunk per batch"""
+    header = {'export_timestamp': datetime.utcnow().isoformat(), 'tables': tables}
+    yield (json.dumps(header) + '\n').encode()
+    for table in tables:
+        for records in _record_batches(session, table, batch_size):
+            yield ''.join(json.dumps({'table': table, 'record': record}, default=str) + '\n'
+                          for record in records).encode()
+
+
+def _record_batches(session, table, batch_size):
+    """Lists of row dicts in primary key order: to_dict(), or the columns for COLUMN_RECORD_TABLES"""
+    model = EXPORT_TABLES[table]
+    order = inspect(model).primary_key
+    if table in COLUMN_RECORD_TABLES:
+        query = select(*model.__table__.columns).order_by(*order).execution_options(yield_per=batch_size)
+        for rows in session.execute(query).partitions():
+            yield [row._asdict() for row in rows]
+        return
+    query = select(model).order_by(*order).execution_options(yield_per=batch_size)
+    # Rows are only weakly referenced by the session, so each batch is freed once encoded
+    for rows in session.execute(query).scalars().partitions():
+        yield [row.to_dict() for row in rows]
+
+
+def _gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that keeps what pyarrow writes until take() hands it on"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_type(pa, column):
+    """Arrow type for a table column, from the Python type SQLAlchemy maps it to"""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return pa.string()
+    return {
+        bool: pa.bool_(),
+        int: pa.int64(),
+        float: pa.float64(),
+        datetime: pa.timestamp('us'),
+    }.get(python_type, pa.string())
+
+
+def _columnar_chunks(session, export_format, table, batch_size):
+    """The raw columns of one table as Parquet (one row group per batch) or an Arrow IPC stream"""
+    import pyarrow as pa
+
+    model = EXPORT_TABLES[table]
+    columns = list(model.__table__.columns)
+    schema = pa.schema([pa.field(column.name, _arrow_type(pa, column)) for column in columns])
+    sink = _ChunkSink()
+    if export_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    query = select(*columns).order_by(*inspect(model).primary_key).execution_options(yield_per=batch_size)
+    for rows in session.execute(query).partitions():
+        values = list(zip(*rows))
+        writer.write_batch(pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(values, schema)], schema=schema))
+        yield sink.take()
+    # Parquet footer / Arrow end-of-stream marker
+    writer.close()
+    yield sink.take()
@@ -2,18 +2,413 @@
 """
 Database configuration and utilities for Object Detection System
 """
+import base64
+import binascii
 import os
-from flask import Flask
+import threading
+import time
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import case, create_engine, event, exc, inspect, tuple_
+from sqlalchemy.orm import scoped_session, sessionmaker
 from models import db, ProcessingJob, Detection, SystemStats, ObjectClass
+from datetime import datetime
 
-def create_database_config(app):
-    """Configure database for the Flask app"""
+class JobOutput(db.Model):
+    """Encoding settings and cost of the rendered output image of a job"""
+    __tablename__ = 'job_output'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey(ProcessingJob.id), nullable=False, index=True)
+    format = db.Column(db.String(10), nullable=False)
+    quality = db.Column(db.Integer)
+    progressive = db.Column(db.Boolean, default=False)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    encode_time = db.Column(db.Float)
+    output_bytes = db.Column(db.Integer)
+    thumbnail_filename = db.Column(db.String(255))
+    thumbnail_bytes = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def from_stats(cls, job_id, stats):
+        """Build a row from rendering.save_image stats"""
+        return cls(job_id=job_id, **{key: stats.get(key) for key in (
+            'format', 'quality', 'progressive', 'width', 'height', 'encode_time',
+            'output_bytes', 'thumbnail_filename', 'thumbnail_bytes')})
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'format': self.format,
+            'quality': self.quality,
+            'progressive': self.progressive,
+            'width': self.width,
+            'height': self.height,
+            'encode_time': self.encode_time,
+            'output_bytes': self.output_bytes,
+            'thumbnail_filename': self.thumbnail_filename,
+            'thumbnail_bytes': self.thumbnail_bytes
+        }
+
+class JobUpload(db.Model):
+    """What the hosted detector was sent for an image job: encoding and bytes saved"""
+    __tablename__ = 'job_upload'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey(ProcessingJob.id), nullable=False, index=True)
+    format = db.Column(db.String(10), nullable=False)  # upload format, or 'original'
+    original_bytes = db.Column(db.Integer)
+    sent_bytes = db.Column(db.Integer)
+    original_width = db.Column(db.Integer)
+    original_height = db.Column(db.Integer)
+    sent_width = db.Column(db.Integer)
+    sent_height = db.Column(db.Integer)
+    encode_time = db.Column(db.Float)
+    request_time = db.Column(db.Float)
+    
+    @classmethod
+    def from_stats(cls, job_id, upload):
+        """Build a row from the 'upload' metadata of HostedObjectDetector results"""
+        original_width, original_height = upload['original_size']
+        sent_width, sent_height = upload['sent_size']
+        return cls(job_id=job_id, format=upload['format'],
+                   original_bytes=upload['original_bytes'], sent_bytes=upload['sent_bytes'],
+                   original_width=original_width, original_height=original_height,
+                   sent_width=sent_width, sent_height=sent_height,
+                   encode_time=upload.get('encode_time'), request_time=upload.get('request_time'))
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'format': self.format,
+            'original_bytes': self.original_bytes,
+            'sent_bytes': self.sent_bytes,
+            'bytes_saved': (self.original_bytes or 0) - (self.sent_bytes or 0),
+            'original_size': [self.original_width, self.original_height],
+            'sent_size': [self.sent_width, self.sent_height],
+            'encode_time': self.encode_time,
+            'request_time': self.request_time
+        }
+
+class TrackBox(db.Model):
+    """Box of one tracked object in one frame of a video job"""
+    __tablename__ = 'track_box'
+    # /api/job/<id>/tracks reads a frame window of one job in (frame_index, track_id) order
+    __table_args__ = (db.Index('ix_track_box_job_frame_track', 'job_id', 'frame_index', 'track_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey(ProcessingJob.id), nullable=False)
+    frame_index = db.Column(db.Integer, nullable=False)
+    track_id = db.Column(db.Integer, nullable=False)
+    class_name = db.Column(db.String(100))
+    bbox_x1 = db.Column(db.Float)
+    bbox_y1 = db.Column(db.Float)
+    bbox_x2 = db.Column(db.Float)
+    bbox_y2 = db.Column(db.Float)
+    
+    def to_dict(self):
+        return {
+            'frame_index': self.frame_index,
+            'track_id': self.track_id,
+            'class_name': self.class_name,
+            'bbox': {'x1': self.bbox_x1, 'y1': self.bbox_y1, 'x2': self.bbox_x2, 'y2': self.bbox_y2}
+        }
+
+class LineCrossing(db.Model):
+    """A tracked object crossing the counting line of a video job"""
+    __tablename__ = 'line_crossing'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey(ProcessingJob.id), nullable=False, index=True)
+    frame_index = db.Column(db.Integer, nullable=False)
+    track_id = db.Column(db.Integer, nullable=False)
+    class_name = db.Column(db.String(100))
+    direction = db.Column(db.String(4), nullable=False)  # 'up' or 'down'
+    
+    def to_dict(self):
+        return {
+            'frame_index': self.frame_index,
+            'track_id': self.track_id,
+            'class_name': self.class_name,
+            'direction': self.direction
+        }
+
+class StatCounter(db.Model):
+    """Named running total behind the dashboard statistics (see get_database_stats)"""
+    __tablename__ = 'stat_counter'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0)
+
+# Secondary indexes on the tables of models.py: job listings newest-first, optionally per status,
+# and the detections of one job. SQLite appends the rowid (id) to every index entry, so
+# (created_at) also serves the (created_at, id) keyset order of get_jobs_page()
+JOB_INDEXES = (
+    db.Index('ix_processing_job_created_at', ProcessingJob.created_at),
+    db.Index('ix_processing_job_status_created_at', ProcessingJob.status, ProcessingJob.created_at),
+    db.Index('ix_detection_job_id_class_name', Detection.job_id, Detection.class_name),
+)
+
+def ensure_indexes():
+    """Create any declared index an existing database lacks (create_all skips existing tables)"""
+    created = []
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
+# Upper bounds in seconds of the processing time histogram buckets; slower jobs land in 'inf'
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+def latency_bucket(seconds):
+    """Histogram bucket label ('0.5', '10', ..., 'inf') for a processing time"""
+    for bound in LATENCY_BUCKETS:
+        if seconds <= bound:
+            return f'{bound:g}'
+    return 'inf'
+
+def _job_counters(status, file_type, processing_time):
+    """Counter contributions of one ProcessingJob in the given state"""
+    counters = {'jobs.total': 1, f'jobs.status.{status}': 1}
+    if status == 'completed' and processing_time is not None:
+        prefix = f'latency.{file_type}'
+        counters[f'{prefix}.count'] = 1
+        counters[f'{prefix}.sum'] = processing_time
+        counters[f'{prefix}.le_{latency_bucket(processing_time)}'] = 1
+    return counters
+
+def _output_counters(output):
+    """Counter contributions of one JobOutput row"""
+    prefix = f'output.{output.format}'
+    return {
+        f'{prefix}.count': 1,
+        f'{prefix}.encode_time_sum': output.encode_time or 0,
+        f'{prefix}.bytes_sum': output.output_bytes or 0
+    }
+
+def _upload_counters(upload):
+    """Counter contributions of one JobUpload row"""
+    return {
+        'upload.count': 1,
+        'upload.original_bytes_sum': upload.original_bytes or 0,
+        'upload.sent_bytes_sum': upload.sent_bytes or 0
+    }
+
+def _add_counters(deltas, counters, sign=1):
+    for name, value in counters.items():
+        deltas[name] = deltas.get(name, 0) + sign * value
+
+def increment_counters(connection, deltas):
+    """Add `deltas` (name -> amount) to the stat counters in the current transaction"""
+    table = StatCounter.__table__
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        result = connection.execute(
+            table.update().where(table.c.name == name).values(value=table.c.value + delta))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, value=delta))
+
+def _previous(obj, attribute):
+    """Value of `attribute` before the pending flush"""
+    history = inspect(obj).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        # Newly set on an attribute whose old value was never loaded
+        return None
+    return getattr(obj, attribute)
+
+@event.listens_for(ProcessingJob.status, 'set', active_history=True)
+@event.listens_for(ProcessingJob.processing_time, 'set', active_history=True)
+def _load_previous_value(target, value, oldvalue, initiator):
+    # active_history makes the ORM load the old value on assignment, so _previous() can see it
+    pass
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_counter_deltas(session, flush_context, instances):
+    """Turn job and output changes in this flush into counter deltas, applied in after_flush"""
+    # A fresh dict each flush: deltas of a flush that failed are never applied
+    deltas = session.info['stat_counter_deltas'] = {}
+    for obj in session.new:
+        if isinstance(obj, ProcessingJob):
+            _add_counters(deltas, _job_counters(obj.status or 'pending', obj.file_type, obj.processing_time))
+        elif isinstance(obj, JobOutput):
+            _add_counters(deltas, _output_counters(obj))
+        elif isinstance(obj, JobUpload):
+            _add_counters(deltas, _upload_counters(obj))
+    for obj in session.dirty:
+        if isinstance(obj, ProcessingJob) and session.is_modified(obj):
+            _add_counters(deltas, _job_counters(
+                _previous(obj, 'status'), obj.file_type, _previous(obj, 'processing_time')), -1)
+            _add_counters(deltas, _job_counters(obj.status, obj.file_type, obj.processing_time))
+    for obj in session.deleted:
+        if isinstance(obj, ProcessingJob):
+            _add_counters(deltas, _job_counters(
+                _previous(obj, 'status'), obj.file_type, _previous(obj, 'processing_time')), -1)
+        elif isinstance(obj, JobOutput):
+            _add_counters(deltas, _output_counters(obj), -1)
+        elif isinstance(obj, JobUpload):
+            _add_counters(deltas, _upload_counters(obj), -1)
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_counter_deltas(session, flush_context):
+    deltas = session.info.pop('stat_counter_deltas', None)
+    if deltas:
+        increment_counters(session.connection(), deltas)
+
+def rebuild_stat_counters():
+    """Recompute every stat counter from the tables, e.g. for a database that predates them.
+    
+    Each table is read with one grouped query; the caller commits.
+    """
+    counters = {}
+    bucket = case(
+        *[(ProcessingJob.processing_time <= bound, f'{bound:g}') for bound in LATENCY_BUCKETS],
+        else_='inf'
+    )
+    rows = db.session.query(
+        ProcessingJob.status,
+        ProcessingJob.file_type,
+        bucket,
+        db.func.count(ProcessingJob.id),
+        db.func.count(ProcessingJob.processing_time),
+        db.func.sum(ProcessingJob.processing_time)
+    ).group_by(ProcessingJob.status, ProcessingJob.file_type, bucket).all()
+    for status, file_type, label, count, timed, time_sum in rows:
+        _add_counters(counters, {'jobs.total': count, f'jobs.status.{status}': count})
+        if status == 'completed' and timed:
+            prefix = f'latency.{file_type}'
+            _add_counters(counters, {f'{prefix}.count': timed, f'{prefix}.sum': time_sum,
+                                     f'{prefix}.le_{label}': timed})
+    
+    rows = db.session.query(
+        JobOutput.format,
+        db.func.count(JobOutput.id),
+        db.func.sum(JobOutput.encode_time),
+        db.func.sum(JobOutput.output_bytes)
+    ).group_by(JobOutput.format).all()
+    for fmt, count, encode_time_sum, bytes_sum in rows:
+        _add_counters(counters, {f'output.{fmt}.count': count,
+                                 f'output.{fmt}.encode_time_sum': encode_time_sum or 0,
+                                 f'output.{fmt}.bytes_sum': bytes_sum or 0})
+    
+    count, original_bytes_sum, sent_bytes_sum = db.session.query(
+        db.func.count(JobUpload.id),
+        db.func.sum(JobUpload.original_bytes),
+        db.func.sum(JobUpload.sent_bytes)
+    ).one()
+    if count:
+        _add_counters(counters, {'upload.count': count,
+                                 'upload.original_bytes_sum': original_bytes_sum or 0,
+                                 'upload.sent_bytes_sum': sent_bytes_sum or 0})
+    
+    counters['tracks.boxes'] = db.session.query(db.func.count(TrackBox.id)).scalar()
+    for direction, count in db.session.query(
+            LineCrossing.direction, db.func.count(LineCrossing.id)).group_by(LineCrossing.direction):
+        counters[f'tracks.crossings.{direction}'] = count
+    
+    StatCounter.query.delete()
+    db.session.add_all(StatCounter(name=name, value=value) for name, value in counters.items())
+    return counters
+
+# Connection settings of the 'production' profile. WAL lets readers run while a write
+# is in progress, and with WAL synchronous=NORMAL only risks the last commits on power loss
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative: KiB, i.e. 64 MiB per connection
+    'temp_store': 'MEMORY',
+    'busy_timeout': 30000,  # ms a connection waits for a lock before "database is locked"
+}
+DATABASE_PROFILES = ('default', 'production')
+# Connections in the read-only pool used by dashboard and API reads
+READ_POOL_SIZE = 8
+
+def _set_pragmas(pragmas):
+    """Engine 'connect' listener running PRAGMA statements on every new connection"""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return on_connect
+
+class SingleWriter:
+    """Lets one session at a time write to the database.
+    
+    SQLite has a single write lock; writers that find it taken sleep in the
+    busy handler and give up with "database is locked" when it times out. A
+    session takes the writer slot here when it first flushes or runs a bulk
+    INSERT/UPDATE/DELETE and hands it back when its transaction ends, so job
+    threads wait in line in-process instead of polling the file lock.
+    """
+    
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+        self.writes = 0
+        self.wait_time = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self, session):
+        if session.info.get('holds_writer'):
+            return
+        start = time.perf_counter()
+        if not self._lock.acquire(timeout=self.timeout):
+            raise exc.TimeoutError(f"Waited {self.timeout}s for the database writer")
+        session.info['holds_writer'] = True
+        self.writes += 1
+        self.wait_time += time.perf_counter() - start
+    
+    def release(self, session):
+        if session.info.pop('holds_writer', False):
+            self._lock.release()
+    
+    def install(self, session):
+        """Gate every session made by `session` (a sessionmaker or scoped_session)"""
+        @event.listens_for(session, 'before_flush')
+        def _before_flush(session, flush_context, instances):
+            self.acquire(session)
+        
+        @event.listens_for(session, 'do_orm_execute')
+        def _before_bulk_write(orm_execute_state):
+            if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+                self.acquire(orm_execute_state.session)
+        
+        @event.listens_for(session, 'after_transaction_end')
+        def _after_transaction_end(session, transaction):
+            if transaction.parent is None:
+                self.release(session)
+
+def get_read_session():
+    """Session for read-only queries: the read-only pool under the production profile, else db.session"""
+    return current_app.extensions.get('read_session') or db.session
+
+def create_database_config(app, database_path=None, profile=None):
+    """Configure database for the Flask app
+    
+    profile='production' (or DATABASE_PROFILE=production) turns on WAL and the
+    SQLITE_PRODUCTION_PRAGMAS on every connection, serialises writes through a
+    SingleWriter and gives readers their own pool of query_only connections.
+    """
+    profile = profile or os.environ.get('DATABASE_PROFILE', 'default')
+    if profile not in DATABASE_PROFILES:
+        raise ValueError(f"Unknown database profile '{profile}', expected one of {DATABASE_PROFILES}")
     
     # Database configuration
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    database_path = os.path.join(basedir, 'object_detection.db')
+    if database_path is None:
+        basedir = os.path.abspath(os.path.dirname(__file__))
+        database_path = os.path.join(basedir, 'object_detection.db')
     
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -22,10 +417,34 @@ def create_database_config(app):
         'pool_recycle': -1,
         'pool_pre_ping': True
     }
+    app.config['DATABASE_PROFILE'] = profile
+    if profile == 'production':
+        # Sessions keep their connection while queued for the writer, so a capped pool
+        # could leave the writer itself waiting for a connection. init_app() builds the
+        # engine from these options, so they must be complete before it runs
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow'] = -1
     
     # Initialize database
     db.init_app(app)
     
+    if profile == 'production':
+        pragmas = SQLITE_PRODUCTION_PRAGMAS
+        with app.app_context():
+            event.listen(db.engine, 'connect', _set_pragmas(pragmas))
+        writer = SingleWriter(timeout=pragmas['busy_timeout'] / 1000)
+        writer.install(db.session)
+        app.extensions['db_writer'] = writer
+        
+        # journal_mode is a property of the file, set by the first write connection
+        read_pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+        read_pragmas['query_only'] = 'ON'
+        read_engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], pool_size=READ_POOL_SIZE,
+                                    pool_timeout=20, pool_recycle=-1, pool_pre_ping=True)
+        event.listen(read_engine, 'connect', _set_pragmas(read_pragmas))
+        read_session = scoped_session(sessionmaker(bind=read_engine))
+        app.extensions['read_session'] = read_session
+        app.teardown_appcontext(lambda exception: read_session.remove())
+    
     # Initialize migration support
     migrate = Migrate(app, db)
     
@@ -38,9 +457,18 @@ def init_database(app):
             # Create all tables
             db.create_all()
             
+            # Tables created before an index was declared get it here
+            for name in ensure_indexes():
+                print(f"🗂️ Created index {name}")
+            
             # Create initial system stats if they don't exist
             stats = SystemStats.get_or_create_stats()
             
+            # Dashboard counters start from the existing history the first time
+            if StatCounter.query.first() is None:
+                rebuild_stat_counters()
+                db.session.commit()
+            
             print("✅ Database initialized successfully")
             print(f"📊 Database location: {app.config['SQLALCHEMY_DATABASE_URI']}")
             return True
@@ -49,34 +477,157 @@ def init_database(app):
             print(f"❌ Failed to initialize database: {e}")
             return False
 
+def save_detections(job_id, detections):
+    """Store a job's detections with one bulk INSERT and fold them into the per-class stats.
+    
+    Counts and confidence sums are aggregated per class first, so each class
+    costs one UPDATE (an INSERT the first time it is seen) instead of a
+    read-modify-write per detection. The caller commits.
+    """
+    if not detections:
+        return
+    
+    created_at = datetime.utcnow()
+    db.session.execute(db.insert(Detection), [{
+        'job_id': job_id,
+        'class_name': det['class_name'],
+        'confidence': det['confidence'],
+        'bbox_x1': det['bbox']['x1'],
+        'bbox_y1': det['bbox']['y1'],
+        'bbox_x2': det['bbox']['x2'],
+        'bbox_y2': det['bbox']['y2'],
+        'created_at': created_at
+    } for det in detections])
+    
+    # class_name -> [count, confidence sum]
+    totals = {}
+    for det in detections:
+        entry = totals.setdefault(det['class_name'], [0, 0.0])
+        entry[0] += 1
+        entry[1] += det['confidence']
+    
+    for class_name, (count, confidence_sum) in totals.items():
+        # The running average is folded in by the database, so concurrent jobs cannot lose updates;
+        # avg_confidence is set first because MySQL evaluates SET clauses left to right
+        updated = db.session.execute(
+            db.update(ObjectClass)
+            .where(ObjectClass.class_name == class_name)
+            .ordered_values(
+                (ObjectClass.avg_confidence,
+                 (ObjectClass.avg_confidence * ObjectClass.detection_count + confidence_sum)
+                 / (ObjectClass.detection_count + count)),
+                (ObjectClass.detection_count, ObjectClass.detection_count + count)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if updated.rowcount == 0:
+            db.session.add(ObjectClass(class_name=class_name, detection_count=count,
+                                       avg_confidence=confidence_sum / count))
+
+def save_track_chunk(job_id, chunk):
+    """Bulk insert one chunk of tracking output from video_workers; the caller commits.
+    
+    `chunk['boxes']` holds (frame, track_id, class_name, x1, y1, x2, y2) rows and
+    `chunk['crossings']` (frame, track_id, class_name, direction) rows.
+    """
+    if chunk['boxes']:
+        db.session.execute(db.insert(TrackBox), [{
+            'job_id': job_id,
+            'frame_index': frame_index,
+            'track_id': track_id,
+            'class_name': class_name,
+            'bbox_x1': x1,
+            'bbox_y1': y1,
+            'bbox_x2': x2,
+            'bbox_y2': y2
+        } for frame_index, track_id, class_name, x1, y1, x2, y2 in chunk['boxes']])
+    if chunk['crossings']:
+        db.session.execute(db.insert(LineCrossing), [{
+            'job_id': job_id,
+            'frame_index': frame_index,
+            'track_id': track_id,
+            'class_name': class_name,
+            'direction': direction
+        } for frame_index, track_id, class_name, direction in chunk['crossings']])
+    deltas = {'tracks.boxes': len(chunk['boxes'])}
+    for _, _, _, direction in chunk['crossings']:
+        deltas[f'tracks.crossings.{direction}'] = deltas.get(f'tracks.crossings.{direction}', 0) + 1
+    increment_counters(db.session.connection(), deltas)
+
 def get_database_stats():
-    """Get comprehensive database statistics"""
+    """Get comprehensive database statistics.
+    
+    Totals come from the stat counters kept up to date on every flush, so the
+    cost does not grow with the number of jobs.
+    """
     try:
+        session = get_read_session()
+        
         # Get system stats
-        system_stats = SystemStats.get_or_create_stats()
+        system_stats = session.query(SystemStats).first() or SystemStats.get_or_create_stats()
         
-        # Get recent jobs
-        recent_jobs = ProcessingJob.query.order_by(ProcessingJob.created_at.desc()).limit(10).all()
+        # Get recent jobs (ids increase with creation time, and the primary key is indexed)
+        recent_jobs = session.query(ProcessingJob).order_by(ProcessingJob.id.desc()).limit(10).all()
         
         # Get object class stats
-        object_classes = ObjectClass.query.order_by(ObjectClass.detection_count.desc()).all()
+        object_classes = session.query(ObjectClass).order_by(ObjectClass.detection_count.desc()).all()
+        
+        counters = dict(session.query(StatCounter.name, StatCounter.value).all())
+        
+        def counter(name):
+            return counters.get(name, 0)
         
         # Get processing status counts
         status_counts = {}
         for status in ['pending', 'processing', 'completed', 'failed']:
-            count = ProcessingJob.query.filter_by(status=status).count()
-            status_counts[status] = count
+            status_counts[status] = int(counter(f'jobs.status.{status}'))
+        
+        # Processing time per file type: count, average and histogram
+        latency = {}
+        for file_type in ('image', 'video'):
+            prefix = f'latency.{file_type}'
+            count = int(counter(f'{prefix}.count'))
+            latency[file_type] = {
+                'count': count,
+                'avg': round(counter(f'{prefix}.sum') / count, 3) if count else 0,
+                'histogram': {
+                    label: int(counter(f'{prefix}.le_{label}'))
+                    for label in [f'{bound:g}' for bound in LATENCY_BUCKETS] + ['inf']
+                }
+            }
         
         # Calculate average processing time
-        completed_jobs = ProcessingJob.query.filter(
-            ProcessingJob.status == 'completed',
-            ProcessingJob.processing_time.isnot(None)
-        ).all()
+        timed_jobs = sum(stats['count'] for stats in latency.values())
+        total_time = sum(counter(f'latency.{file_type}.sum') for file_type in latency)
+        avg_processing_time = total_time / timed_jobs if timed_jobs else 0
         
-        avg_processing_time = 0
-        if completed_jobs:
-            total_time = sum(job.processing_time for job in completed_jobs)
-            avg_processing_time = total_time / len(completed_jobs)
+        # Encode cost per output format, to tune quality against storage and latency
+        output_encoding = {}
+        for name in counters:
+            if name.startswith('output.') and name.endswith('.count') and counters[name]:
+                fmt = name[len('output.'):-len('.count')]
+                count = counters[name]
+                output_encoding[fmt] = {
+                    'count': int(count),
+                    'avg_encode_time': round(counter(f'output.{fmt}.encode_time_sum') / count, 4),
+                    'avg_output_bytes': int(counter(f'output.{fmt}.bytes_sum') / count)
+                }
+        
+        # Bytes sent to the hosted detector against the original uploads
+        upload_count = int(counter('upload.count'))
+        hosted_upload = {
+            'count': upload_count,
+            'avg_original_bytes': int(counter('upload.original_bytes_sum') / upload_count) if upload_count else 0,
+            'avg_sent_bytes': int(counter('upload.sent_bytes_sum') / upload_count) if upload_count else 0,
+            'bytes_saved': int(counter('upload.original_bytes_sum') - counter('upload.sent_bytes_sum'))
+        }
+        
+        # Line crossings recorded by video tracking, per direction
+        video_tracking = {
+            'track_boxes': int(counter('tracks.boxes')),
+            'up_count': int(counter('tracks.crossings.up')),
+            'down_count': int(counter('tracks.crossings.down'))
+        }
         
         return {
             'system_stats': system_stats.to_dict(),
@@ -84,13 +635,50 @@ def get_database_stats():
             'object_classes': [obj_class.to_dict() for obj_class in object_classes],
             'status_counts': status_counts,
             'avg_processing_time': round(avg_processing_time, 2),
-            'total_jobs': ProcessingJob.query.count()
+            'latency': latency,
+            'output_encoding': output_encoding,
+            'hosted_upload': hosted_upload,
+            'video_tracking': video_tracking,
+            'total_jobs': int(counter('jobs.total'))
         }
         
     except Exception as e:
         print(f"❌ Error getting database stats: {e}")
         return None
 
+def encode_job_cursor(job):
+    """Opaque pagination cursor pointing just past `job` in newest-first order"""
+    position = f"{job.created_at.isoformat()}|{job.id}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+def decode_job_cursor(cursor):
+    """(created_at, id) of a cursor from encode_job_cursor(); raises ValueError if malformed"""
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, job_id = position.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(job_id)
+    except (UnicodeDecodeError, binascii.Error, ValueError):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+
+def get_jobs_page(limit, cursor=None, status=None, session=None):
+    """One page of jobs, newest first, and the cursor of the next page (None on the last page).
+    
+    Pages are keyset-paginated on (created_at, id): a page starts with a range
+    seek on the created_at index instead of skipping `offset` rows, so deep
+    pages cost the same as the first one.
+    """
+    session = session or get_read_session()
+    query = session.query(ProcessingJob)
+    if status is not None:
+        query = query.filter(ProcessingJob.status == status)
+    if cursor is not None:
+        created_at, job_id = decode_job_cursor(cursor)
+        query = query.filter(tuple_(ProcessingJob.created_at, ProcessingJob.id) < (created_at, job_id))
+    # One extra row tells whether another page follows
+    jobs = query.order_by(ProcessingJob.created_at.desc(), ProcessingJob.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_job_cursor(jobs[limit - 1]) if len(jobs) > limit else None
+    return jobs[:limit], next_cursor
+
 def cleanup_old_jobs(days_old=30):
     """Clean up old processing jobs and their associated data"""
     from datetime import datetime, timedelta
@@ -105,10 +693,17 @@ def cleanup_old_jobs(days_old=30):
         
         deleted_count = 0
         for job in old_jobs:
+            JobOutput.query.filter_by(job_id=job.id).delete()
+            JobUpload.query.filter_by(job_id=job.id).delete()
+            TrackBox.query.filter_by(job_id=job.id).delete()
+            LineCrossing.query.filter_by(job_id=job.id).delete()
             # Delete associated detections (cascade should handle this)
             db.session.delete(job)
             deleted_count += 1
         
+        # The bulk deletes above bypass the counter hooks
+        db.session.flush()
+        rebuild_stat_counters()
         db.session.commit()
         
         print(f"🧹 Cleaned up {deleted_count} old processing jobs")
@@ -119,32 +714,22 @@ def cleanup_old_jobs(days_old=30):
         db.session.rollback()
         return 0
 
-def export_database_data(output_file=None):
-    """Export database data to JSON format"""
-    import json
-    from datetime import datetime
+def export_database_data(output_file=None, export_format='ndjson', table=None):
+    """Export database data as NDJSON (optionally .gz) or, with pyarrow, one table as Parquet/Arrow
+    
+    Rows are streamed to the file in batches (see data_export.stream_export),
+    so memory use does not grow with the size of the database.
+    """
+    from data_export import export_filename, stream_export
     
     if not output_file:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"object_detection_export_{timestamp}.json"
+        output_file = export_filename(export_format, table)
     
     try:
-        # Get all data
-        jobs = ProcessingJob.query.all()
-        detections = Detection.query.all()
-        system_stats = SystemStats.query.first()
-        object_classes = ObjectClass.query.all()
-        
-        export_data = {
-            'export_timestamp': datetime.utcnow().isoformat(),
-            'processing_jobs': [job.to_dict() for job in jobs],
-            'detections': [detection.to_dict() for detection in detections],
-            'system_stats': system_stats.to_dict() if system_stats else None,
-            'object_classes': [obj_class.to_dict() for obj_class in object_classes]
-        }
-        
-        with open(output_file, 'w') as f:
-            json.dump(export_data, f, indent=2)
+        chunks = stream_export(get_read_session(), export_format, table)
+        with open(output_file, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
         
         print(f"📤 Database exported to: {output_file}")
         return output_file
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Detector backends for image detection
+Every backend offers the HostedObjectDetector contract:
+detect_objects(image_path, image=None) -> results dict,
+detect_objects_many(image_paths) -> (image_path, results) pairs in input order and
+draw_detections(image_path, detections, output_path, image=None, encoding=None) -> encode stats or False.
+`image` is the same file already opened with PIL, so one decode can serve both calls.
+Local backends load their model once and run a warm-up inference up front, so
+the first upload does not pay for model loading.
+"""
+import ast
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from rendering import annotate_detections, save_image
+
+logger = logging.getLogger(__name__)
+
+# Detections below this confidence are dropped by the local backends
+DEFAULT_CONFIDENCE = 0.25
+# IoU above which overlapping boxes of one class are suppressed (ONNX backend)
+NMS_IOU = 0.45
+
+
+class LocalDetector:
+    """Shared result formatting and drawing for backends that run on this machine"""
+
+    model_name = 'local'
+
+    def __init__(self, confidence=DEFAULT_CONFIDENCE):
+        self.confidence = confidence
+        # Inference sessions are shared by the job queue threads; run one image at a time
+        self._lock = threading.Lock()
+
+    def warm_up(self, size=640):
+        """Run one inference on a blank frame so lazy initialisation happens at startup"""
+        start = time.time()
+        self._predict(np.zeros((size, size, 3), dtype=np.uint8))
+        logger.info(f"🔥 {self.model_name} warmed up in {time.time() - start:.2f}s")
+        return self
+
+    def _predict(self, image):
+        """Return a list of (x1, y1, x2, y2, confidence, class_name) for a BGR image"""
+        raise NotImplementedError
+
+    def detect_objects(self, image_path, image=None):
+        """Detect objects in an image file, or in `image` (the same file opened with PIL) if given"""
+        if image is not None:
+            frame = cv2.cvtColor(np.asarray(image if image.mode == 'RGB' else image.convert('RGB')),
+                                 cv2.COLOR_RGB2BGR)
+        else:
+            frame = cv2.imread(image_path)
+        if frame is None:
+            logger.error(f"❌ Could not read image: {image_path}")
+            return None
+        start = time.time()
+        with self._lock:
+            boxes = self._predict(frame)
+        detections = [{
+            'class_name': class_name,
+            'confidence': float(confidence),
+            'bbox': {'x1': float(x1), 'y1': float(y1), 'x2': float(x2), 'y2': float(y2)}
+        } for x1, y1, x2, y2, confidence, class_name in boxes]
+        return {
+            'detections': detections,
+            'total_detections': len(detections),
+            'processing_time': time.time() - start,
+            'model': self.model_name
+        }
+
+    def detect_objects_many(self, image_paths, max_in_flight=None):
+        """Yield (image_path, results) in input order; local inference runs one image at a time"""
+        for image_path in image_paths:
+            yield image_path, self.detect_objects(image_path)
+
+    def draw_detections(self, image_path, detections, output_path, image=None, encoding=None):
+        """Draw detection boxes on image and save it with `encoding`; returns encode stats or False"""
+        try:
+            img = image if image is not None else Image.open(image_path)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            frame = annotate_detections(np.array(img), detections)
+            return save_image(frame, output_path, encoding)
+        except Exception as e:
+            logger.error(f"❌ Error drawing detections: {e}")
+            return False
+
+
+class YoloDetector(LocalDetector):
+    """Ultralytics YOLO running in-process on the CPU"""
+
+    def __init__(self, model_path='yolov8s.pt', confidence=DEFAULT_CONFIDENCE, device='cpu'):
+        super().__init__(confidence)
+        from ultralytics import YOLO
+
+        self.model = YOLO(model_path)
+        self.device = device
+        self.model_name = os.path.splitext(os.path.basename(model_path))[0]
+
+    def _predict(self, image):
+        result = self.model(image, conf=self.confidence, device=self.device, verbose=False)[0]
+        boxes = result.boxes
+        return [
+            (*xyxy, confidence, result.names[int(cls)])
+            for xyxy, confidence, cls in zip(boxes.xyxy.tolist(), boxes.conf.tolist(), boxes.cls.tolist())
+        ]
+
+
+class OnnxDetector(LocalDetector):
+    """YOLOv8 exported to ONNX (`yolo export format=onnx`), run with ONNX Runtime on the CPU"""
+
+    def __init__(self, model_path='yolov8s.onnx', confidence=DEFAULT_CONFIDENCE, threads=None):
+        super().__init__(confidence)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else 640
+        # Ultralytics stores the class names as a dict literal in the model metadata
+        names = self.session.get_modelmeta().custom_metadata_map.get('names')
+        self.names = ast.literal_eval(names) if names else {}
+        self.model_name = os.path.splitext(os.path.basename(model_path))[0] + '-onnx'
+
+    def _letterbox(self, image):
+        """Resize keeping aspect ratio and pad to a square input, returning (blob, scale, pad_x, pad_y)"""
+        height, width = image.shape[:2]
+        scale = min(self.input_size / height, self.input_size / width)
+        new_w, new_h = round(width * scale), round(height * scale)
+        pad_x, pad_y = (self.input_size - new_w) // 2, (self.input_size - new_h) // 2
+        canvas = np.full((self.input_size, self.input_size, 3), 114, dtype=np.uint8)
+        canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+            image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        blob = cv2.dnn.blobFromImage(canvas, 1 / 255.0, swapRB=True)
+        return blob, scale, pad_x, pad_y
+
+    def _predict(self, image):
+        blob, scale, pad_x, pad_y = self._letterbox(image)
+        # Output is (1, 4 + classes, anchors): cx, cy, w, h then one score per class
+        output = self.session.run(None, {self.input_name: blob})[0][0].T
+        scores = output[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences >= self.confidence
+        if not keep.any():
+            return []
+        output, class_ids, confidences = output[keep], class_ids[keep], confidences[keep]
+
+        cx, cy, w, h = output[:, 0], output[:, 1], output[:, 2], output[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        boxes -= [pad_x, pad_y, pad_x, pad_y]
+        boxes /= scale
+        height, width = image.shape[:2]
+        boxes = boxes.clip(0, [width, height, width, height])
+
+        # Class-aware NMS: offset each class so boxes of different classes never overlap
+        offsets = class_ids[:, None] * (max(width, height) + 1)
+        nms_boxes = boxes + offsets
+        xywh = np.hstack([nms_boxes[:, :2], nms_boxes[:, 2:] - nms_boxes[:, :2]])
+        indices = cv2.dnn.NMSBoxes(xywh.tolist(), confidences.tolist(), self.confidence, NMS_IOU)
+        return [
+            (*boxes[i].tolist(), float(confidences[i]), self.names.get(int(class_ids[i]), str(class_ids[i])))
+            for i in np.asarray(indices).reshape(-1)
+        ]
+
+
+def _hosted_detector(model_path=None, **options):
+    from hosted_model import HostedObjectDetector
+    return HostedObjectDetector(**options)
+
+
+DETECTOR_BACKENDS = {
+    'hosted': _hosted_detector,
+    'yolo': YoloDetector,
+    'onnx': OnnxDetector,
+}
+
+
+def create_detector(backend='hosted', model_path=None, warm_up=True, **options):
+    """Build a detector backend by name; local backends are loaded and warmed up here"""
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}', expected one of {sorted(DETECTOR_BACKENDS)}")
+    if model_path is not None:
+        options['model_path'] = model_path
+    detector = DETECTOR_BACKENDS[backend](**options)
+    if warm_up and isinstance(detector, LocalDetector):
+        detector.warm_up()
+    return detector
@@ -4,17 +4,123 @@ Hosted Model Service for Object Detection
 Uses Hugging Face Inference API for reliable cloud-based processing
 """
 import requests
+import asyncio
 import base64
+import copy
+import hashlib
 import json
 import os
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import numpy as np
 from PIL import Image
 import io
 import time
 
+# Default endpoint; override with HOSTED_MODEL_URL or the api_url argument (e.g. a local stub)
+DEFAULT_API_URL = "https://api-inference.huggingface.co/models/facebook/detr-resnet-50"
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# DETR resizes its input to ~800px, so larger uploads only cost bandwidth
+DEFAULT_MAX_SIDE = 800
+UPLOAD_FORMATS = {'JPEG', 'WEBP'}
+
+
+class HostedAPIError(Exception):
+    """The hosted API answered with a non-200 status"""
+
+    def __init__(self, status_code):
+        super().__init__(f"API returned {status_code}")
+        self.status_code = status_code
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint that recently kept failing"""
+
+
+class CircuitBreaker:
+    """Stop calling an unhealthy endpoint for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are refused for `reset_timeout` seconds. Then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
 class HostedObjectDetector:
-    def __init__(self):
+    def __init__(self, api_url=None, timeout=30, max_retries=3, backoff=0.5, max_backoff=8.0,
+                 max_concurrency=4, circuit_breaker=None, max_side=DEFAULT_MAX_SIDE,
+                 upload_format='JPEG', upload_quality=85):
         # Use Hugging Face's free inference API
-        self.api_url = "https://api-inference.huggingface.co/models/facebook/detr-resnet-50"
+        self.api_url = api_url or os.environ.get('HOSTED_MODEL_URL', DEFAULT_API_URL)
+        self.timeout = timeout
+        
+        # Uploads are shrunk to max_side and re-encoded; max_side=None and
+        # upload_format=None send the original file untouched
+        if upload_format is not None and upload_format.upper() not in UPLOAD_FORMATS:
+            raise ValueError(f"upload_format must be one of {sorted(UPLOAD_FORMATS)} or None")
+        self.max_side = max_side
+        self.upload_format = upload_format.upper() if upload_format else None
+        self.upload_quality = upload_quality
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_concurrency = max_concurrency
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        
+        # One keep-alive session for all requests, at most max_concurrency in flight
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        
+        # Identical images being detected right now, keyed by content hash
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
         self.headers = {
             "Authorization": "Bearer hf_your_token_here",  # We'll use a public model that doesn't require auth
             "Content-Type": "application/json"
@@ -26,42 +132,212 @@ class HostedObjectDetector:
         # For now, we'll use the public endpoint without auth
         self.headers = {}
     
-    def detect_objects(self, image_path):
+    def detect_objects(self, image_path, image=None):
         """
         Detect objects in an image using hosted API
+        Concurrent calls for identical image bytes share a single API request.
+        `image` may be the same file already opened with PIL; it is then only
+        decoded if the upload has to be resized, and the decode is kept for
+        draw_detections.
         """
         try:
             # Read and encode image
             with open(image_path, "rb") as f:
                 image_data = f.read()
+        except Exception as e:
+            print(f"❌ Error reading image for hosted API: {e}")
+            return self._fallback_detection(image_path, image)
+        
+        key = hashlib.sha256(image_data).hexdigest()
+        with self._in_flight_lock:
+            pending = self._in_flight.get(key)
+            if pending is None:
+                pending = self._in_flight[key] = Future()
+                owner = True
+            else:
+                owner = False
+        
+        if not owner:
+            # Callers get their own copy so they can annotate the results freely
+            return copy.deepcopy(pending.result())
+        
+        try:
+            results = self._detect(image_data, image_path, image)
+            pending.set_result(results)
+            return copy.deepcopy(results)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+    
+    async def adetect_objects_many(self, image_paths, max_in_flight=None):
+        """
+        Detect objects in many images concurrently, as an async generator
+        Yields (image_path, results) in input order; each pair is yielded as soon
+        as it and every earlier image are done. At most `max_in_flight` requests
+        (default: max_concurrency) run at once. The session never sends more than
+        max_concurrency at a time, so a larger max_in_flight raises ValueError
+        when iteration starts.
+        """
+        image_paths = list(image_paths)
+        max_in_flight = max_in_flight or self.max_concurrency
+        if not 1 <= max_in_flight <= self.max_concurrency:
+            raise ValueError(f"max_in_flight must be between 1 and max_concurrency ({self.max_concurrency}), "
+                             f"got {max_in_flight}")
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(max_in_flight)
+        # requests is blocking, so each round trip runs on a worker thread
+        executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='hosted')
+        
+        async def detect(image_path):
+            async with limit:
+                return await loop.run_in_executor(executor, self.detect_objects, image_path)
+        
+        tasks = [asyncio.ensure_future(detect(path)) for path in image_paths]
+        try:
+            for image_path, task in zip(image_paths, tasks):
+                yield image_path, await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(wait=False)
+    
+    def detect_objects_many(self, image_paths, max_in_flight=None):
+        """
+        Blocking wrapper around adetect_objects_many for callers without an event loop
+        Yields (image_path, results) in input order while later images are still in flight;
+        max_in_flight is limited to max_concurrency in the same way.
+        """
+        loop = asyncio.new_event_loop()
+        results = self.adetect_objects_many(image_paths, max_in_flight)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(results.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(results.aclose())
+            loop.close()
+    
+    def _detect(self, image_data, image_path, image=None):
+        try:
+            payload, upload = self._prepare_upload(image_data, image)
+            start = time.time()
+            results = self._post_with_retries(payload)
+            upload['request_time'] = time.time() - start
             
-            # Try Hugging Face API first
-            response = requests.post(
-                self.api_url,
-                data=image_data,
-                headers={"Content-Type": "application/octet-stream"},
-                timeout=30
-            )
+            processed = self._process_hf_results(results, upload['original_size'], upload['sent_size'])
+            processed['processing_time'] = upload['encode_time'] + upload['request_time']
+            processed['upload'] = upload
+            return processed
+        except CircuitOpenError as e:
+            print(f"⚠️ {e}, using fallback detection")
+            return self._fallback_detection(image_path, image)
+        except Exception as e:
+            # If that fails, try a simpler approach with a mock response
+            print(f"❌ Error with hosted API: {e}, using fallback detection")
+            return self._fallback_detection(image_path, image)
+    
+    def _prepare_upload(self, image_data, image=None):
+        """
+        Downscale and re-encode an image for upload
+        Returns (payload bytes, upload metadata). The original bytes are sent when
+        the image is already small enough and in the upload format. Sizes come
+        from the header; pixels are only decoded when re-encoding.
+        """
+        start = time.time()
+        shared = image is not None
+        img = image if shared else Image.open(io.BytesIO(image_data))
+        try:
+            original_size = img.size
+            sent_size = original_size
+            if self.max_side and max(original_size) > self.max_side:
+                scale = self.max_side / max(original_size)
+                sent_size = tuple(max(1, round(side * scale)) for side in original_size)
             
-            if response.status_code == 200:
-                results = response.json()
-                return self._process_hf_results(results, image_path)
+            keep_original = sent_size == original_size and self.upload_format in (None, img.format)
+            payload = image_data
+            if not keep_original:
+                if not shared:
+                    # JPEG decodes at 1/2, 1/4 or 1/8 scale when that is still at least sent_size
+                    img.draft('RGB', sent_size)
+                # A shared image is decoded at full size once and reused for drawing
+                resized = img if img.mode == 'RGB' else img.convert('RGB')
+                if resized.size != sent_size:
+                    resized = resized.resize(sent_size, Image.BILINEAR, reducing_gap=2.0)
+                buffer = io.BytesIO()
+                resized.save(buffer, self.upload_format or 'JPEG', quality=self.upload_quality)
+                # Re-encoding a small, well-compressed file can make it bigger
+                if sent_size != original_size or buffer.tell() < len(image_data):
+                    payload = buffer.getvalue()
+        finally:
+            if not shared:
+                img.close()
+        
+        upload = {
+            'original_bytes': len(image_data),
+            'sent_bytes': len(payload),
+            'bytes_saved': len(image_data) - len(payload),
+            'original_size': list(original_size),
+            'sent_size': list(sent_size),
+            'format': (self.upload_format or 'JPEG') if payload is not image_data else 'original',
+            'encode_time': time.time() - start
+        }
+        return payload, upload
+    
+    def _post_with_retries(self, image_data):
+        """POST an image, retrying transient failures with exponential backoff and full jitter"""
+        for attempt in range(self.max_retries + 1):
+            if not self.circuit_breaker.allow():
+                raise CircuitOpenError(f"Hosted API circuit is open after {self.circuit_breaker.failures} failures")
             
-            # If that fails, try a simpler approach with a mock response
-            print(f"⚠️ API returned {response.status_code}, using fallback detection")
-            return self._fallback_detection(image_path)
+            retry_after = None
+            try:
+                with self._slots:
+                    response = self.session.post(
+                        self.api_url,
+                        data=image_data,
+                        headers={"Content-Type": "application/octet-stream"},
+                        timeout=self.timeout
+                    )
+            except requests.RequestException as e:
+                error = e
+                retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+            else:
+                if response.status_code == 200:
+                    self.circuit_breaker.record_success()
+                    return response.json()
+                error = HostedAPIError(response.status_code)
+                retryable = response.status_code in RETRYABLE_STATUS
+                retry_after = response.headers.get('Retry-After')
             
-        except Exception as e:
-            print(f"❌ Error with hosted API: {e}")
-            return self._fallback_detection(image_path)
+            if not retryable:
+                # The endpoint is up but refused this request; nothing to retry
+                self.circuit_breaker.record_success()
+                raise error
+            self.circuit_breaker.record_failure()
+            if attempt == self.max_retries:
+                raise error
+            
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+            print(f"⚠️ {error}, retrying in {delay:.2f}s ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+    
+    def close(self):
+        self.session.close()
     
-    def _process_hf_results(self, results, image_path):
-        """Process Hugging Face API results"""
+    def _process_hf_results(self, results, image_size, sent_size=None):
+        """Process Hugging Face API results, mapping boxes from the uploaded size back to image_size"""
         detections = []
         
-        # Load image to get dimensions
-        with Image.open(image_path) as img:
-            width, height = img.size
+        width, height = image_size
+        sent_width, sent_height = sent_size or image_size
+        scale_x, scale_y = width / sent_width, height / sent_height
         
         for detection in results:
             if detection.get('score', 0) > 0.5:  # Confidence threshold
@@ -70,10 +346,10 @@ class HostedObjectDetector:
                     'class_name': detection.get('label', 'object'),
                     'confidence': detection.get('score', 0.5),
                     'bbox': {
-                        'x1': box.get('xmin', 0),
-                        'y1': box.get('ymin', 0),
-                        'x2': box.get('xmax', width),
-                        'y2': box.get('ymax', height)
+                        'x1': box.get('xmin', 0) * scale_x,
+                        'y1': box.get('ymin', 0) * scale_y,
+                        'x2': box.get('xmax', sent_width) * scale_x,
+                        'y2': box.get('ymax', sent_height) * scale_y
                     }
                 })
         
@@ -84,12 +360,15 @@ class HostedObjectDetector:
             'model': 'huggingface-detr'
         }
     
-    def _fallback_detection(self, image_path):
+    def _fallback_detection(self, image_path, image=None):
         """Fallback detection using image analysis"""
         try:
             # Analyze image and provide mock detections based on image properties
-            with Image.open(image_path) as img:
-                width, height = img.size
+            if image is not None:
+                width, height = image.size
+            else:
+                with Image.open(image_path) as img:
+                    width, height = img.size
                 
             # Simple heuristic-based detection
             detections = []
@@ -134,42 +413,25 @@ class HostedObjectDetector:
                 'model': 'error'
             }
     
-    def draw_detections(self, image_path, detections, output_path):
-        """Draw detection boxes on image"""
+    def draw_detections(self, image_path, detections, output_path, image=None, encoding=None):
+        """
+        Draw detection boxes on image, reusing `image` when the caller already has it open
+        Returns the rendering.save_image stats for the chosen `encoding`, or False on failure.
+        """
         try:
-            from PIL import Image, ImageDraw, ImageFont
+            from rendering import annotate_detections, save_image
             
-            # Open image
-            img = Image.open(image_path)
-            draw = ImageDraw.Draw(img)
+            # Open image, unless the caller already has it decoded
+            img = image if image is not None else Image.open(image_path)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            frame = np.array(img)
             
-            # Try to load a font
-            try:
-                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 16)
-            except:
-                font = ImageFont.load_default()
-            
-            colors = ['red', 'blue', 'green', 'yellow', 'purple', 'orange']
-            
-            for i, detection in enumerate(detections):
-                bbox = detection['bbox']
-                class_name = detection['class_name']
-                confidence = detection['confidence']
-                
-                # Draw bounding box
-                color = colors[i % len(colors)]
-                draw.rectangle([
-                    bbox['x1'], bbox['y1'],
-                    bbox['x2'], bbox['y2']
-                ], outline=color, width=3)
-                
-                # Draw label
-                label = f"{class_name}: {confidence:.2f}"
-                draw.text((bbox['x1'], bbox['y1'] - 20), label, fill=color, font=font)
+            # Draw boxes and labels straight into the pixel array
+            annotate_detections(frame, detections)
             
             # Save result
-            img.save(output_path, 'JPEG', quality=95)
-            return True
+            return save_image(frame, output_path, encoding)
             
         except Exception as e:
             print(f"❌ Error drawing detections: {e}")
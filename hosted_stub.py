@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the hosted detection API
+Answers POSTed images with Hugging Face style detections so HostedObjectDetector
+can be tested and benchmarked without network access. Latency and errors can
+be injected to exercise retries and timeouts.
+Run with: python hosted_stub.py [--port 8765] [--latency 0.05] [--error-rate 0.1] [--bandwidth 1e6]
+"""
+import argparse
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+class StubState:
+    """Behaviour and counters shared by all requests to one stub server"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, fail_first=0, error_status=503, bandwidth=None, seed=0):
+        self.latency = latency
+        # Simulated upload speed in bytes/sec; None for unlimited
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.fail_first = fail_first
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def begin(self, size):
+        """Count a request of `size` bytes and decide whether it should fail"""
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += size
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.requests <= self.fail_first or self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+    def end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+def stub_detections(width, height):
+    """Deterministic detections scaled to the image, in the Hugging Face response format"""
+    return [
+        {'label': 'person', 'score': 0.91,
+         'box': {'xmin': int(width * 0.1), 'ymin': int(height * 0.2),
+                 'xmax': int(width * 0.4), 'ymax': int(height * 0.9)}},
+        {'label': 'car', 'score': 0.83,
+         'box': {'xmin': int(width * 0.5), 'ymin': int(height * 0.5),
+                 'xmax': int(width * 0.9), 'ymax': int(height * 0.8)}},
+    ]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per request
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        state = self.server.state
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        fail = state.begin(len(body))
+        try:
+            delay = state.latency + (len(body) / state.bandwidth if state.bandwidth else 0.0)
+            if delay:
+                time.sleep(delay)
+            if fail:
+                self._send_json(state.error_status, {'error': 'injected failure'})
+                return
+            try:
+                with Image.open(io.BytesIO(body)) as img:
+                    width, height = img.size
+            except Exception:
+                self._send_json(400, {'error': 'could not decode image'})
+                return
+            self._send_json(200, stub_detections(width, height))
+        finally:
+            state.end()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, **behaviour):
+    """Serve the stub on a background thread; returns (server, url). Stop with server.shutdown()"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**behaviour)
+    threading.Thread(target=server.serve_forever, name='hosted-stub', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/detect"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the hosted detection API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before answering')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--bandwidth', type=float, help='Simulated upload speed in bytes/sec')
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.port, latency=args.latency, error_rate=args.error_rate,
+                                    bandwidth=args.bandwidth)
+    print(f"🧪 Hosted API stub listening on {url}")
+    print(f"   Use it with HOSTED_MODEL_URL={url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Background job queue for uploads
+Uploads are recorded as pending ProcessingJob rows and processed off the request
+thread; progress is kept in memory and pushed to subscribers so status polling
+and event streams never have to touch the database.
+"""
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from models import db, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+# Progress entries kept in memory; the oldest are dropped beyond this
+MAX_TRACKED_JOBS = 1000
+# Events buffered per subscriber before the oldest progress update is dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class JobQueue:
+    """Runs ProcessingJob handlers on a thread pool inside the Flask app context.
+
+    A handler is called as handler(job) with the job already marked as
+    processing. It should set the final status itself and may return a dict
+    summarising the result; if it raises, the job is marked as failed with
+    the exception message.
+
+    Every progress update is also published to in-memory subscribers as a
+    'progress' event, followed by one final 'result' event per job. An
+    optional `on_finish(job_id, result)` callback runs after each job.
+    """
+
+    def __init__(self, app, max_workers=2, on_finish=None):
+        self.app = app
+        self.on_finish = on_finish
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._progress = OrderedDict()
+        self._results = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, handler):
+        self.update_progress(job_id, status='pending')
+        return self._executor.submit(self._run, job_id, handler)
+
+    def _run(self, job_id, handler):
+        with self.app.app_context():
+            result = None
+            try:
+                job = db.session.get(ProcessingJob, job_id)
+                if job is None:
+                    logger.error(f"❌ Job #{job_id} disappeared before processing")
+                    # Still finish it, so event streams close and on_finish runs
+                    result = {'status': 'failed', 'error_message': f"Job #{job_id} not found"}
+                    return
+                job.status = 'processing'
+                job.started_at = datetime.utcnow()
+                db.session.commit()
+                self.update_progress(job_id, status='processing')
+
+                result = dict(handler(job) or {})
+                result.update(status=job.status, error_message=job.error_message)
+            except Exception as e:
+                logger.error(f"❌ Job #{job_id} failed: {e}")
+                db.session.rollback()
+                job = db.session.get(ProcessingJob, job_id)
+                if job is not None:
+                    job.status = 'failed'
+                    job.error_message = str(e)
+                    job.completed_at = datetime.utcnow()
+                    db.session.commit()
+                result = {'status': 'failed', 'error_message': str(e)}
+            finally:
+                db.session.remove()
+                if result is not None:
+                    self.finish(job_id, result)
+
+    def update_progress(self, job_id, **fields):
+        with self._lock:
+            progress = self._progress.setdefault(job_id, {})
+            progress.update(fields)
+            self._progress.move_to_end(job_id)
+            while len(self._progress) > MAX_TRACKED_JOBS:
+                dropped, _ = self._progress.popitem(last=False)
+                self._results.pop(dropped, None)
+            self._publish(job_id, 'progress', dict(progress))
+
+    def finish(self, job_id, result):
+        """Record the final status of a job and send the closing 'result' event"""
+        with self._lock:
+            progress = self._progress.setdefault(job_id, {})
+            progress['status'] = result['status']
+            self._results[job_id] = result
+            self._publish(job_id, 'progress', dict(progress))
+            self._publish(job_id, 'result', result)
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job_id, result)
+            except Exception as e:
+                logger.error(f"❌ on_finish callback failed for job #{job_id}: {e}")
+
+    def get_progress(self, job_id):
+        """Latest in-memory progress for a job, or None if this process never ran it"""
+        with self._lock:
+            progress = self._progress.get(job_id)
+            return dict(progress) if progress is not None else None
+
+    def subscribe(self, job_id):
+        """Return a queue of (event, data) tuples for a job, primed with its current state.
+
+        Returns None for jobs this process does not know about. Callers must
+        unsubscribe() when they stop reading.
+        """
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if job_id not in self._progress:
+                return None
+            subscription.put(('progress', dict(self._progress[job_id])))
+            if job_id in self._results:
+                subscription.put(('result', self._results[job_id]))
+            else:
+                self._subscribers.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, job_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def _publish(self, job_id, event, data):
+        # Caller holds self._lock
+        for subscription in self._subscribers.get(job_id, ()):
+            while True:
+                try:
+                    subscription.put_nowait((event, data))
+                    break
+                except queue.Full:
+                    # A slow reader only needs the newest progress; drop the oldest event
+                    try:
+                        subscription.get_nowait()
+                    except queue.Empty:
+                        pass
+        if event == 'result':
+            self._subscribers.pop(job_id, None)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
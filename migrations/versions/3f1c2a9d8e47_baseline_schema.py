@@ -0,0 +1,102 @@
+"""Baseline schema
+
+Creates every table of the application. processing_job, detection,
+system_stats and object_class are defined in models.py and are created from
+those definitions; the tables added alongside them are spelled out here.
+Tables that already exist are left alone, so databases created by
+db.create_all() before migrations were introduced upgrade from here too.
+
+Revision ID: 3f1c2a9d8e47
+Revises: 
+Create Date: 2026-10-17 14:02:11.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d8e47'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _model_tables():
+    from models import ProcessingJob, Detection, SystemStats, ObjectClass
+    return [model.__table__ for model in (ProcessingJob, Detection, SystemStats, ObjectClass)]
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table in _model_tables():
+        table.create(bind, checkfirst=True)
+
+    op.create_table(
+        'job_output',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('quality', sa.Integer(), nullable=True),
+        sa.Column('progressive', sa.Boolean(), nullable=True),
+        sa.Column('width', sa.Integer(), nullable=True),
+        sa.Column('height', sa.Integer(), nullable=True),
+        sa.Column('encode_time', sa.Float(), nullable=True),
+        sa.Column('output_bytes', sa.Integer(), nullable=True),
+        sa.Column('thumbnail_filename', sa.String(length=255), nullable=True),
+        sa.Column('thumbnail_bytes', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['processing_job.id']),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_job_output_job_id', 'job_output', ['job_id'], if_not_exists=True)
+
+    op.create_table(
+        'track_box',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('frame_index', sa.Integer(), nullable=False),
+        sa.Column('track_id', sa.Integer(), nullable=False),
+        sa.Column('class_name', sa.String(length=100), nullable=True),
+        sa.Column('bbox_x1', sa.Float(), nullable=True),
+        sa.Column('bbox_y1', sa.Float(), nullable=True),
+        sa.Column('bbox_x2', sa.Float(), nullable=True),
+        sa.Column('bbox_y2', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['processing_job.id']),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_track_box_job_id', 'track_box', ['job_id'], if_not_exists=True)
+
+    op.create_table(
+        'line_crossing',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('frame_index', sa.Integer(), nullable=False),
+        sa.Column('track_id', sa.Integer(), nullable=False),
+        sa.Column('class_name', sa.String(length=100), nullable=True),
+        sa.Column('direction', sa.String(length=4), nullable=False),
+        sa.ForeignKeyConstraint(['job_id'], ['processing_job.id']),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_line_crossing_job_id', 'line_crossing', ['job_id'], if_not_exists=True)
+
+    op.create_table(
+        'stat_counter',
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('value', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_table('stat_counter', if_exists=True)
+    op.drop_table('line_crossing', if_exists=True)
+    op.drop_table('track_box', if_exists=True)
+    op.drop_table('job_output', if_exists=True)
+    bind = op.get_bind()
+    for table in reversed(_model_tables()):
+        table.drop(bind, checkfirst=True)
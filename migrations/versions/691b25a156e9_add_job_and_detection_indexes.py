@@ -0,0 +1,43 @@
+"""Add job, detection and track box indexes
+
+Indexes the newest-first job listing (optionally per status), the
+detections of one job and the frame windows of a job's track boxes, which
+replaces the single-column track_box job_id index. Indexes are created only
+where missing, since db.create_all() may already have added them.
+
+Revision ID: 691b25a156e9
+Revises: 3f1c2a9d8e47
+Create Date: 2026-10-17 06:47:53.894207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '691b25a156e9'
+down_revision = '3f1c2a9d8e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('processing_job') as batch_op:
+        batch_op.create_index('ix_processing_job_created_at', ['created_at'], if_not_exists=True)
+        batch_op.create_index('ix_processing_job_status_created_at', ['status', 'created_at'], if_not_exists=True)
+    with op.batch_alter_table('detection') as batch_op:
+        batch_op.create_index('ix_detection_job_id_class_name', ['job_id', 'class_name'], if_not_exists=True)
+    with op.batch_alter_table('track_box') as batch_op:
+        batch_op.create_index('ix_track_box_job_frame_track', ['job_id', 'frame_index', 'track_id'], if_not_exists=True)
+        batch_op.drop_index('ix_track_box_job_id', if_exists=True)
+
+
+def downgrade():
+    with op.batch_alter_table('track_box') as batch_op:
+        batch_op.create_index('ix_track_box_job_id', ['job_id'], if_not_exists=True)
+        batch_op.drop_index('ix_track_box_job_frame_track', if_exists=True)
+    with op.batch_alter_table('detection') as batch_op:
+        batch_op.drop_index('ix_detection_job_id_class_name', if_exists=True)
+    with op.batch_alter_table('processing_job') as batch_op:
+        batch_op.drop_index('ix_processing_job_status_created_at', if_exists=True)
+        batch_op.drop_index('ix_processing_job_created_at', if_exists=True)
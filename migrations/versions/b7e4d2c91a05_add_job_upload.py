@@ -0,0 +1,43 @@
+"""Add job upload
+
+Records what the hosted detector was sent for each image job.
+
+Revision ID: b7e4d2c91a05
+Revises: 691b25a156e9
+Create Date: 2026-10-17 15:20:37.104862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2c91a05'
+down_revision = '691b25a156e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'job_upload',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('original_bytes', sa.Integer(), nullable=True),
+        sa.Column('sent_bytes', sa.Integer(), nullable=True),
+        sa.Column('original_width', sa.Integer(), nullable=True),
+        sa.Column('original_height', sa.Integer(), nullable=True),
+        sa.Column('sent_width', sa.Integer(), nullable=True),
+        sa.Column('sent_height', sa.Integer(), nullable=True),
+        sa.Column('encode_time', sa.Float(), nullable=True),
+        sa.Column('request_time', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['processing_job.id']),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_job_upload_job_id', 'job_upload', ['job_id'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_table('job_upload', if_exists=True)
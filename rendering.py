@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Annotation rendering shared by every drawing path
+Boxes and labels are drawn straight into a NumPy image array in place. Fonts
+are loaded once per size and each glyph is rasterised once into an alpha mask;
+labels are composed from those masks and blended by slicing, so per-frame cost
+is a few array writes per box however many distinct track IDs appear. Colors are tuples in the array's channel order (RGB for PIL images,
+BGR for OpenCV frames).
+Annotated images are written with save_image, whose encoding (format,
+quality, progressive JPEG, max resolution, thumbnail) is set per request.
+"""
+import io
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+# Distinct label colors, cycled per detection (RGB)
+PALETTE = [
+    (255, 0, 0),      # red
+    (0, 0, 255),      # blue
+    (0, 128, 0),      # green
+    (255, 255, 0),    # yellow
+    (128, 0, 128),    # purple
+    (255, 165, 0),    # orange
+]
+
+
+@lru_cache(maxsize=32)
+def get_font(size):
+    """TrueType font at `size` px, loaded once; PIL's bitmap font if it is missing"""
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4096)
+def glyph_mask(char, size):
+    """(mask, left, top, advance) of one character at `size` px.
+
+    The alpha mask covers the glyph's ink only; left/top place it relative to
+    the pen position and the baseline-aligned line top, and advance is how far
+    the pen moves on to the next character.
+    """
+    font = get_font(size)
+    left, top, right, bottom = font.getbbox(char)
+    mask = Image.new('L', (max(0, right - left), max(0, bottom - top)))
+    if right > left and bottom > top:
+        ImageDraw.Draw(mask).text((-left, -top), char, fill=255, font=font)
+    mask = np.array(mask)
+    mask.setflags(write=False)
+    return mask, left, top, round(font.getlength(char))
+
+
+def label_mask(text, size):
+    """Alpha mask (uint8, height x width) of `text` rendered at `size` px, built from cached glyphs"""
+    glyphs, pen = [], 0
+    for char in text:
+        mask, left, top, advance = glyph_mask(char, size)
+        if mask.size:
+            glyphs.append((mask, pen + left, top))
+        pen += advance
+    if not glyphs:
+        return np.zeros((1, max(1, pen)), dtype=np.uint8)
+    x0 = min(x for _, x, _ in glyphs)
+    y0 = min(y for _, _, y in glyphs)
+    width = max(x + mask.shape[1] for mask, x, _ in glyphs) - x0
+    height = max(y + mask.shape[0] for mask, _, y in glyphs) - y0
+    label = np.zeros((height, width), dtype=np.uint8)
+    for mask, x, y in glyphs:
+        region = label[y - y0:y - y0 + mask.shape[0], x - x0:x - x0 + mask.shape[1]]
+        # Neighbouring glyphs may overlap by a pixel; keep the stronger coverage
+        np.maximum(region, mask, out=region)
+    return label
+
+
+def draw_box(image, x1, y1, x2, y2, color, thickness=2):
+    """Outline a box by writing its four edges as array slices; clipped to the image"""
+    height, width = image.shape[:2]
+    x1, y1 = max(int(x1), 0), max(int(y1), 0)
+    x2, y2 = min(int(x2) + 1, width), min(int(y2) + 1, height)
+    if x2 <= x1 or y2 <= y1:
+        return
+    image[y1:min(y1 + thickness, y2), x1:x2] = color
+    image[max(y2 - thickness, y1):y2, x1:x2] = color
+    image[y1:y2, x1:min(x1 + thickness, x2)] = color
+    image[y1:y2, max(x2 - thickness, x1):x2] = color
+
+
+def draw_hline(image, y, color, thickness=2):
+    """Full-width horizontal line centred on row `y`"""
+    top = max(int(y) - thickness // 2, 0)
+    image[top:top + thickness] = color
+
+
+def draw_label(image, x, y, text, color, size=16, background=None, padding=0):
+    """Blend `text` with its top-left corner at (x, y), optionally on a filled background"""
+    mask = label_mask(text, size)
+    height, width = image.shape[:2]
+    mask_h, mask_w = mask.shape
+    x, y = int(x), int(y)
+    if background is not None:
+        top, left = max(y - padding, 0), max(x - padding, 0)
+        image[top:max(y + mask_h + padding, 0), left:max(x + mask_w + padding, 0)] = background
+
+    # Clip the mask to the part that lands inside the image
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + mask_w, width), min(y + mask_h, height)
+    if x1 <= x0 or y1 <= y0:
+        return
+    alpha = mask[y0 - y:y1 - y, x0 - x:x1 - x, None].astype(np.uint16)
+    region = image[y0:y1, x0:x1]
+    color = np.asarray(color, dtype=np.uint16)
+    region[:] = (region * (255 - alpha) + color * alpha + 127) // 255
+
+
+def label_size(text, size=16):
+    """(width, height) in pixels of a rendered label"""
+    height, width = label_mask(text, size).shape
+    return width, height
+
+
+def annotate_detections(image, detections, thickness=3, font_size=16, palette=PALETTE):
+    """Draw detection dicts ({'class_name', 'confidence', 'bbox'}) in place, label above each box"""
+    for i, detection in enumerate(detections):
+        bbox = detection['bbox']
+        color = palette[i % len(palette)]
+        draw_box(image, bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2'], color, thickness)
+        label = f"{detection['class_name']}: {detection['confidence']:.2f}"
+        draw_label(image, bbox['x1'], bbox['y1'] - 20, label, color, font_size)
+    return image
+
+
+# Output formats: name -> (PIL format, file extension)
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+    'png': ('PNG', 'png'),
+}
+
+DEFAULT_ENCODING = {
+    'format': 'jpeg',
+    'quality': 85,
+    'progressive': False,
+    'max_side': None,
+    'thumbnail_side': None,
+}
+
+# WebP encoder effort (0-6): 4 is PIL's default and several times slower for a preview
+WEBP_METHOD = 2
+# zlib level for PNG output; higher levels barely shrink annotated photos
+PNG_COMPRESS_LEVEL = 1
+THUMBNAIL_QUALITY = 75
+
+
+def parse_encoding(values, defaults=DEFAULT_ENCODING):
+    """Build an encoding dict from string values (form fields, env vars) over `defaults`.
+
+    Recognised keys: format, quality, progressive, max_side, thumbnail_side.
+    Empty values keep the default; invalid ones raise ValueError.
+    """
+    encoding = dict(defaults)
+    fmt = values.get('format')
+    if fmt:
+        fmt = fmt.lower()
+        fmt = 'jpeg' if fmt == 'jpg' else fmt
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{fmt}', expected one of {sorted(OUTPUT_FORMATS)}")
+        encoding['format'] = fmt
+    if values.get('quality'):
+        quality = int(values['quality'])
+        if not 1 <= quality <= 100:
+            raise ValueError(f"quality must be between 1 and 100, got {quality}")
+        encoding['quality'] = quality
+    if values.get('progressive'):
+        encoding['progressive'] = str(values['progressive']).lower() in ('1', 'true', 'yes', 'on')
+    for key in ('max_side', 'thumbnail_side'):
+        if values.get(key):
+            side = int(values[key])
+            if side < 16:
+                raise ValueError(f"{key} must be at least 16 pixels, got {side}")
+            encoding[key] = side
+    return encoding
+
+
+def output_extension(encoding):
+    return OUTPUT_FORMATS[encoding['format']][1]
+
+
+def format_for_path(path):
+    """Output format name for a file extension, defaulting to jpeg"""
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    for name, (_, extension) in OUTPUT_FORMATS.items():
+        if ext in (name, extension):
+            return name
+    return 'jpeg'
+
+
+def thumbnail_path(output_path):
+    """Thumbnails sit next to the full image as thumb_<name>.jpg"""
+    folder, name = os.path.split(output_path)
+    return os.path.join(folder, 'thumb_' + os.path.splitext(name)[0] + '.jpg')
+
+
+def _encode(img, pil_format, quality, progressive):
+    buffer = io.BytesIO()
+    if pil_format == 'JPEG':
+        img.save(buffer, 'JPEG', quality=quality, progressive=progressive)
+    elif pil_format == 'WEBP':
+        img.save(buffer, 'WEBP', quality=quality, method=WEBP_METHOD)
+    else:
+        img.save(buffer, 'PNG', compress_level=PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+
+def save_thumbnail(img, output_path, side):
+    """Write a JPEG thumbnail of `img` no larger than side x side; returns its size in bytes"""
+    thumb = img.copy()
+    thumb.thumbnail((side, side), Image.BILINEAR, reducing_gap=2.0)
+    data = _encode(thumb, 'JPEG', THUMBNAIL_QUALITY, False)
+    with open(thumbnail_path(output_path), 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def save_image(frame, output_path, encoding=None):
+    """Encode an RGB array (or PIL image) to `output_path`; returns encode stats.
+
+    Stats: format, quality, progressive, width, height, encode_time,
+    output_bytes and, when a thumbnail is requested, thumbnail_filename and
+    thumbnail_bytes.
+    """
+    encoding = encoding or DEFAULT_ENCODING
+    start = time.time()
+    img = Image.fromarray(frame) if isinstance(frame, np.ndarray) else frame
+    max_side = encoding.get('max_side')
+    if max_side and max(img.size) > max_side:
+        scale = max_side / max(img.size)
+        img = img.resize(tuple(max(1, round(side * scale)) for side in img.size), Image.BILINEAR)
+
+    pil_format = OUTPUT_FORMATS[encoding['format']][0]
+    data = _encode(img, pil_format, encoding['quality'], encoding['progressive'])
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    stats = {
+        'format': encoding['format'],
+        'quality': encoding['quality'],
+        'progressive': encoding['progressive'] and pil_format == 'JPEG',
+        'width': img.size[0],
+        'height': img.size[1],
+        'output_bytes': len(data),
+    }
+    if encoding.get('thumbnail_side'):
+        stats['thumbnail_bytes'] = save_thumbnail(img, output_path, encoding['thumbnail_side'])
+        stats['thumbnail_filename'] = os.path.basename(thumbnail_path(output_path))
+    stats['encode_time'] = time.time() - start
+    return stats
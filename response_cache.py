@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Short-lived cache for rendered read-only responses
+Statistics pages only change when a job finishes, so their rendered bodies are
+kept in memory for a few seconds and dropped as soon as a job completes. Each
+entry carries an ETag derived from the body, letting pollers revalidate with
+If-None-Match and receive 304s.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Process-local map of key -> (body, mimetype, etag), valid for `ttl` seconds.
+
+    invalidate() empties the cache and bumps a generation number; put() with
+    the generation read before rendering is ignored if an invalidation
+    happened meanwhile, so a body rendered from stale data is never stored.
+    A ttl of 0 disables caching.
+    """
+
+    def __init__(self, ttl=5.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        """Return (body, mimetype, etag) or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[0]:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, body, mimetype, generation):
+        """Store a rendered body and return its (body, mimetype, etag)"""
+        value = (body, mimetype, hashlib.sha256(body).hexdigest()[:32])
+        with self._lock:
+            if self.ttl > 0 and generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for detection results
+Uploads are hashed while they stream to disk; results and rendered output images
+are stored under that SHA-256 so repeated uploads skip detection entirely.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+# Bytes read per chunk while streaming an upload to disk
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_upload_hashed(file_storage, dest_path):
+    """Stream an uploaded file to `dest_path`, returning (sha256 hex digest, size in bytes)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest_path, 'wb') as out:
+        while True:
+            chunk = file_storage.stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def hash_file(path):
+    """SHA-256 of a file already on disk"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU store of detection results keyed by upload digest.
+
+    Each entry is a directory root/<digest[:2]>/<digest>/ holding results.json
+    and the rendered output image. When the total size exceeds `max_bytes`
+    the least recently used entries are deleted.
+    """
+
+    RESULTS_FILE = 'results.json'
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _entry_dir(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _load_index(self):
+        """Rebuild the LRU order from disk, oldest results.json mtime first"""
+        found = []
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for digest in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, digest)
+                results_path = os.path.join(entry_dir, self.RESULTS_FILE)
+                if not os.path.exists(results_path):
+                    # Half-written entry from an interrupted put()
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                found.append((os.path.getmtime(results_path), digest, self._dir_size(entry_dir)))
+        for _, digest, size in sorted(found):
+            self._entries[digest] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def _dir_size(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    def get(self, digest):
+        """Return (results dict, cached output image path) or None on a miss"""
+        with self._lock:
+            if digest not in self._entries:
+                return None
+            entry_dir = self._entry_dir(digest)
+            results_path = os.path.join(entry_dir, self.RESULTS_FILE)
+            try:
+                with open(results_path) as f:
+                    cached = json.load(f)
+                os.utime(results_path)
+            except (OSError, ValueError):
+                self._remove(digest)
+                return None
+            self._entries.move_to_end(digest)
+        return cached['results'], os.path.join(entry_dir, cached['output_file'])
+
+    def put(self, digest, results, output_path):
+        """Store results and a copy of the rendered output image, evicting LRU entries"""
+        entry_dir = self._entry_dir(digest)
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                return
+            os.makedirs(entry_dir, exist_ok=True)
+            output_file = 'output' + os.path.splitext(output_path)[1]
+            # Copy rather than hard-link: output paths get rewritten in place by later uploads
+            shutil.copyfile(output_path, os.path.join(entry_dir, output_file))
+            # results.json is written last and atomically: its presence marks a complete entry
+            tmp_path = os.path.join(entry_dir, self.RESULTS_FILE + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'results': results, 'output_file': output_file}, f)
+            os.replace(tmp_path, os.path.join(entry_dir, self.RESULTS_FILE))
+
+            size = self._dir_size(entry_dir)
+            self._entries[digest] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def restore_output(self, cached_output, output_path):
+        """Copy a cached output image to `output_path`"""
+        shutil.copyfile(cached_output, output_path)
+
+    def _remove(self, digest):
+        # Caller holds self._lock
+        self._total_bytes -= self._entries.pop(digest, 0)
+        shutil.rmtree(self._entry_dir(digest), ignore_errors=True)
@@ -1,8 +1,14 @@
 import argparse
+import queue
+import threading
+import time
 import cv2
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 from ultralytics import YOLO
 from filterpy.kalman import KalmanFilter
+from rendering import draw_box, draw_hline, draw_label
+from video_output import FFmpegVideoWriter, VIDEO_OUTPUT_MODES
 
 class KalmanBoxTracker:
     count = 0
@@ -62,40 +68,210 @@ class KalmanBoxTracker:
         y2 = x[1] + h / 2.
         return [x1[0], y1[0], x2[0], y2[0]]
 
+class KalmanTrackBank:
+    """Constant-velocity Kalman filters for every track, stored as stacked arrays.
+
+    Uses the same model as KalmanBoxTracker, but keeps the state (N x 7) and
+    covariance (N x 7 x 7) of all tracks together so predict and update are
+    single batched matmuls instead of one filterpy call per track.
+    """
+    F = np.array([[1, 0, 0, 0, 1, 0, 0],
+                  [0, 1, 0, 0, 0, 1, 0],
+                  [0, 0, 1, 0, 0, 0, 1],
+                  [0, 0, 0, 1, 0, 0, 0],
+                  [0, 0, 0, 0, 1, 0, 0],
+                  [0, 0, 0, 0, 0, 1, 0],
+                  [0, 0, 0, 0, 0, 0, 1]], dtype=float)
+    H = np.array([[1, 0, 0, 0, 0, 0, 0],
+                  [0, 1, 0, 0, 0, 0, 0],
+                  [0, 0, 1, 0, 0, 0, 0],
+                  [0, 0, 0, 1, 0, 0, 0]], dtype=float)
+    R = np.diag([1., 1., 10., 10.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+    def __init__(self):
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+        self.ids = np.zeros(0, dtype=int)
+        self.time_since_update = np.zeros(0, dtype=int)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, bboxes):
+        """Start a track for each [x1, y1, x2, y2] box and return the new track ids"""
+        z = self._convert_bbox_to_z(bboxes)
+        count = len(z)
+        x = np.zeros((count, 7))
+        x[:, :4] = z
+        ids = np.arange(KalmanBoxTracker.count, KalmanBoxTracker.count + count)
+        KalmanBoxTracker.count += count
+        self.x = np.concatenate([self.x, x])
+        self.P = np.concatenate([self.P, np.broadcast_to(self.P0, (count, 7, 7))])
+        self.ids = np.concatenate([self.ids, ids])
+        self.time_since_update = np.concatenate([self.time_since_update, np.zeros(count, dtype=int)])
+        return ids
+
+    def predict(self):
+        self.x = self.x @ self.F.T
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        self.time_since_update += 1
+        return self.get_state()
+
+    def update(self, indices, bboxes):
+        """Correct the tracks at `indices` (which must be unique) with their matched boxes"""
+        indices = np.asarray(indices, dtype=int)
+        if len(indices) == 0:
+            return
+        z = self._convert_bbox_to_z(bboxes)
+        x = self.x[indices]
+        P = self.P[indices]
+        y = z - x @ self.H.T
+        PHT = P @ self.H.T
+        S = self.H @ PHT + self.R
+        # K = P H^T S^-1, solved against the symmetric S instead of inverting it
+        K = np.linalg.solve(S, PHT.transpose(0, 2, 1)).transpose(0, 2, 1)
+        x = x + np.einsum('nij,nj->ni', K, y)
+        # Joseph form, as filterpy uses, to keep P symmetric positive definite
+        I_KH = np.eye(7) - K @ self.H
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+        self.x[indices] = x
+        self.P[indices] = P
+        self.time_since_update[indices] = 0
+
+    def keep(self, mask):
+        """Drop every track whose entry in `mask` is False"""
+        self.x = self.x[mask]
+        self.P = self.P[mask]
+        self.ids = self.ids[mask]
+        self.time_since_update = self.time_since_update[mask]
+
+    def get_state(self, indices=None):
+        x = self.x if indices is None else self.x[indices]
+        return self._convert_x_to_bbox(x)
+
+    @staticmethod
+    def _convert_bbox_to_z(bboxes):
+        bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        w = bboxes[:, 2] - bboxes[:, 0]
+        h = bboxes[:, 3] - bboxes[:, 1]
+        return np.stack([bboxes[:, 0] + w / 2., bboxes[:, 1] + h / 2., w * h, w / h], axis=1)
+
+    @staticmethod
+    def _convert_x_to_bbox(x):
+        w = np.sqrt(x[:, 2] * x[:, 3])
+        h = x[:, 2] / w
+        return np.stack([x[:, 0] - w / 2., x[:, 1] - h / 2., x[:, 0] + w / 2., x[:, 1] + h / 2.], axis=1)
+
+def iou_batch(bb_test, bb_gt):
+    """Compute the IoU matrix between two sets of [x1, y1, x2, y2] boxes with broadcasting"""
+    bb_test = np.asarray(bb_test, dtype=float).reshape(-1, 4)[:, None, :]
+    bb_gt = np.asarray(bb_gt, dtype=float).reshape(-1, 4)[None, :, :]
+    xx1 = np.maximum(bb_test[..., 0], bb_gt[..., 0])
+    yy1 = np.maximum(bb_test[..., 1], bb_gt[..., 1])
+    xx2 = np.minimum(bb_test[..., 2], bb_gt[..., 2])
+    yy2 = np.minimum(bb_test[..., 3], bb_gt[..., 3])
+    inter_area = np.maximum(0., xx2 - xx1) * np.maximum(0., yy2 - yy1)
+    test_area = (bb_test[..., 2] - bb_test[..., 0]) * (bb_test[..., 3] - bb_test[..., 1])
+    gt_area = (bb_gt[..., 2] - bb_gt[..., 0]) * (bb_gt[..., 3] - bb_gt[..., 1])
+    return inter_area / (test_area + gt_area - inter_area + 1e-6)
+
+def hungarian_match(iou_matrix, iou_thresh):
+    """One-to-one assignment maximising total IoU; returns (det_idx, trk_idx) pairs"""
+    if iou_matrix.size == 0:
+        return []
+    det_idx, trk_idx = linear_sum_assignment(-iou_matrix)
+    keep = iou_matrix[det_idx, trk_idx] >= iou_thresh
+    return list(zip(det_idx[keep].tolist(), trk_idx[keep].tolist()))
+
+def greedy_match(iou_matrix, iou_thresh):
+    """Match every detection to its best tracker by IoU computed at the start of the frame.
+
+    Several detections may share a tracker, in which case it is updated once per detection.
+    The original per-detection loop recomputed IoU against trackers already updated by
+    earlier detections of the same frame, so results can differ from it when two
+    detections overlap the same track.
+    """
+    if iou_matrix.size == 0:
+        return []
+    trk_idx = iou_matrix.argmax(axis=1)
+    best_iou = iou_matrix[np.arange(len(trk_idx)), trk_idx]
+    det_idx = np.flatnonzero(best_iou >= iou_thresh)
+    return list(zip(det_idx.tolist(), trk_idx[det_idx].tolist()))
+
+MATCHERS = {
+    'hungarian': hungarian_match,
+    'greedy': greedy_match,
+}
+
 class KalmanTrackerManager:
-    def __init__(self, iou_thresh=0.5, max_age=30):
+    def __init__(self, iou_thresh=0.5, max_age=30, matching='hungarian', batched=True):
+        if matching not in MATCHERS:
+            raise ValueError(f"Unknown matching strategy '{matching}', expected one of {sorted(MATCHERS)}")
         self.trackers = []
+        self.bank = KalmanTrackBank() if batched else None
         self.iou_thresh = iou_thresh
         self.max_age = max_age
+        self.matching = matching
         self.frame_count = 0
+        # Class of every track reported by the last update(), replayed on predict-only frames
+        self._last_classes = {}
 
     def update(self, detections):
         self.frame_count += 1
+        if self.bank is not None:
+            updated_tracks = self._update_batched(detections)
+        else:
+            updated_tracks = self._update_objects(detections)
+        self._last_classes = {track[4]: track[5] for track in updated_tracks}
+        return updated_tracks
+
+    def predict(self):
+        """Advance every track by one frame without detections.
+
+        Used on frames the detector skips: returns the predicted boxes of the
+        tracks reported by the last update(), in the same layout as update().
+        Tracks unmatched for more than max_age frames are dropped, as in update().
+        """
+        self.frame_count += 1
+        if self.bank is not None:
+            states = self.bank.predict()
+            alive = self.bank.time_since_update <= self.max_age
+            rows = zip(states[alive].tolist(), self.bank.ids[alive].tolist())
+            self.bank.keep(alive)
+        else:
+            predicted = [(tracker.predict(), tracker) for tracker in self.trackers]
+            predicted = [(state, tracker) for state, tracker in predicted if tracker.time_since_update <= self.max_age]
+            self.trackers = [tracker for _, tracker in predicted]
+            rows = [(state, tracker.id) for state, tracker in predicted]
+        return [(*state, track_id, self._last_classes[track_id])
+                for state, track_id in rows if track_id in self._last_classes]
+
+    def _update_objects(self, detections):
         updated_tracks = []
         # Predict all trackers
         for tracker in self.trackers:
             tracker.predict()
 
-        unmatched_dets = []
-        for i, det in enumerate(detections):
-            matched = False
-            best_iou = -1
-            best_tracker = None
-            for tracker in self.trackers:
-                iou = self._iou(det[:4], tracker.get_state())
-                if iou >= self.iou_thresh and iou > best_iou:
-                    best_iou = iou
-                    best_tracker = tracker
-            
-            if best_tracker:
-                best_tracker.update(det[:4])
-                updated_tracks.append((*best_tracker.get_state(), best_tracker.id, det[5]))
-                matched = True
-            else:
-                unmatched_dets.append(det)
+        # Build the full detection x tracker IoU matrix in one shot and solve the assignment
+        det_boxes = np.array([det[:4] for det in detections], dtype=float).reshape(-1, 4)
+        trk_boxes = np.array([tracker.get_state() for tracker in self.trackers], dtype=float).reshape(-1, 4)
+        iou_matrix = iou_batch(det_boxes, trk_boxes)
+        matches = MATCHERS[self.matching](iou_matrix, self.iou_thresh)
+
+        matched_dets = set()
+        for det_idx, trk_idx in matches:
+            det = detections[det_idx]
+            tracker = self.trackers[trk_idx]
+            tracker.update(det[:4])
+            updated_tracks.append((*tracker.get_state(), tracker.id, det[5]))
+            matched_dets.add(det_idx)
 
         # Create new trackers for unmatched detections
-        for det in unmatched_dets:
+        for i, det in enumerate(detections):
+            if i in matched_dets:
+                continue
             tracker = KalmanBoxTracker(det[:4])
             updated_tracks.append((*tracker.get_state(), tracker.id, det[5]))
             self.trackers.append(tracker)
@@ -104,6 +280,43 @@ class KalmanTrackerManager:
         self.trackers = [t for t in self.trackers if t.time_since_update <= self.max_age]
         return updated_tracks
 
+    def _update_batched(self, detections):
+        """Same association logic as update(), running on the struct-of-arrays track bank"""
+        bank = self.bank
+        det_boxes = np.array([det[:4] for det in detections], dtype=float).reshape(-1, 4)
+        iou_matrix = iou_batch(det_boxes, bank.predict())
+        matches = MATCHERS[self.matching](iou_matrix, self.iou_thresh)
+
+        # Greedy matching may hit a track more than once; those updates are applied in
+        # successive rounds so each batched update touches every track at most once.
+        rounds = {}
+        seen = {}
+        for order, (det_idx, trk_idx) in enumerate(matches):
+            round_no = seen.get(trk_idx, 0)
+            seen[trk_idx] = round_no + 1
+            rounds.setdefault(round_no, []).append((order, det_idx, trk_idx))
+
+        updated_tracks = [None] * len(matches)
+        for round_matches in rounds.values():
+            orders, det_idx, trk_idx = (list(col) for col in zip(*round_matches))
+            bank.update(trk_idx, det_boxes[det_idx])
+            states = bank.get_state(trk_idx)
+            for order, d, t, state in zip(orders, det_idx, trk_idx, states.tolist()):
+                updated_tracks[order] = (*state, int(bank.ids[t]), detections[d][5])
+
+        # Create new tracks for unmatched detections
+        matched_dets = {det_idx for det_idx, _ in matches}
+        unmatched = [i for i in range(len(detections)) if i not in matched_dets]
+        if unmatched:
+            ids = bank.add(det_boxes[unmatched])
+            states = bank.get_state(np.arange(len(bank) - len(unmatched), len(bank)))
+            for i, track_id, state in zip(unmatched, ids.tolist(), states.tolist()):
+                updated_tracks.append((*state, track_id, detections[i][5]))
+
+        # Clean up old tracks
+        bank.keep(bank.time_since_update <= self.max_age)
+        return updated_tracks
+
     @staticmethod
     def _iou(bb1, bb2):
         x1 = max(bb1[0], bb2[0])
@@ -115,10 +328,281 @@ class KalmanTrackerManager:
         bb2_area = (bb2[2] - bb2[0]) * (bb2[3] - bb2[1])
         return inter_area / float(bb1_area + bb2_area - inter_area + 1e-6)
 
-def main(input_path, output_path):
-    # Load YOLOv8 model
-    model = YOLO("yolov8s.pt")  # Will download automatically if not present
-    tracker = KalmanTrackerManager()
+# Define class names for visualization (based on your Cityscapes mapping)
+CLASS_NAMES = {
+    0: "person", 1: "rider", 2: "car", 3: "truck", 4: "bus",
+    5: "motorcycle", 6: "bicycle", 7: "train", 8: "traffic light", 9: "traffic sign"
+}
+# Define a color map for each class (BGR format for OpenCV)
+CLASS_COLORS = {
+    0: (0, 255, 255),    # Yellow for person
+    1: (255, 0, 255),    # Magenta for rider
+    2: (255, 0, 0),      # Blue for car
+    3: (0, 0, 255),      # Red for truck
+    4: (0, 255, 0),      # Green for bus
+    5: (255, 255, 0),    # Cyan for motorcycle
+    6: (128, 0, 128),    # Purple for bicycle
+    7: (0, 128, 255),    # Orange for train
+    8: (0, 165, 255),    # Orange-Red for traffic light
+    9: (255, 128, 0)     # Light Blue for traffic sign
+}
+
+def class_names(model):
+    """Class id -> name table of `model`, falling back to CLASS_NAMES for detectors without one.
+
+    Both the rendered overlay and persisted tracks use this, so they name a track the same way.
+    """
+    return getattr(model, 'names', None) or CLASS_NAMES
+
+class LineCounter:
+    """Counts tracked objects whose centroid crosses a horizontal line"""
+    def __init__(self, line_y):
+        self.line_y = line_y
+        self.up_count = 0
+        self.down_count = 0
+        # Store the previous centroid y-coordinate for each track to detect crossings
+        self.track_previous_y = {}
+
+    def update(self, tracked):
+        """Update centroids; returns this frame's crossings as (obj_id, cls_id, 'up' | 'down')"""
+        crossings = []
+        current_active_ids = set()
+        for x1, y1, x2, y2, obj_id, cls_id in tracked:
+            current_active_ids.add(obj_id)
+            # Calculate current centroid y-coordinate
+            current_cy = (y1 + y2) / 2
+            # Get previous centroid y-coordinate
+            previous_cy = self.track_previous_y.get(obj_id)
+            if previous_cy is not None:
+                # Check for crossing the line
+                if previous_cy < self.line_y and current_cy >= self.line_y:
+                    self.down_count += 1
+                    crossings.append((obj_id, cls_id, 'down'))
+                    print(f"Object ID {obj_id} crossed DOWN. Total down: {self.down_count}")
+                elif previous_cy > self.line_y and current_cy <= self.line_y:
+                    self.up_count += 1
+                    crossings.append((obj_id, cls_id, 'up'))
+                    print(f"Object ID {obj_id} crossed UP. Total up: {self.up_count}")
+            # Update the previous y-coordinate for the next frame
+            self.track_previous_y[obj_id] = current_cy
+        # Clean up track_previous_y for objects that are no longer tracked
+        keys_to_delete = [obj_id for obj_id in self.track_previous_y if obj_id not in current_active_ids]
+        for obj_id in keys_to_delete:
+            del self.track_previous_y[obj_id]
+        return crossings
+
+def detections_from_result(result):
+    """Convert one ultralytics result into [x1, y1, x2, y2, conf, cls] rows"""
+    return [
+        [*box.xyxy[0].tolist(), box.conf.item(), box.cls.item()]
+        for box in result.boxes
+    ]
+
+def annotate_frame(frame, tracked, counter, names=CLASS_NAMES):
+    """Draw tracked boxes, the counting line and the running counts onto `frame` in place"""
+    for x1, y1, x2, y2, obj_id, cls_id in tracked:
+        # Get the color for the current class ID
+        color = CLASS_COLORS.get(int(cls_id), (255, 255, 255)) # Default to white if class ID not found
+        draw_box(frame, x1, y1, x2, y2, color, thickness=2)
+        # Get class name
+        class_name = names.get(int(cls_id), "unknown")
+        # Display ID and Class Name with the assigned color
+        label = f'ID:{obj_id} {class_name}'
+        draw_label(frame, x1, y1 - 18, label, color, size=13)
+    # Draw the counting line
+    draw_hline(frame, counter.line_y, (0, 255, 255), thickness=2) # Yellow line
+    # Display counts
+    draw_label(frame, 10, 10, f'Up: {counter.up_count}', (0, 255, 255), size=22)
+    draw_label(frame, 10, 40, f'Down: {counter.down_count}', (0, 255, 255), size=22)
+
+class DetectionScheduler:
+    """Decides which frames are sent to the detector.
+
+    With a fixed stride every `detect_every`-th frame is detected and the
+    tracker's Kalman prediction fills in the rest. In adaptive mode the stride
+    follows scene motion, measured as the mean absolute difference between
+    consecutive downscaled grayscale frames: quiet scenes stretch the stride
+    up to `max_stride`, busy ones shrink it, and a sudden jump in motion
+    triggers an immediate detection. Decisions depend only on the frames seen
+    so far, so they are the same whether or not the pipeline is threaded.
+    """
+    def __init__(self, detect_every=1, adaptive=False, max_stride=8,
+                 low_motion=1.0, high_motion=6.0, thumbnail_size=(64, 36)):
+        if detect_every < 1:
+            raise ValueError(f"detect_every must be at least 1, got {detect_every}")
+        self.stride = detect_every
+        self.adaptive = adaptive
+        self.max_stride = max(max_stride, detect_every)
+        self.low_motion = low_motion
+        self.high_motion = high_motion
+        self.thumbnail_size = thumbnail_size
+        self.frames_since_detect = None
+        self._previous_thumbnail = None
+        self._motion_total = 0.0
+
+    def should_detect(self, frame):
+        motion = self._motion(frame) if self.adaptive else 0.0
+        if self.frames_since_detect is None:
+            due = True
+        else:
+            self.frames_since_detect += 1
+            self._motion_total += motion
+            due = self.frames_since_detect >= self.stride
+        if self.adaptive and self.frames_since_detect:
+            if motion > self.high_motion:
+                # Sudden movement: detect now and tighten the stride
+                self.stride = max(1, self.stride // 2)
+                due = True
+            elif due:
+                mean_motion = self._motion_total / self.frames_since_detect
+                if mean_motion > self.high_motion:
+                    self.stride = max(1, self.stride // 2)
+                elif mean_motion < self.low_motion:
+                    self.stride = min(self.max_stride, self.stride + 1)
+        if due:
+            self.frames_since_detect = 0
+            self._motion_total = 0.0
+        return due
+
+    def _motion(self, frame):
+        thumbnail = cv2.cvtColor(cv2.resize(frame, self.thumbnail_size, interpolation=cv2.INTER_AREA),
+                                 cv2.COLOR_BGR2GRAY).astype(np.int16)
+        previous, self._previous_thumbnail = self._previous_thumbnail, thumbnail
+        if previous is None:
+            return 0.0
+        return float(np.abs(thumbnail - previous).mean())
+
+def iter_batches(cap, batch_size):
+    """Read frames from `cap` in lists of up to `batch_size`, preserving frame order"""
+    batch = []
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class StageTimer:
+    """Busy time and item count for one processing stage"""
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.items = 0
+
+    def timed(self, fn, *args, items=1):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.busy += time.perf_counter() - start
+        self.items += items
+        return result
+
+def print_stage_report(timers, wall_time):
+    """Print per-stage busy time so the slowest stage is easy to spot"""
+    frames = max(timers[0].items, 1)
+    bottleneck = max(timers, key=lambda t: t.busy)
+    print(f"⏱️ Processed {frames} frames in {wall_time:.2f}s ({frames / max(wall_time, 1e-9):.2f} fps)")
+    for timer in timers:
+        share = timer.busy / max(wall_time, 1e-9) * 100
+        print(f"   {timer.name:<8} {timer.busy:8.2f}s busy  {timer.busy / frames * 1000:8.2f} ms/frame  {share:5.1f}% of wall time")
+    print(f"   Bottleneck stage: {bottleneck.name}")
+
+_END = object()
+
+class FramePipeline:
+    """Runs decode -> infer -> track -> encode as threads joined by bounded queues.
+
+    Each stage is a single thread consuming its inbox in FIFO order, so batches
+    reach the tracker and the writer in exactly the decoded order. The queues
+    hold at most `queue_size` batches each, which bounds memory: a slow stage
+    blocks the ones upstream of it instead of letting frames pile up.
+    """
+    def __init__(self, queue_size=4):
+        self.queue_size = queue_size
+        self.stop_event = threading.Event()
+        self.errors = []
+
+    def _put(self, q, item):
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, exc):
+        self.errors.append(exc)
+        self.stop_event.set()
+
+    def _source(self, batches, timer, outbox):
+        try:
+            iterator = iter(batches)
+            while not self.stop_event.is_set():
+                batch = timer.timed(next, iterator, None, items=0)
+                if batch is None:
+                    break
+                timer.items += len(batch)
+                if not self._put(outbox, batch):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(outbox, _END)
+
+    def _stage(self, fn, timer, inbox, outbox):
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _END:
+                    break
+                result = timer.timed(fn, item, items=len(item))
+                if outbox is not None and not self._put(outbox, result):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if outbox is not None:
+                self._put(outbox, _END)
+
+    def run(self, batches, stages, timers):
+        """Feed `batches` through `stages` (a list of callables), one thread per stage"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in stages]
+        threads = [threading.Thread(target=self._source, args=(batches, timers[0], queues[0]),
+                                    name=timers[0].name, daemon=True)]
+        for n, (fn, timer) in enumerate(zip(stages, timers[1:])):
+            outbox = queues[n + 1] if n + 1 < len(stages) else None
+            threads.append(threading.Thread(target=self._stage, args=(fn, timer, queues[n], outbox),
+                                            name=timer.name, daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+def main(input_path, output_path, matching='hungarian', batch_size=1, model=None,
+         pipeline=True, queue_size=4, detect_every=1, adaptive_stride=False, max_stride=8,
+         progress_callback=None, output_mode='mp4', frame_callback=None):
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    scheduler = DetectionScheduler(detect_every, adaptive=adaptive_stride, max_stride=max_stride)
+    # Load YOLOv8 model unless the caller already holds one
+    if model is None:
+        model = YOLO("yolov8s.pt")  # Will download automatically if not present
+    names = class_names(model)
+    tracker = KalmanTrackerManager(matching=matching)
     # Video I/O
     cap = cv2.VideoCapture(input_path)
     if not cap.isOpened():
@@ -128,6 +612,7 @@ def main(input_path, output_path):
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     
     # --- CRITICAL CHANGE HERE ---
     # Use a more browser-compatible codec for MP4
@@ -141,90 +626,120 @@ def main(input_path, output_path):
     # If you want to output to WebM (requires changing output_filename extension in app.py to .webm):
     # fourcc = cv2.VideoWriter_fourcc(*"VP80")
 
-    out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
+    if output_mode == 'mp4':
+        out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
+    else:
+        # Fragmented MP4 / HLS segments are written as frames arrive, so playback can start early
+        out = FFmpegVideoWriter(output_path, fps, (frame_width, frame_height), mode=output_mode)
     
     # Define a horizontal counting line (e.g., at 60% of the frame height)
-    counting_line_y = int(frame_height * 0.6)
-    # Initialize counters
-    up_count = 0
-    down_count = 0
-    # Store the previous centroid y-coordinate for each track to detect crossings
-    track_previous_y = {}
-    # Define class names for visualization (based on your Cityscapes mapping)
-    class_names = {
-        0: "person", 1: "rider", 2: "car", 3: "truck", 4: "bus",
-        5: "motorcycle", 6: "bicycle", 7: "train", 8: "traffic light", 9: "traffic sign"
-    }
-    # Define a color map for each class (BGR format for OpenCV)
-    class_colors = {
-        0: (0, 255, 255),    # Yellow for person
-        1: (255, 0, 255),    # Magenta for rider
-        2: (255, 0, 0),      # Blue for car
-        3: (0, 0, 255),      # Red for truck
-        4: (0, 255, 0),      # Green for bus
-        5: (255, 255, 0),    # Cyan for motorcycle
-        6: (128, 0, 128),    # Purple for bicycle
-        7: (0, 128, 255),    # Orange for train
-        8: (0, 165, 255),    # Orange-Red for traffic light
-        9: (255, 128, 0)     # Light Blue for traffic sign
-    }
-    try:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            results = model(frame, verbose=False)[0]
-            detections = [
-                [*box.xyxy[0].tolist(), box.conf.item(), box.cls.item()]
-                for box in results.boxes
-            ]
-            tracked = tracker.update(detections)
+    counter = LineCounter(int(frame_height * 0.6))
+
+    def infer(frames):
+        # One inference call per batch for the frames the scheduler picks; results
+        # come back in frame order so the tracker sees exactly the same sequence
+        # as in unbatched mode. Skipped frames carry None instead of detections.
+        detect = [scheduler.should_detect(frame) for frame in frames]
+        selected = [frame for frame, flag in zip(frames, detect) if flag]
+        results = iter(model(selected, verbose=False) if selected else [])
+        return frames, [detections_from_result(next(results)) if flag else None for flag in detect]
+
+    frames_done = 0
+    track_ids = set()
+
+    def track(item):
+        nonlocal frames_done
+        frames, detections = item
+        for frame, frame_detections in zip(frames, detections):
+            if frame_detections is None:
+                # Skipped frame: the Kalman prediction stands in for the detector
+                tracked = tracker.predict()
+            else:
+                tracked = tracker.update(frame_detections)
             # Process tracked objects for counting
-            current_active_ids = set()
-            for x1, y1, x2, y2, obj_id, cls_id in tracked:
-                current_active_ids.add(obj_id)
-                # Calculate current centroid y-coordinate
-                current_cy = (y1 + y2) / 2
-                # Get previous centroid y-coordinate
-                previous_cy = track_previous_y.get(obj_id)
-                if previous_cy is not None:
-                    # Check for crossing the line
-                    if previous_cy < counting_line_y and current_cy >= counting_line_y:
-                        down_count += 1
-                        print(f"Object ID {obj_id} crossed DOWN. Total down: {down_count}")
-                    elif previous_cy > counting_line_y and current_cy <= counting_line_y:
-                        up_count += 1
-                        print(f"Object ID {obj_id} crossed UP. Total up: {up_count}")
-                # Update the previous y-coordinate for the next frame
-                track_previous_y[obj_id] = current_cy
-            # Clean up track_previous_y for objects that are no longer tracked
-            keys_to_delete = [obj_id for obj_id in track_previous_y if obj_id not in current_active_ids]
-            for obj_id in keys_to_delete:
-                del track_previous_y[obj_id]
-            for x1, y1, x2, y2, obj_id, cls_id in tracked:
-                # Get the color for the current class ID
-                color = class_colors.get(int(cls_id), (255, 255, 255)) # Default to white if class ID not found
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
-                # Get class name
-                class_name = class_names.get(int(cls_id), "unknown")
-                # Display ID and Class Name with the assigned color
-                label = f'ID:{obj_id} {class_name}'
-                cv2.putText(frame, label, (int(x1), int(y1) - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-            # Draw the counting line
-            cv2.line(frame, (0, counting_line_y), (frame_width, counting_line_y), (0, 255, 255), 2) # Yellow line
-            # Display counts
-            cv2.putText(frame, f'Up: {up_count}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-            cv2.putText(frame, f'Down: {down_count}', (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+            crossings = counter.update(tracked)
+            track_ids.update(int(row[4]) for row in tracked)
+            if frame_callback is not None:
+                # Receives every frame's boxes and crossings, e.g. to persist them
+                frame_callback(frames_done, tracked, crossings)
+            annotate_frame(frame, tracked, counter, names)
+            frames_done += 1
+        if progress_callback is not None:
+            elapsed = time.perf_counter() - start
+            progress_callback({
+                'frames_done': frames_done,
+                'total_frames': total_frames,
+                'fps': round(frames_done / elapsed, 2) if elapsed > 0 else 0.0,
+                'up_count': counter.up_count,
+                'down_count': counter.down_count,
+            })
+        return frames
+
+    def encode(frames):
+        for frame in frames:
             out.write(frame)
+
+    timers = [StageTimer(name) for name in ('decode', 'infer', 'track', 'encode')]
+    start = time.perf_counter()
+    finished = False
+    try:
+        batches = iter_batches(cap, batch_size)
+        if pipeline:
+            FramePipeline(queue_size).run(batches, [infer, track, encode], timers)
+        else:
+            decode_timer, infer_timer, track_timer, encode_timer = timers
+            while True:
+                frames = decode_timer.timed(next, batches, None, items=0)
+                if frames is None:
+                    break
+                decode_timer.items += len(frames)
+                item = infer_timer.timed(infer, frames, items=len(frames))
+                track_timer.timed(track, item, items=len(frames))
+                encode_timer.timed(encode, frames, items=len(frames))
+        finished = True
     finally:
         cap.release()
-        out.release()
+        try:
+            out.release()
+        except Exception as e:
+            if finished:
+                raise
+            # Tracking already failed; raising here would hide that error
+            print(f"❌ Video writer failed while handling a tracking error: {e}")
         print(f"✅ Tracking completed. Saved to: {output_path}")
+    wall_time = time.perf_counter() - start
+    print_stage_report(timers, wall_time)
+    return {
+        'frames': timers[0].items,
+        'up_count': counter.up_count,
+        'down_count': counter.down_count,
+        'tracks': len(track_ids),
+        'wall_time': wall_time,
+        'stage_times': {timer.name: timer.busy for timer in timers},
+    }
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run YOLOv8 tracking on a video file")
     parser.add_argument('--input', type=str, required=True, help='Path to input video file')
     parser.add_argument('--output', type=str, required=True, help='Path to save output video file')
+    parser.add_argument('--matching', choices=sorted(MATCHERS), default='hungarian',
+                        help='Detection-to-track assignment strategy')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Number of frames per YOLO inference call')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Run decode, inference, tracking and encoding on one thread')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='Maximum batches buffered between pipeline stages')
+    parser.add_argument('--detect-every', type=int, default=1,
+                        help='Run the detector on every N-th frame and interpolate the rest with the Kalman filter')
+    parser.add_argument('--adaptive-stride', action='store_true',
+                        help='Adjust the detection stride to the amount of motion in the scene')
+    parser.add_argument('--max-stride', type=int, default=8,
+                        help='Largest detection stride the adaptive mode may use')
+    parser.add_argument('--output-mode', choices=VIDEO_OUTPUT_MODES, default='mp4',
+                        help='mp4 (OpenCV), fmp4 (fragmented MP4) or hls (playlist + segments, --output ends in .m3u8)')
     args = parser.parse_args()
-    main(args.input, args.output)
+    main(args.input, args.output, matching=args.matching, batch_size=args.batch_size,
+         pipeline=not args.sequential, queue_size=args.queue_size,
+         detect_every=args.detect_every, adaptive_stride=args.adaptive_stride,
+         max_stride=args.max_stride, output_mode=args.output_mode)
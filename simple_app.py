@@ -6,10 +6,12 @@ No complex dependencies, just works
 from flask import Flask, request, render_template, send_from_directory, jsonify
 import os
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+import numpy as np
 import json
 import time
 from datetime import datetime
+from rendering import PALETTE, draw_box, draw_label, label_size, save_image
 
 app = Flask(__name__)
 
@@ -68,42 +70,23 @@ def simple_object_detection(image_path):
 def draw_detections(image_path, detections, output_path):
     """Draw bounding boxes on the image"""
     try:
-        img = Image.open(image_path)
-        draw = ImageDraw.Draw(img)
-        
-        # Try to use a better font
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 20)
-        except:
-            font = ImageFont.load_default()
-        
-        colors = ['red', 'blue', 'green', 'yellow', 'purple', 'orange']
+        with Image.open(image_path) as img:
+            frame = np.array(img.convert('RGB'))
         
         for i, det in enumerate(detections):
-            box = det['box']
-            label = det['label']
-            confidence = det['confidence']
-            color = colors[i % len(colors)]
+            x1, y1, x2, y2 = det['box']
+            color = PALETTE[i % len(PALETTE)]
             
             # Draw rectangle
-            draw.rectangle(box, outline=color, width=3)
-            
-            # Draw label
-            text = f"{label}: {confidence:.2f}"
-            text_bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            # Background for text
-            draw.rectangle([
-                box[0], box[1] - text_height - 5,
-                box[0] + text_width + 10, box[1]
-            ], fill=color)
-            
-            # Text
-            draw.text((box[0] + 5, box[1] - text_height), text, fill='white', font=font)
+            draw_box(frame, x1, y1, x2, y2, color, thickness=3)
+            
+            # Label on a filled background above the box
+            text = f"{det['label']}: {det['confidence']:.2f}"
+            text_width, text_height = label_size(text, 20)
+            draw_label(frame, x1 + 5, y1 - text_height - 2, text, (255, 255, 255), 20,
+                       background=color, padding=3)
         
-        img.save(output_path, 'JPEG', quality=95)
+        save_image(frame, output_path)
         return True
         
     except Exception as e:
@@ -8,6 +8,9 @@ import subprocess
 import time
 from pathlib import Path
 
+# Vendored hls.js 1.5.17 build the video pages serve for browsers without native HLS
+HLS_JS_PATH = os.path.join('static', 'js', 'vendor', 'hls.min.js')
+
 def check_dependencies():
     """Check if all required dependencies are installed"""
     print("🔍 Checking dependencies...")
@@ -52,6 +55,16 @@ def check_model():
         print("⚠️ YOLO model not found. It will be downloaded automatically on first use.")
         return True
 
+def check_player_assets():
+    """Check that the vendored hls.js build is in static/ (it is never fetched at runtime)"""
+    print("\n🎞️ Checking video player assets...")
+    
+    if os.path.exists(HLS_JS_PATH):
+        print("✅ hls.js found!")
+    else:
+        print(f"⚠️ {HLS_JS_PATH} is missing. HLS videos will only play in browsers with native support.")
+    return True
+
 def check_directories():
     """Ensure required directories exist"""
     print("\n📁 Checking directories...")
@@ -106,6 +119,9 @@ def main():
     if not check_directories():
         sys.exit(1)
     
+    if not check_player_assets():
+        sys.exit(1)
+    
     print("\n✅ All checks passed!")
     time.sleep(1)
     
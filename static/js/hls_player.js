@@ -0,0 +1,37 @@
+// Plays an HLS playlist in a <video> element: natively where supported (Safari),
+// otherwise through hls.js. While tracking is still running the playlist may
+// not exist yet, so loading is retried until the first segment is written.
+// Without either, the video is replaced by a notice saying playback is unavailable.
+function attachStream(video, playlistUrl, retryDelay = 2000) {
+    if (video.canPlayType('application/vnd.apple.mpegurl')) {
+        video.addEventListener('error', () => setTimeout(() => video.load(), retryDelay));
+        video.src = playlistUrl;
+        return;
+    }
+    if (!window.Hls || !Hls.isSupported()) {
+        showPlaybackUnavailable(video);
+        return;
+    }
+    const hls = new Hls();
+    hls.on(Hls.Events.ERROR, (event, data) => {
+        if (!data.fatal) {
+            return;
+        }
+        if (data.type === Hls.ErrorTypes.NETWORK_ERROR) {
+            setTimeout(() => hls.loadSource(playlistUrl), retryDelay);
+        } else {
+            hls.recoverMediaError();
+        }
+    });
+    hls.loadSource(playlistUrl);
+    hls.attachMedia(video);
+}
+
+function showPlaybackUnavailable(video) {
+    const notice = document.createElement('p');
+    notice.className = 'playback-unavailable';
+    notice.textContent = 'Video playback is unavailable: this browser cannot play HLS streams ' +
+        'and the hls.js player is not installed on this server.';
+    video.style.display = 'none';
+    video.after(notice);
+}
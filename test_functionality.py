@@ -64,6 +64,876 @@ def test_prediction():
         print(f"❌ Prediction test failed: {e}")
         return False
 
+def test_tracker_matching():
+    """Test the vectorized IoU matrix and the track assignment strategies"""
+    print("🔗 Testing tracker matching...")
+    from run_tracking import KalmanTrackerManager, iou_batch, hungarian_match, greedy_match
+
+    dets = np.array([[10, 10, 50, 50], [12, 12, 52, 52], [200, 200, 260, 280]], dtype=float)
+    trks = np.array([[11, 11, 51, 51], [205, 198, 262, 281]], dtype=float)
+    iou_matrix = iou_batch(dets, trks)
+    for i, det in enumerate(dets):
+        for j, trk in enumerate(trks):
+            assert abs(iou_matrix[i, j] - KalmanTrackerManager._iou(det, trk)) < 1e-9
+
+    # Optimal assignment is one-to-one, greedy lets both overlapping detections share a track
+    assert sorted(hungarian_match(iou_matrix, 0.5)) in ([(0, 0), (2, 1)], [(1, 0), (2, 1)])
+    assert sorted(greedy_match(iou_matrix, 0.5)) == [(0, 0), (1, 0), (2, 1)]
+
+    tracker = KalmanTrackerManager(matching='hungarian')
+    first = tracker.update([[*det, 0.9, 2.0] for det in dets])
+    second = tracker.update([[*(det + 2), 0.9, 2.0] for det in dets])
+    assert sorted(t[4] for t in first) == sorted(t[4] for t in second)
+    print("✅ Tracker matching works")
+
+def test_batched_kalman():
+    """Test that the batched track bank matches the per-object Kalman filters"""
+    print("🧮 Testing batched Kalman filter...")
+    from run_tracking import KalmanTrackerManager
+
+    rng = np.random.default_rng(0)
+    boxes = rng.uniform(0, 400, size=(20, 2))
+    boxes = np.hstack([boxes, boxes + rng.uniform(20, 80, size=(20, 2))])
+    velocity = rng.uniform(-3, 3, size=(20, 2))
+
+    per_object = KalmanTrackerManager(batched=False)
+    batched = KalmanTrackerManager(batched=True)
+    for frame in range(30):
+        shift = np.tile(velocity * frame, 2) + rng.normal(0, 0.5, size=(20, 4))
+        # Drop a few objects now and then so tracks age and get created
+        detections = [[*box, 0.9, 2.0] for box in (boxes + shift)[frame % 4:]]
+        expected = per_object.update(detections)
+        actual = batched.update(detections)
+        assert len(expected) == len(actual)
+        for exp, act in zip(expected, actual):
+            assert np.allclose(exp[:4], act[:4], rtol=1e-6, atol=1e-6)
+    print("✅ Batched Kalman filter matches per-object filters")
+
+def test_detection_stride():
+    """Test the detection schedule and the Kalman-predicted boxes on skipped frames"""
+    print("⏭️ Testing detection stride...")
+    import tempfile
+    import cv2
+    import run_tracking
+    from run_tracking import DetectionScheduler, KalmanTrackerManager
+
+    still = np.zeros((36, 64, 3), dtype=np.uint8)
+    fixed = DetectionScheduler(detect_every=3)
+    assert [fixed.should_detect(still) for _ in range(7)] == [True, False, False, True, False, False, True]
+
+    # A still scene stretches the stride up to max_stride; a sudden change is detected at once
+    adaptive = DetectionScheduler(detect_every=2, adaptive=True, max_stride=4)
+    schedule = [adaptive.should_detect(still) for _ in range(20)]
+    assert adaptive.stride == 4 and schedule[-8:].count(True) == 2, schedule
+    assert adaptive.should_detect(np.full_like(still, 255)) and adaptive.stride == 2
+
+    for batched in (True, False):
+        manager = KalmanTrackerManager(max_age=5, batched=batched)
+        for frame in range(10):
+            last = manager.update([[10.0 + 4 * frame, 20.0, 50.0 + 4 * frame, 60.0, 0.9, 2.0]])
+        predicted = manager.predict()
+        # Same track and class as the last update, carried on along its motion
+        assert [box[4:] for box in predicted] == [box[4:] for box in last]
+        assert 0 < predicted[0][0] - last[0][0] < 8 and abs(predicted[0][1] - last[0][1]) < 1
+        for _ in range(5):
+            predicted = manager.predict()
+        # Unmatched for more than max_age frames: dropped like in update()
+        assert predicted == [] and len(manager.bank if batched else manager.trackers) == 0
+
+    class CountingDetector:
+        """Stands in for YOLO: finds the white square and counts the frames it is given"""
+        frames = 0
+        names = {2: 'lorry'}
+        def __call__(self, frames, **kwargs):
+            results = []
+            for frame in frames:
+                self.frames += 1
+                ys, xs = np.nonzero(frame[:, :, 0] > 128)
+                box = type('Box', (), {'xyxy': np.array([[xs.min(), ys.min(), xs.max(), ys.max()]], float),
+                                       'conf': np.float64(0.9), 'cls': np.float64(2)})
+                results.append(type('Result', (), {'boxes': [box]}))
+            return results
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'square.mp4')
+        writer = cv2.VideoWriter(input_path, cv2.VideoWriter_fourcc(*'mp4v'), 10, (160, 120))
+        for i in range(12):
+            frame = np.zeros((120, 160, 3), dtype=np.uint8)
+            frame[40:80, 10 + 2 * i:50 + 2 * i] = 255
+            writer.write(frame)
+        writer.release()
+        detector, tracked_frames, labels = CountingDetector(), [], []
+        draw_label = run_tracking.draw_label
+        run_tracking.draw_label = lambda frame, x, y, text, *args, **kwargs: labels.append(text)
+        try:
+            summary = run_tracking.main(input_path, os.path.join(tmp, 'out.mp4'), model=detector, detect_every=3,
+                                        frame_callback=lambda index, tracked, crossings: tracked_frames.append(
+                                            [box[4] for box in tracked]))
+        finally:
+            run_tracking.draw_label = draw_label
+    assert summary['frames'] == 12 and detector.frames == 4, (summary, detector.frames)
+    # Skipped frames still report the track, under the same id
+    assert tracked_frames == [[tracked_frames[0][0]]] * 12, tracked_frames
+    # The overlay names classes from the model's own table, like the stored tracks
+    track_labels = [label for label in labels if label.startswith('ID:')]
+    assert len(track_labels) == 12 and all(label.endswith(' lorry') for label in track_labels), labels
+    assert run_tracking.class_names(detector) is detector.names
+    print("✅ Stride schedule holds and skipped frames carry the predicted tracks")
+
+def test_frame_pipeline():
+    """Test batch order, end-of-stream handling and error shutdown of the threaded frame pipeline"""
+    print("🧵 Testing frame pipeline...")
+    import itertools
+    import random
+    import threading
+    import time
+    from run_tracking import FramePipeline, StageTimer
+
+    def run_pipeline(batches, stages):
+        """Run in a thread so a pipeline that never ends fails the test instead of hanging it"""
+        outcome = {}
+        def target():
+            try:
+                FramePipeline(queue_size=2).run(batches, stages, [StageTimer(str(n)) for n in range(4)])
+            except Exception as e:
+                outcome['error'] = e
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        assert not thread.is_alive(), "pipeline did not finish"
+        return outcome.get('error')
+
+    # Stages of uneven speed still hand batches on in decoded order, and the end-of-stream
+    # marker is never passed to a stage
+    written = []
+    def jittery(batch):
+        time.sleep(random.uniform(0, 0.003))
+        return [value * 2 for value in batch]
+    batches = [[n, n + 1] for n in range(0, 80, 2)]
+    assert run_pipeline(batches, [jittery, jittery, written.extend]) is None
+    assert written == [value * 4 for value in range(80)]
+
+    # A failing stage stops the source and the other stages, and its error is raised
+    decoded = itertools.count()
+    def endless():
+        while True:
+            yield [next(decoded)]
+    def infer(batch):
+        if batch[0] == 5:
+            raise ValueError("inference failed")
+        return batch
+    encoded = []
+    error = run_pipeline(endless(), [infer, lambda batch: batch, encoded.extend])
+    assert isinstance(error, ValueError) and str(error) == "inference failed"
+    assert encoded == list(range(len(encoded))) and len(encoded) <= 5
+    assert next(decoded) < 50, "source kept decoding after the failure"
+    print("✅ Batches stay in order and an error stops every stage")
+
+def test_job_events():
+    """Test JobQueue job states, progress events and the /api/job/<id>/events stream"""
+    print("📣 Testing job queue events...")
+    import json
+    import threading
+    import time
+    from flask import Flask
+    from job_queue import JobQueue
+    from models import db, ProcessingJob
+
+    queue_app = Flask(__name__)
+    queue_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(queue_app)
+    with queue_app.app_context():
+        db.create_all()
+        jobs = [ProcessingJob(filename=f'{i}.jpg', file_type='image', status='pending') for i in range(2)]
+        db.session.add_all(jobs)
+        db.session.commit()
+        ok_id, failing_id = (job.id for job in jobs)
+
+    finished = []
+    job_queue = JobQueue(queue_app, on_finish=lambda job_id, result: finished.append((job_id, result['status'])))
+    release = threading.Event()
+    def handler(job):
+        job_queue.update_progress(job.id, frames_done=1, total_frames=2)
+        release.wait(5)
+        job.status = 'completed'
+        db.session.commit()
+        return {'objects_detected': 3}
+    def failing_handler(job):
+        raise RuntimeError("detector offline")
+
+    future = job_queue.submit(ok_id, handler)
+    subscription = job_queue.subscribe(ok_id)
+    release.set()
+    future.result(timeout=5)
+    events = []
+    while not events or events[-1][0] != 'result':
+        events.append(subscription.get(timeout=5))
+    statuses = [data.get('status') for event, data in events if event == 'progress']
+    assert statuses[-1] == 'completed' and 'processing' in statuses, events
+    assert any(data.get('frames_done') == 1 for event, data in events if event == 'progress')
+    assert events[-1][1] == {'objects_detected': 3, 'status': 'completed', 'error_message': None}
+    # A late subscriber gets the final state straight away
+    late = job_queue.subscribe(ok_id)
+    assert [late.get_nowait()[0], late.get_nowait()[0]] == ['progress', 'result']
+
+    job_queue.submit(failing_id, failing_handler).result(timeout=5)
+    job_queue.submit(10 ** 9, handler).result(timeout=5)
+    with queue_app.app_context():
+        failed = db.session.get(ProcessingJob, failing_id)
+        assert failed.status == 'failed' and failed.error_message == "detector offline"
+    assert finished == [(ok_id, 'completed'), (failing_id, 'failed'), (10 ** 9, 'failed')], finished
+    job_queue.shutdown()
+
+    # The event stream sends progress as it happens and closes after the result
+    import app
+    job_id = 10 ** 9 + 1
+    app.job_queue.update_progress(job_id, status='processing')
+    def run_job():
+        time.sleep(0.2)
+        app.job_queue.update_progress(job_id, frames_done=5, total_frames=10)
+        app.job_queue.finish(job_id, {'status': 'completed', 'error_message': None})
+    threading.Thread(target=run_job, daemon=True).start()
+    client = app.app.test_client()
+    response = client.get(f'/api/job/{job_id}/events')
+    assert response.mimetype == 'text/event-stream'
+    messages = [message.split('\n') for message in response.get_data(as_text=True).strip().split('\n\n')]
+    assert [lines[0] for lines in messages][-1] == 'event: result'
+    assert json.loads(messages[-1][1][len('data: '):])['status'] == 'completed'
+    assert any('"frames_done": 5' in lines[1] for lines in messages[:-1]), messages
+    assert client.get('/api/job/999999999999/events').status_code == 404
+    print("✅ Job states, progress events and the event stream agree")
+
+def test_result_cache():
+    """Test that cached results survive a reload and the LRU bound is enforced"""
+    print("♻️ Testing result cache...")
+    import tempfile
+    from result_cache import ResultCache
+
+    with tempfile.TemporaryDirectory() as root:
+        output_path = os.path.join(root, 'output.jpg')
+        with open(output_path, 'wb') as f:
+            f.write(b'x' * 1000)
+        cache = ResultCache(os.path.join(root, 'cache'), max_bytes=2500)
+        for digest in ('aa' * 32, 'bb' * 32, 'cc' * 32):
+            cache.put(digest, {'total_detections': 1}, output_path)
+
+        # A reloaded cache sees the same entries; the oldest was evicted
+        cache = ResultCache(os.path.join(root, 'cache'), max_bytes=2500)
+        assert cache.get('aa' * 32) is None
+        results, cached_output = cache.get('cc' * 32)
+        assert results == {'total_detections': 1}
+        assert os.path.getsize(cached_output) == 1000
+    print("✅ Result cache stores, reloads and evicts entries")
+
+def test_result_cache_keys():
+    """Test that fallback results are not cached and cache keys follow the detector"""
+    print("🔑 Testing result cache keys...")
+    import shutil
+    import tempfile
+    import app
+    from result_cache import ResultCache
+
+    class FakeDetector:
+        model_name = 'fake-a'
+        result_model = 'fallback-detector'
+
+        def detect_objects(self, image_path, image=None):
+            return {'detections': [], 'total_detections': 0, 'model': self.result_model}
+
+        def draw_detections(self, image_path, detections, output_path, image=None, encoding=None):
+            shutil.copy(image_path, output_path)
+            return True
+
+    saved = app.model, app.result_cache
+    image_path = create_test_image()
+    with tempfile.TemporaryDirectory() as root:
+        try:
+            app.model = FakeDetector()
+            app.result_cache = ResultCache(root)
+            digest = 'ab' * 32
+            encoding = app.app.config['OUTPUT_ENCODING']
+            key = app.encoding_cache_key(digest, encoding)
+
+            # A hosted outage's mock boxes must not be served for these bytes later
+            app.run_prediction(image_path, 'cache_key_test.jpg', digest=digest, encoding=encoding)
+            assert app.result_cache.get(key) is None
+            app.model.result_model = 'fake-a'
+            app.run_prediction(image_path, 'cache_key_test.jpg', digest=digest, encoding=encoding)
+            assert app.result_cache.get(key) is not None
+
+            app.model.model_name = 'fake-b'
+            assert app.encoding_cache_key(digest, encoding) != key
+        finally:
+            app.model, app.result_cache = saved
+            os.remove(image_path)
+            output_path = os.path.join(app.PREDICTED_IMAGES_FOLDER, 'cache_key_test.jpg')
+            if os.path.exists(output_path):
+                os.remove(output_path)
+    print("✅ Fallback results skipped, keys change with the detector")
+
+def test_hosted_stub():
+    """Test the hosted detector against the local API stub"""
+    print("🧪 Testing hosted detector against stub server...")
+    from hosted_model import HostedObjectDetector
+    from hosted_stub import start_stub_server
+
+    server, url = start_stub_server()
+    try:
+        detector = HostedObjectDetector(api_url=url)
+        image_path = create_test_image()
+        results = detector.detect_objects(image_path)
+        assert results['model'] == 'huggingface-detr'
+        assert [d['class_name'] for d in results['detections']] == ['person', 'car']
+        assert server.state.requests == 1
+
+        # Batched detection yields results in input order
+        paths = [image_path] * 3
+        batch = list(detector.detect_objects_many(paths))
+        assert [path for path, _ in batch] == paths
+        assert all(results['total_detections'] == 2 for _, results in batch)
+        # The session caps requests at max_concurrency, so more in flight is refused
+        try:
+            list(detector.detect_objects_many(paths, max_in_flight=detector.max_concurrency + 1))
+            raise AssertionError("max_in_flight above max_concurrency was accepted")
+        except ValueError:
+            pass
+    finally:
+        server.shutdown()
+        if os.path.exists('test_image.jpg'):
+            os.remove('test_image.jpg')
+    print("✅ Hosted detector parsed the stub response")
+
+def test_hosted_resilience():
+    """Test retries, the circuit breaker and request coalescing against a flaky stub"""
+    print("🔁 Testing hosted detector retries and coalescing...")
+    import threading
+    from hosted_model import HostedObjectDetector, CircuitBreaker
+    from hosted_stub import start_stub_server
+
+    image_path = create_test_image()
+    server, url = start_stub_server(fail_first=2, latency=0.1)
+    try:
+        # Two injected 503s are retried away
+        detector = HostedObjectDetector(api_url=url, backoff=0.01)
+        assert detector.detect_objects(image_path)['model'] == 'huggingface-detr'
+        assert server.state.requests == 3
+
+        # Concurrent identical uploads share one request
+        threads = [threading.Thread(target=detector.detect_objects, args=(image_path,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert server.state.requests == 4
+
+        # A dead endpoint trips the breaker and stops receiving requests
+        server.state.error_rate = 1.0
+        detector = HostedObjectDetector(api_url=url, backoff=0.01, max_retries=1,
+                                        circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        for _ in range(3):
+            assert detector.detect_objects(image_path)['model'] == 'fallback-detector'
+        assert detector.circuit_breaker.state == 'open'
+        assert server.state.requests == 6
+    finally:
+        server.shutdown()
+        os.remove(image_path)
+    print("✅ Hosted detector retries, coalesces and trips its breaker")
+
+def test_hosted_downscale():
+    """Test that large uploads are shrunk and boxes are mapped back to full resolution"""
+    print("📐 Testing hosted upload downscaling...")
+    from hosted_model import HostedObjectDetector
+    from hosted_stub import start_stub_server, stub_detections
+
+    image_path = "test_large.png"
+    cv2.imwrite(image_path, np.random.default_rng(0).integers(0, 255, size=(1200, 1600, 3), dtype=np.uint8))
+    server, url = start_stub_server()
+    try:
+        results = HostedObjectDetector(api_url=url, max_side=800).detect_objects(image_path)
+        upload = results['upload']
+        assert upload['sent_size'] == [800, 600]
+        assert upload['sent_bytes'] < upload['original_bytes'] // 10
+        expected = [d['box'] for d in stub_detections(1600, 1200)]
+        for det, box in zip(results['detections'], expected):
+            assert abs(det['bbox']['x2'] - box['xmax']) <= 2 and abs(det['bbox']['y2'] - box['ymax']) <= 2
+    finally:
+        server.shutdown()
+        os.remove(image_path)
+    print(f"✅ Upload shrunk from {upload['original_bytes']} to {upload['sent_bytes']} bytes")
+
+def test_rendering():
+    """Test in-place box and label drawing with cached glyphs"""
+    print("🎨 Testing annotation rendering...")
+    from rendering import draw_box, draw_label, glyph_mask, label_mask
+
+    frame = np.zeros((100, 200, 3), dtype=np.uint8)
+    draw_box(frame, 10, 20, 60, 80, (0, 255, 0), thickness=2)
+    assert (frame[20, 10:61] == [0, 255, 0]).all() and (frame[80, 10:61] == [0, 255, 0]).all()
+    assert (frame[50, 30] == 0).all()
+
+    # Boxes and labels hanging off the frame are clipped, not errors
+    draw_box(frame, -50, -50, 500, 500, (255, 0, 0))
+    draw_label(frame, 190, -5, "car: 0.90", (255, 255, 255))
+    draw_label(frame, 70, 30, "car: 0.90", (255, 255, 255))
+    assert frame[30:50, 70:150].max() > 0
+    assert glyph_mask("c", 16) is glyph_mask("c", 16)
+    # New track IDs reuse the cached digit glyphs instead of rasterising new labels
+    label_mask("ID:0123456789 car", 16)
+    misses = glyph_mask.cache_info().misses
+    for track_id in range(1000, 1200):
+        label_mask(f"ID:{track_id} car", 16)
+    assert glyph_mask.cache_info().misses == misses
+    assert label_mask("ID:7 car", 16).shape[0] == label_mask("ID:8 car", 16).shape[0]
+    print("✅ Rendering draws in place and reuses glyph masks")
+
+def test_output_encoding():
+    """Test per-request output encoding options and their recorded stats"""
+    print("🗜️ Testing output encoding...")
+    import tempfile
+    from rendering import parse_encoding, save_image
+
+    encoding = parse_encoding({'format': 'webp', 'quality': '70', 'max_side': '320', 'thumbnail_side': '64'})
+    for bad in ({'format': 'gif'}, {'quality': '0'}, {'max_side': '4'}):
+        try:
+            parse_encoding(bad)
+            raise AssertionError(f"{bad} was accepted")
+        except ValueError:
+            pass
+
+    frame = np.random.default_rng(0).integers(0, 255, size=(480, 640, 3), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, 'output_test.webp')
+        stats = save_image(frame, output_path, encoding)
+        assert (stats['format'], stats['width'], stats['height']) == ('webp', 320, 240)
+        assert stats['output_bytes'] == os.path.getsize(output_path)
+        assert os.path.getsize(os.path.join(tmp, stats['thumbnail_filename'])) == stats['thumbnail_bytes']
+    print(f"✅ Encoded {stats['output_bytes']} bytes in {stats['encode_time'] * 1000:.1f} ms")
+
+def test_range_requests():
+    """Test conditional GET and single/multi Range responses for processed videos"""
+    print("📼 Testing Range requests...")
+    import app
+
+    name = 'range_test.bin'
+    path = os.path.join(app.OUTPUT_FOLDER, name)
+    data = os.urandom(4096)
+    with open(path, 'wb') as f:
+        f.write(data)
+    try:
+        client = app.app.test_client()
+        url = f'/static/outputs/{name}'
+        full = client.get(url)
+        assert full.status_code == 200 and full.headers['Accept-Ranges'] == 'bytes'
+        etag = full.headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        single = client.get(url, headers={'Range': 'bytes=100-199'})
+        assert single.status_code == 206 and single.data == data[100:200]
+
+        multi = client.get(url, headers={'Range': 'bytes=0-9,-10', 'If-Range': etag})
+        assert multi.status_code == 206 and multi.mimetype == 'multipart/byteranges'
+        assert int(multi.headers['Content-Length']) == len(multi.data)
+        assert data[:10] in multi.data and data[-10:] in multi.data
+
+        stale = client.get(url, headers={'Range': 'bytes=0-9,-10', 'If-Range': '"stale"'})
+        assert stale.status_code == 200 and stale.data == data
+        assert client.get(url, headers={'Range': 'bytes=5000-5100,6000-'}).status_code == 416
+
+        # Overlapping ranges are merged; adjacent ones become one part
+        overlap = client.get(url, headers={'Range': 'bytes=0-9,5-14'})
+        assert overlap.status_code == 206 and overlap.data == data[:15]
+        assert overlap.headers['Content-Range'] == f'bytes 0-14/{len(data)}'
+        adjacent = client.get(url, headers={'Range': 'bytes=100-109,0-9,10-19'})
+        assert adjacent.status_code == 206 and adjacent.data.count(b'Content-Range') == 2
+        assert data[:20] in adjacent.data and data[100:110] in adjacent.data
+
+        # Too many ranges: the header is ignored and the whole file is sent
+        many = ','.join(f'{i * 100}-{i * 100 + 9}' for i in range(20))
+        full_again = client.get(url, headers={'Range': f'bytes={many}'})
+        assert full_again.status_code == 200 and full_again.data == data
+        assert client.get('/static/outputs/../app.py').status_code == 404
+    finally:
+        os.remove(path)
+    print("✅ Range and conditional requests answered correctly")
+
+def test_streaming_output():
+    """Test HLS output written by the ffmpeg video writer"""
+    print("📡 Testing streaming video output...")
+    import tempfile
+    import cv2
+    import run_tracking
+    from video_output import FFmpegVideoWriter, find_ffmpeg
+
+    class FailingWriter:
+        """An ffmpeg writer whose process exits non-zero"""
+        def __init__(self, *args, **kwargs):
+            pass
+        def write(self, frame):
+            pass
+        def release(self):
+            raise RuntimeError("ffmpeg failed with exit code 1")
+
+    def failing_detector(frames, **kwargs):
+        raise ValueError("detector failed")
+
+    # A writer failing on release must not replace the error that stopped tracking
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'input.mp4')
+        writer = cv2.VideoWriter(input_path, cv2.VideoWriter_fourcc(*'mp4v'), 10, (64, 48))
+        for _ in range(3):
+            writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+        writer.release()
+        real_writer, run_tracking.FFmpegVideoWriter = run_tracking.FFmpegVideoWriter, FailingWriter
+        try:
+            run_tracking.main(input_path, os.path.join(tmp, 'index.m3u8'), model=failing_detector,
+                              output_mode='hls')
+            raise AssertionError("tracking error was not raised")
+        except ValueError as e:
+            assert str(e) == "detector failed"
+        finally:
+            run_tracking.FFmpegVideoWriter = real_writer
+
+    if find_ffmpeg() is None:
+        print("⚠️ ffmpeg not found, skipping")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        playlist = os.path.join(tmp, 'video', 'index.m3u8')
+        writer = FFmpegVideoWriter(playlist, 10, (161, 120), mode='hls', segment_seconds=1)
+        for i in range(30):
+            writer.write(np.full((120, 161, 3), i * 8, dtype=np.uint8))
+        writer.release()
+        with open(playlist) as f:
+            text = f.read()
+        segments = [line for line in text.splitlines() if line.endswith('.m4s')]
+        assert '#EXT-X-ENDLIST' in text and len(segments) == 3, text
+        assert all(os.path.exists(os.path.join(tmp, 'video', name)) for name in segments + ['init.mp4'])
+    print(f"✅ Wrote {len(segments)} HLS segments")
+
+def test_bulk_detections():
+    """Test bulk detection inserts and aggregated per-class stats"""
+    print("🗃️ Testing bulk detection storage...")
+    from flask import Flask
+    from database import save_detections
+    from models import db, Detection, ObjectClass
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    bbox = {'x1': 0.0, 'y1': 0.0, 'x2': 10.0, 'y2': 10.0}
+    with app.app_context():
+        db.create_all()
+        save_detections(1, [{'class_name': 'car', 'confidence': c, 'bbox': bbox} for c in (0.5, 0.7)])
+        db.session.commit()
+        save_detections(2, [{'class_name': 'car', 'confidence': 0.9, 'bbox': bbox},
+                            {'class_name': 'person', 'confidence': 0.8, 'bbox': bbox}])
+        db.session.commit()
+        assert Detection.query.count() == 4
+        car = ObjectClass.query.filter_by(class_name='car').one()
+        assert car.detection_count == 3 and abs(car.avg_confidence - 0.7) < 1e-9
+        assert ObjectClass.query.filter_by(class_name='person').one().detection_count == 1
+    print("✅ Stored 4 detections and 2 class stats")
+
+def test_track_persistence():
+    """Test line crossing events and chunked storage of video tracking output"""
+    print("🎞️ Testing tracking persistence...")
+    from flask import Flask
+    from run_tracking import LineCounter
+    from database import save_track_chunk, TrackBox, LineCrossing
+    from models import db
+
+    counter = LineCounter(50)
+    crossings = []
+    for frame_index, y in enumerate((30, 40, 60, 45)):
+        for track_id, cls_id, direction in counter.update([(0, y - 5, 10, y + 5, 7, 2)]):
+            crossings.append((frame_index, track_id, 'car', direction))
+    assert [c[3] for c in crossings] == ['down', 'up'], crossings
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        boxes = [(frame, track, 'car', 0.0, 0.0, 10.0, 10.0) for frame in range(4) for track in range(3)]
+        save_track_chunk(1, {'frames': 4, 'boxes': boxes, 'crossings': crossings})
+        db.session.commit()
+        assert TrackBox.query.filter_by(job_id=1).count() == 12
+        assert LineCrossing.query.filter_by(job_id=1, direction='up').one().frame_index == 3
+    print("✅ Stored 12 track boxes and 2 line crossings")
+
+def test_worker_reaping():
+    """Test that jobs of a crashed video worker fail even while other jobs keep reporting"""
+    print("🪦 Testing video worker reaping...")
+    import queue
+    import threading
+    import time
+    import video_workers
+    from video_workers import IDLE_SLOT, VideoJobError, VideoWorkerPool
+
+    pool = VideoWorkerPool(concurrency=2)
+    pool._result_queue = queue.Queue()
+    respawned = []
+    pool._spawn_worker = lambda: respawned.append(True)
+    finished, taken = pool.submit('a.mp4', 'a_out.mp4'), pool.submit('b.mp4', 'b_out.mp4')
+    busy = pool.submit('c.mp4', 'c_out.mp4', progress=lambda progress: None)
+    # One job reported 'done' before the crash; the other was taken but never reported on
+    class DeadProcess:
+        pid, exitcode = 4242, -9
+        def is_alive(self):
+            return False
+    dead = DeadProcess()
+    pool._processes.append(dead)
+    pool._slots[dead] = [0, 1]
+    pool._result_queue.put((0, 'done', {'frames': 3}))
+
+    # Another job sends progress faster than the result queue timeout
+    stop = threading.Event()
+    def report():
+        while not stop.is_set():
+            pool._result_queue.put((2, 'progress', {'frames_done': 1, 'total_frames': 10}))
+            time.sleep(0.05)
+    reporter = threading.Thread(target=report, daemon=True)
+    reporter.start()
+    interval, video_workers.REAP_INTERVAL = video_workers.REAP_INTERVAL, 0.2
+    pool._listener = threading.Thread(target=pool._listen, daemon=True)
+    pool._listener.start()
+    try:
+        assert finished.result(timeout=5) == {'frames': 3}
+        try:
+            taken.result(timeout=5)
+            raise AssertionError("job of the dead worker did not fail")
+        except VideoJobError as e:
+            assert '4242' in str(e)
+    finally:
+        video_workers.REAP_INTERVAL = interval
+        stop.set()
+        pool._closed = True
+    assert not busy.done() and respawned == [True] and dead not in pool._slots
+    print("✅ Crashed worker reaped under steady progress traffic")
+
+def test_worker_main_import():
+    """Test that spawned video workers re-importing app.py skip detector, database and queue setup"""
+    print("📦 Testing app.py import in spawned workers...")
+    import runpy
+    import detectors
+    created = []
+    create_detector = detectors.create_detector
+    detectors.create_detector = lambda *args, **kwargs: created.append(args)
+    try:
+        # multiprocessing's spawn start method runs the parent's script under this name
+        namespace = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'),
+                                   run_name='__mp_main__')
+    finally:
+        detectors.create_detector = create_detector
+    assert namespace['IN_VIDEO_WORKER'] and not created
+    assert namespace['model'] is None and namespace['job_queue'] is None
+    assert 'sqlalchemy' not in namespace['app'].extensions
+    print("✅ Worker import of app.py skips detector, database and job queue")
+
+def test_stat_counters():
+    """Test that incremental dashboard counters match a full recount"""
+    print("🧮 Testing incremental statistics...")
+    from flask import Flask
+    from database import JobUpload, StatCounter, get_database_stats, rebuild_stat_counters
+    from models import db, ProcessingJob
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        jobs = [ProcessingJob(filename=f'{i}.jpg', file_type='image', status='pending') for i in range(4)]
+        db.session.add_all(jobs)
+        db.session.commit()
+        for i, job in enumerate(jobs):
+            job.status = 'processing'
+            db.session.commit()
+            # Attributes are expired after each commit, so old values must be reloaded
+            job.status = 'failed' if i == 3 else 'completed'
+            job.processing_time = None if i == 3 else 0.2 * (i + 1)
+            db.session.commit()
+        # Hosted detector upload metadata, as returned under results['upload']
+        upload = {'original_bytes': 4000, 'sent_bytes': 1000, 'original_size': [1600, 1200],
+                  'sent_size': [800, 600], 'format': 'JPEG', 'encode_time': 0.01, 'request_time': 0.3}
+        db.session.add(JobUpload.from_stats(jobs[1].id, upload))
+        db.session.commit()
+        db.session.delete(jobs[0])
+        db.session.commit()
+
+        stats = get_database_stats()
+        assert stats['status_counts'] == {'pending': 0, 'processing': 0, 'completed': 2, 'failed': 1}
+        assert stats['total_jobs'] == 3 and abs(stats['latency']['image']['avg'] - 0.5) < 1e-9
+        assert stats['latency']['image']['histogram']['0.5'] == 1
+        assert stats['hosted_upload'] == {'count': 1, 'avg_original_bytes': 4000,
+                                          'avg_sent_bytes': 1000, 'bytes_saved': 3000}
+        saved = JobUpload.query.filter_by(job_id=jobs[1].id).one().to_dict()
+        assert saved['sent_size'] == [800, 600] and saved['bytes_saved'] == 3000
+        live = {name: value for name, value in db.session.query(StatCounter.name, StatCounter.value) if value}
+        rebuilt = {name: value for name, value in rebuild_stat_counters().items() if value}
+        assert live.keys() == rebuilt.keys() and all(abs(live[k] - rebuilt[k]) < 1e-9 for k in live)
+    print("✅ Counters match a full recount")
+
+def test_response_cache():
+    """Test TTL expiry, invalidation and ETags of the stats response cache"""
+    print("🗂️ Testing response cache...")
+    import time
+    from response_cache import ResponseCache
+
+    cache = ResponseCache(ttl=0.2)
+    body, _, etag = cache.put('/api/stats', b'{"total_jobs": 1}', 'application/json', cache.generation)
+    assert cache.get('/api/stats') == (body, 'application/json', etag)
+    time.sleep(0.25)
+    assert cache.get('/api/stats') is None
+
+    # A body rendered before an invalidation must not be stored
+    generation = cache.generation
+    cache.invalidate()
+    cache.put('/api/stats', b'stale', 'application/json', generation)
+    assert cache.get('/api/stats') is None
+    _, _, same_etag = cache.put('/api/stats', body, 'application/json', cache.generation)
+    assert same_etag == etag
+    print("✅ Response cache expires, invalidates and keeps stable ETags")
+
+def test_database_profile():
+    """Test WAL, the single writer and the read-only pool of the production database profile"""
+    print("🗄️ Testing production database profile...")
+    import os
+    import tempfile
+    import threading
+    from flask import Flask
+    from sqlalchemy.exc import OperationalError
+    from database import create_database_config, get_database_stats, get_read_session
+    from models import db, ProcessingJob
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        create_database_config(app, database_path=os.path.join(tmp, 'test.db'), profile='production')
+        with app.app_context():
+            db.create_all()
+            assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+            # Sessions waiting for the writer hold connections, so the write pool must not be capped
+            assert db.engine.pool._max_overflow == -1
+
+        def upload(i):
+            with app.app_context():
+                for _ in range(5):
+                    db.session.add(ProcessingJob(filename=f'{i}.jpg', file_type='image', status='pending'))
+                    db.session.commit()
+
+        threads = [threading.Thread(target=upload, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with app.app_context():
+            assert app.extensions['db_writer'].writes >= 20
+            assert get_database_stats()['total_jobs'] == 20
+            try:
+                get_read_session().execute(db.text("DELETE FROM processing_job"))
+                raise AssertionError("read-only session accepted a write")
+            except OperationalError:
+                pass
+            db.session.remove()
+            db.engine.dispose()
+            app.extensions['read_session'].get_bind().dispose()
+    print("✅ Concurrent writes serialised, reads isolated on query_only connections")
+
+def test_job_pagination():
+    """Test keyset pagination of the job listing and its indexes"""
+    print("📑 Testing job pagination...")
+    from datetime import datetime, timedelta
+    from flask import Flask
+    from database import ensure_indexes, get_jobs_page
+    from models import db, ProcessingJob
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        assert ensure_indexes() == []
+        start = datetime(2024, 1, 1)
+        # Pairs of jobs share a timestamp, so pages must break ties by id
+        db.session.add_all(ProcessingJob(filename=f'{i}.jpg', file_type='image',
+                                         status='failed' if i % 3 == 0 else 'completed',
+                                         created_at=start + timedelta(seconds=i // 2)) for i in range(25))
+        db.session.commit()
+
+        for status, expected in ((None, 25), ('failed', 9)):
+            seen, cursor = [], None
+            while True:
+                jobs, cursor = get_jobs_page(4, cursor=cursor, status=status)
+                seen += [(job.created_at, job.id) for job in jobs]
+                if cursor is None:
+                    break
+            assert len(seen) == expected and seen == sorted(seen, reverse=True)
+        try:
+            get_jobs_page(4, cursor='not-a-cursor')
+            raise AssertionError("malformed cursor accepted")
+        except ValueError:
+            pass
+    print("✅ Pages cover every job once, newest first")
+
+def test_streaming_export():
+    """Test the streaming NDJSON, gzip and (with pyarrow) Parquet database export"""
+    print("📦 Testing streaming export...")
+    import gzip
+    import io
+    import json
+    from flask import Flask
+    from data_export import columnar_available, stream_export
+    from database import save_detections, save_track_chunk
+    from models import db, ProcessingJob
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        job = ProcessingJob(filename='export.jpg', file_type='image', status='completed')
+        db.session.add(job)
+        db.session.commit()
+        save_detections(job.id, [{'class_name': 'car', 'confidence': 0.9,
+                                  'bbox': {'x1': 1.0, 'y1': 2.0, 'x2': 3.0, 'y2': 4.0}}] * 25)
+        boxes = [(frame, 1, 'car', 0.0, 0.0, 10.0, 10.0) for frame in range(12)]
+        save_track_chunk(job.id, {'frames': 12, 'boxes': boxes, 'crossings': [(5, 1, 'car', 'down')]})
+        db.session.commit()
+
+        # Small batches so the detections span several chunks
+        chunks = list(stream_export(db.session, 'ndjson', batch_size=10))
+        lines = b''.join(chunks).decode().splitlines()
+        records = [json.loads(line) for line in lines[1:]]
+        assert json.loads(lines[0])['tables'][0] == 'processing_jobs'
+        assert sum(record['table'] == 'detections' for record in records) == 25 and len(chunks) >= 4
+        # Tracking rows are exported with their job ids
+        track_boxes = [record['record'] for record in records if record['table'] == 'track_boxes']
+        assert len(track_boxes) == 12 and {box['job_id'] for box in track_boxes} == {job.id}
+        assert [record['record']['direction'] for record in records
+                if record['table'] == 'line_crossings'] == ['down']
+        compressed = gzip.decompress(b''.join(stream_export(db.session, 'ndjson.gz', batch_size=10)))
+        assert compressed.decode().splitlines()[1:] == lines[1:]
+
+        for bad in ({'export_format': 'xml'}, {'export_format': 'ndjson', 'table': 'users'},
+                    {'export_format': 'parquet'}):
+            try:
+                stream_export(db.session, **bad)
+                raise AssertionError(f"accepted {bad}")
+            except ValueError:
+                pass
+        if columnar_available():
+            import pyarrow.parquet as pq
+            data = b''.join(stream_export(db.session, 'parquet', 'detections', batch_size=10))
+            assert pq.read_table(io.BytesIO(data)).num_rows == 25
+            data = b''.join(stream_export(db.session, 'parquet', 'track_boxes', batch_size=5))
+            assert pq.read_table(io.BytesIO(data)).column('frame_index').to_pylist() == list(range(12))
+        else:
+            try:
+                stream_export(db.session, 'parquet', 'detections')
+                raise AssertionError("parquet export without pyarrow")
+            except ImportError:
+                print("⚠️ pyarrow not installed, skipping Parquet output")
+    print("✅ Export streams in batches and round-trips")
+
 def test_flask_app():
     """Test if Flask app starts without errors"""
     print("🌐 Testing Flask app import...")
@@ -75,12 +945,44 @@ def test_flask_app():
         print(f"❌ Flask app import failed: {e}")
         return False
 
+def run_test(test_func):
+    """Run one test for the script runner: assert-style tests pass unless they raise"""
+    try:
+        result = test_func()
+    except Exception as e:
+        print(f"❌ {test_func.__name__} failed: {type(e).__name__}: {e}")
+        return False
+    return result is None or result
+
 def main():
     print("🚀 Starting Object Detection App Tests\n")
     
     tests = [
         ("Model Loading", test_model_loading),
         ("Prediction Function", test_prediction),
+        ("Tracker Matching", test_tracker_matching),
+        ("Batched Kalman Filter", test_batched_kalman),
+        ("Detection Stride", test_detection_stride),
+        ("Frame Pipeline", test_frame_pipeline),
+        ("Job Queue Events", test_job_events),
+        ("Result Cache", test_result_cache),
+        ("Result Cache Keys", test_result_cache_keys),
+        ("Hosted Stub", test_hosted_stub),
+        ("Hosted Resilience", test_hosted_resilience),
+        ("Hosted Downscaling", test_hosted_downscale),
+        ("Annotation Rendering", test_rendering),
+        ("Output Encoding", test_output_encoding),
+        ("Range Requests", test_range_requests),
+        ("Streaming Video Output", test_streaming_output),
+        ("Bulk Detection Storage", test_bulk_detections),
+        ("Tracking Persistence", test_track_persistence),
+        ("Video Worker Reaping", test_worker_reaping),
+        ("Worker Import of app.py", test_worker_main_import),
+        ("Incremental Statistics", test_stat_counters),
+        ("Response Cache", test_response_cache),
+        ("Database Profile", test_database_profile),
+        ("Job Pagination", test_job_pagination),
+        ("Streaming Export", test_streaming_export),
         ("Flask App Import", test_flask_app)
     ]
     
@@ -89,7 +991,7 @@ def main():
         print(f"\n{'='*50}")
         print(f"Running: {test_name}")
         print('='*50)
-        result = test_func()
+        result = run_test(test_func)
         results.append((test_name, result))
     
     print(f"\n{'='*50}")
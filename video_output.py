@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Streamable video output for tracking jobs
+cv2.VideoWriter only produces a playable MP4 once the whole file is finalised.
+FFmpegVideoWriter pipes raw frames to an ffmpeg subprocess instead, writing
+either one fragmented MP4 ('fmp4') or an HLS playlist of fMP4 segments ('hls')
+as frames arrive, so playback can begin while tracking is still running.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+# 'mp4' is the classic cv2.VideoWriter output; the others need ffmpeg
+VIDEO_OUTPUT_MODES = ('mp4', 'fmp4', 'hls')
+# Seconds per HLS segment; also the keyframe interval, so fragments start on keyframes
+SEGMENT_SECONDS = 2
+HLS_PLAYLIST = 'index.m3u8'
+
+
+def find_ffmpeg():
+    """Path of the ffmpeg binary: FFMPEG_BINARY, then PATH, then imageio-ffmpeg if installed"""
+    binary = os.environ.get('FFMPEG_BINARY') or shutil.which('ffmpeg')
+    if binary:
+        return binary
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+def video_output_name(stem, mode):
+    """Output filename, relative to the outputs folder, for a tracked video"""
+    if mode == 'hls':
+        # Playlist and segments live together in one directory per video
+        return f'{stem}/{HLS_PLAYLIST}'
+    return f'{stem}.mp4'
+
+
+class FFmpegVideoWriter:
+    """Drop-in for cv2.VideoWriter (write/release/isOpened) that encodes H.264 with ffmpeg.
+
+    mode='fmp4' writes a fragmented MP4 whose fragments are usable as soon as
+    they are flushed; mode='hls' writes `output_path` as an HLS event playlist
+    plus init.mp4 and seg_*.m4s next to it, appending a segment every
+    `segment_seconds`.
+    """
+
+    def __init__(self, output_path, fps, frame_size, mode='hls', segment_seconds=SEGMENT_SECONDS,
+                 crf=23, preset='veryfast', ffmpeg=None):
+        if mode not in ('fmp4', 'hls'):
+            raise ValueError(f"Unknown streaming output mode '{mode}', expected 'fmp4' or 'hls'")
+        ffmpeg = ffmpeg or find_ffmpeg()
+        if ffmpeg is None:
+            raise RuntimeError("Streaming video output needs ffmpeg: install it or set FFMPEG_BINARY")
+        self.output_path = output_path
+        self.frame_size = tuple(frame_size)
+        fps = fps or 30.0
+        gop = max(1, round(fps * segment_seconds))
+        width, height = self.frame_size
+
+        command = [
+            ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{fps}', '-i', '-',
+            '-an', '-c:v', 'libx264', '-preset', preset, '-crf', str(crf),
+            # yuv420p needs even dimensions
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p',
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+        ]
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if mode == 'fmp4':
+            command += ['-movflags', '+frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', output_path]
+        else:
+            command += [
+                '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_list_size', '0',
+                '-hls_playlist_type', 'event', '-hls_segment_type', 'fmp4',
+                '-hls_fmp4_init_filename', 'init.mp4',
+                '-hls_segment_filename', os.path.join(output_dir, 'seg_%05d.m4s'),
+                # Segments appear under their final name only once complete
+                '-hls_flags', 'independent_segments+temp_file',
+                output_path,
+            ]
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def isOpened(self):
+        return self._process.poll() is None
+
+    def write(self, frame):
+        """Queue one BGR frame (height x width x 3, uint8) for encoding"""
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            raise ValueError(f"Frame is {frame.shape[1]}x{frame.shape[0]}, writer expects "
+                             f"{self.frame_size[0]}x{self.frame_size[1]}")
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg exited early: {self._error_output()}")
+
+    def release(self):
+        """Flush the encoder and wait for ffmpeg; HLS playlists get their end tag here"""
+        if self._process.stdin.closed:
+            return
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        error = self._error_output()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {returncode}: {error}")
+
+    def _error_output(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors='replace').strip()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Persistent worker pool for video tracking
+Each worker process loads the YOLO model once and then serves tracking jobs
+from a shared queue, instead of starting a fresh interpreter per upload.
+"""
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between progress messages a worker sends for one job
+PROGRESS_INTERVAL = 0.5
+# Frames of per-track boxes and line crossings sent to the parent in one message
+TRACKS_CHUNK_FRAMES = 250
+# Seconds between checks for crashed workers, however busy the result queue is
+REAP_INTERVAL = 1.0
+# Value of a worker slot whose thread holds no job
+IDLE_SLOT = -1
+
+
+class VideoJobError(Exception):
+    """Raised when a tracking job fails inside a worker"""
+
+
+def _serve_jobs(job_queue, result_queue, slots, slot, model_path):
+    """Worker thread: load a model once, then run jobs until a None sentinel arrives.
+
+    slots[slot] holds the key of the job the thread is running, so the parent
+    can fail it if the process dies before reporting back.
+    """
+    from ultralytics import YOLO
+    import run_tracking
+
+    # Ultralytics predictors are not thread safe, so every worker thread owns its model
+    model = YOLO(model_path)
+    # Same table the overlay is drawn with, so stored tracks match the rendered video
+    names = run_tracking.class_names(model)
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        slots[slot] = job[0]
+        job_key, input_path, output_path, record_tracks, options = job
+        last_sent = 0.0
+        chunk = {'frames': 0, 'boxes': [], 'crossings': []}
+
+        def report_progress(progress):
+            nonlocal last_sent
+            now = time.monotonic()
+            finished = 0 < progress['total_frames'] <= progress['frames_done']
+            if finished or now - last_sent >= PROGRESS_INTERVAL:
+                last_sent = now
+                result_queue.put((job_key, 'progress', progress))
+
+        def send_tracks():
+            nonlocal chunk
+            if chunk['frames']:
+                result_queue.put((job_key, 'tracks', chunk))
+            chunk = {'frames': 0, 'boxes': [], 'crossings': []}
+
+        def record_frame(frame_index, tracked, crossings):
+            # Plain tuples keep the pickled chunks small:
+            # boxes (frame, track_id, class_name, x1, y1, x2, y2), crossings (frame, track_id, class_name, direction)
+            chunk['boxes'].extend((frame_index, int(track_id), names.get(int(cls_id), 'unknown'), x1, y1, x2, y2)
+                                  for x1, y1, x2, y2, track_id, cls_id in tracked)
+            chunk['crossings'].extend((frame_index, int(track_id), names.get(int(cls_id), 'unknown'), direction)
+                                      for track_id, cls_id, direction in crossings)
+            chunk['frames'] += 1
+            if chunk['frames'] >= TRACKS_CHUNK_FRAMES:
+                send_tracks()
+
+        try:
+            result = run_tracking.main(input_path, output_path, model=model,
+                                       progress_callback=report_progress,
+                                       frame_callback=record_frame if record_tracks else None, **options)
+            if result is None:
+                raise VideoJobError(f"Could not open video file {input_path}")
+            send_tracks()
+            result_queue.put((job_key, 'done', result))
+        except Exception as e:
+            result_queue.put((job_key, 'error', f"{e}\n{traceback.format_exc()}"))
+        slots[slot] = IDLE_SLOT
+
+
+def _worker_main(job_queue, result_queue, slots, model_path):
+    """Worker process entry point: run one job thread per slot, all sharing the process"""
+    threads = [
+        threading.Thread(target=_serve_jobs, args=(job_queue, result_queue, slots, slot, model_path), daemon=True)
+        for slot in range(len(slots))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class VideoWorkerPool:
+    """Pool of long-lived tracking processes fed from one job queue.
+
+    `num_workers` processes each run `concurrency` job threads. Models are
+    loaded when a worker starts, so the per-upload cost is only the tracking
+    itself. submit() returns a concurrent.futures.Future that resolves to the
+    run_tracking.main() summary or raises VideoJobError; an optional `progress`
+    callback receives throttled progress dicts on the pool's listener thread.
+    An optional `tracks` callback receives the per-frame boxes and line
+    crossings in chunks of TRACKS_CHUNK_FRAMES frames, all before the Future
+    resolves.
+    """
+
+    def __init__(self, num_workers=1, concurrency=1, model_path="yolov8s.pt"):
+        if num_workers < 1 or concurrency < 1:
+            raise ValueError("num_workers and concurrency must both be at least 1")
+        self.num_workers = num_workers
+        self.concurrency = concurrency
+        self.model_path = model_path
+        # Spawn rather than fork: the parent is a threaded Flask process holding torch state
+        self._ctx = multiprocessing.get_context('spawn')
+        self._job_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._processes = []
+        # process -> shared array of the job key each of its threads is running
+        self._slots = {}
+        self._futures = {}
+        # job_key -> {'progress': callback, 'tracks': callback}
+        self._callbacks = {}
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._stopping = False
+        self._closed = False
+
+    def start(self):
+        for _ in range(self.num_workers):
+            self._spawn_worker()
+        self._listener = threading.Thread(target=self._listen, name='video-pool-listener', daemon=True)
+        self._listener.start()
+        return self
+
+    def _spawn_worker(self):
+        slots = self._ctx.Array('q', [IDLE_SLOT] * self.concurrency, lock=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self._job_queue, self._result_queue, slots, self.model_path),
+            daemon=True,
+        )
+        process.start()
+        self._processes.append(process)
+        self._slots[process] = slots
+
+    def submit(self, input_path, output_path, progress=None, tracks=None, **options):
+        """Queue a tracking job; `options` are passed through to run_tracking.main"""
+        if self._stopping:
+            raise RuntimeError("VideoWorkerPool has been shut down")
+        future = Future()
+        job_key = next(self._job_ids)
+        with self._lock:
+            self._futures[job_key] = future
+            self._callbacks[job_key] = {'progress': progress, 'tracks': tracks}
+        self._job_queue.put((job_key, input_path, output_path, tracks is not None, options))
+        return future
+
+    def is_running(self):
+        """Whether the listener thread that resolves submitted futures is still alive"""
+        return self._listener is not None and self._listener.is_alive() and not self._closed
+
+    def _listen(self):
+        next_reap = time.monotonic() + REAP_INTERVAL
+        while not self._closed:
+            try:
+                message = self._result_queue.get(timeout=max(0.0, next_reap - time.monotonic()))
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError):
+                break
+            if message is not None:
+                self._handle_message(*message)
+            if time.monotonic() >= next_reap:
+                self._reap_dead_workers()
+                next_reap = time.monotonic() + REAP_INTERVAL
+
+    def _handle_message(self, job_key, kind, payload):
+        with self._lock:
+            if kind in ('progress', 'tracks'):
+                callback = self._callbacks.get(job_key, {}).get(kind)
+                future = None
+            else:
+                future = self._futures.pop(job_key, None)
+                self._callbacks.pop(job_key, None)
+        if kind in ('progress', 'tracks'):
+            if callback is not None:
+                try:
+                    callback(payload)
+                except Exception as e:
+                    logger.error(f"❌ {kind.capitalize()} callback failed for video job {job_key}: {e}")
+            return
+        if future is None:
+            return
+        if kind == 'done':
+            future.set_result(payload)
+        else:
+            future.set_exception(VideoJobError(payload))
+
+    def _reap_dead_workers(self):
+        """Fail the jobs of crashed workers and replace the processes"""
+        dead = [process for process in self._processes if not process.is_alive()]
+        if not dead or self._stopping:
+            return
+        # Results the workers sent before dying settle their jobs normally
+        while True:
+            try:
+                message = self._result_queue.get_nowait()
+            except (queue.Empty, EOFError, OSError):
+                break
+            self._handle_message(*message)
+        for process in dead:
+            self._processes.remove(process)
+            lost = [key for key in self._slots.pop(process) if key != IDLE_SLOT]
+            with self._lock:
+                futures = [self._futures.pop(key, None) for key in lost]
+                for key in lost:
+                    self._callbacks.pop(key, None)
+            for future in futures:
+                if future is not None:
+                    future.set_exception(VideoJobError(
+                        f"Video worker {process.pid} exited with code {process.exitcode}"))
+            self._spawn_worker()
+
+    def shutdown(self, wait=True):
+        if self._stopping:
+            return
+        self._stopping = True
+        for _ in range(self.num_workers * self.concurrency):
+            self._job_queue.put(None)
+        if wait:
+            for process in self._processes:
+                process.join()
+        self._closed = True
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.cancel()